@@ -0,0 +1,92 @@
+import asyncio
+
+from artnet_packet_common import ARTNET_ID
+from helpers import DEST_PORT
+
+
+class ArtNetProtocol(asyncio.DatagramProtocol):
+    """Datagram protocol that routes each reply to the request waiting on it.
+
+    Pending requests are keyed by (source IP, reply opcode), so a stray
+    datagram from another node or with another opcode (an ArtDmx echo, someone
+    else's PollReply) is counted as unmatched instead of being taken as the
+    response.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.unmatched = 0
+        self._pending = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if len(data) < 10 or data[:8] != ARTNET_ID:
+            self.unmatched += 1
+            return
+        opcode = data[8] | (data[9] << 8)  # opcode is low byte first
+        future = self._pending.pop((addr[0], opcode), None)
+        if future is None or future.done():
+            self.unmatched += 1
+            return
+        future.set_result(data)
+
+    def error_received(self, exc):
+        # ICMP errors (e.g. port unreachable) for one node shouldn't fail the others; they just time out
+        pass
+
+    def expect(self, ip, opcode):
+        future = asyncio.get_running_loop().create_future()
+        self._pending[(ip, opcode)] = future
+        return future
+
+    def cancel_pending(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+
+
+async def request_all(sock,
+                      packet,
+                      target_ips,
+                      reply_opcode=None,
+                      timeout=2.0):
+    """Send packet to every IP in target_ips at once and await all replies under one deadline.
+    Returns {ip: raw reply bytes or None on timeout}; with reply_opcode None nothing is awaited."""
+    loop = asyncio.get_running_loop()
+    # Work on a dup so closing the transport leaves the caller's socket open
+    transport, protocol = await loop.create_datagram_endpoint(ArtNetProtocol,
+                                                              sock=sock.dup())
+    try:
+        futures = {}
+        if reply_opcode is not None:
+            futures = {
+                ip: protocol.expect(ip, reply_opcode)
+                for ip in target_ips
+            }
+
+        packet_bytes = packet.pack()
+        for ip in target_ips:
+            transport.sendto(packet_bytes, (ip, DEST_PORT))
+
+        if futures:
+            await asyncio.wait(futures.values(), timeout=timeout)
+        responses = {}
+        for ip, future in futures.items():
+            done = future.done() and not future.cancelled()
+            responses[ip] = future.result() if done else None
+        return responses
+    finally:
+        protocol.cancel_pending()
+        transport.close()
+
+
+def send_packet_to_all(packet,
+                       sock,
+                       target_ips,
+                       reply_opcode=None,
+                       timeout=2.0):
+    """Blocking wrapper around request_all() for the synchronous menu code."""
+    return asyncio.run(
+        request_all(sock, packet, target_ips, reply_opcode, timeout))
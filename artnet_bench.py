@@ -0,0 +1,354 @@
+import argparse
+import json
+import platform
+import socket
+import sys
+import time
+import timeit
+
+import helpers
+from artnet_dispatch import ArtNetDispatcher
+from artnet_node_farm import VirtualNode
+from artnet_packet_common import OP_DMX
+from artnet_packet_rx import ArtPollReplyPacket, ArtIpProgReplyPacket, discovery_fields
+from artnet_packet_tx import ArtPollPacket, ArtCommandPacket, ArtDmxPacket, ArtSyncPacket
+from batch_send import BatchSender
+from dmx_stream import DmxFrame, DmxStreamer
+from output_stage import OutputTransform
+
+RESULTS_VERSION = 1
+DEFAULT_THRESHOLD = 0.10  # fractional slowdown against the baseline that counts as a regression
+FRAME_UNIVERSES = 64
+FRAME_TARGETS = 4
+DISCOVERY_REPLIES = 1000
+LOOPBACK_IP = "127.0.0.1"
+SINK_RCVBUF = 4 * 1024 * 1024
+
+# (name, group, unit, setup); setup(env) returns (callable, items handled per call)
+BENCHMARKS = []
+
+
+def benchmark(name, group, unit="packets"):
+
+    def register(setup):
+        BENCHMARKS.append((name, group, unit, setup))
+        return setup
+
+    return register
+
+
+@benchmark("poll_pack", "encode")
+def _poll_pack(env):
+    packet = ArtPollPacket()
+    return packet.pack, 1
+
+
+@benchmark("command_pack", "encode")
+def _command_pack(env):
+    packet = ArtCommandPacket("SwoutText=Playback&")
+    return packet.pack, 1
+
+
+@benchmark("sync_pack", "encode")
+def _sync_pack(env):
+    packet = ArtSyncPacket()
+    return packet.pack, 1
+
+
+@benchmark("dmx_construct", "encode")
+def _dmx_construct(env):
+    data = bytes(range(256)) * 2
+    return lambda: ArtDmxPacket(1, data), 1
+
+
+@benchmark("dmx_update", "encode")
+def _dmx_update(env):
+    # The streaming path: new data and sequence into a reused packet
+    packet = ArtDmxPacket(1)
+    data = bytes(range(256)) * 2
+
+    def update():
+        packet.set_data(data)
+        packet.sequence = 1
+        return packet.pack()
+
+    return update, 1
+
+
+@benchmark("poll_reply_discovery", "decode")
+def _poll_reply_discovery(env):
+    raw = env['poll_reply']
+
+    def decode():
+        reply = ArtPollReplyPacket(raw)
+        return reply.ip_addr, reply.port_name, reply.long_name
+
+    return decode, 1
+
+
+@benchmark("poll_reply_full", "decode")
+def _poll_reply_full(env):
+    raw = env['poll_reply']
+
+    def decode():
+        reply = ArtPollReplyPacket(raw)
+        return (reply.ip_addr, reply.port_name, reply.long_name,
+                reply.node_report, reply.sw_out, reply.mac,
+                reply.default_response_uid, reply.refresh_rate)
+
+    return decode, 1
+
+
+@benchmark("discovery_fields", "decode")
+def _discovery_fields(env):
+    replies = [
+        VirtualNode(f"10.0.{i // 250}.{i % 250 + 1}").poll_replies[0]
+        for i in range(DISCOVERY_REPLIES)
+    ]
+    return lambda: discovery_fields(replies), len(replies)
+
+
+@benchmark("ip_prog_reply", "decode")
+def _ip_prog_reply(env):
+    raw = VirtualNode("10.0.0.1").ip_prog_reply()
+    return lambda: ArtIpProgReplyPacket(raw), 1
+
+
+@benchmark("dispatch_dmx", "decode")
+def _dispatch_dmx(env):
+    dispatcher = ArtNetDispatcher()
+    dispatcher.register(OP_DMX, lambda fields, view, addr: fields)
+    raw = bytes(ArtDmxPacket(1, bytes(512)).pack())
+    addr = (LOOPBACK_IP, helpers.DEST_PORT)
+    return lambda: dispatcher.dispatch(raw, addr), 1
+
+
+@benchmark("frame_build", "frame")
+def _frame_build(env):
+    # One sequenced frame of FRAME_UNIVERSES universes to FRAME_TARGETS nodes, as DmxStreamer builds it
+    frame = DmxFrame(range(FRAME_UNIVERSES))
+    targets = [f"10.0.0.{i + 1}" for i in range(FRAME_TARGETS)]
+    streamer = DmxStreamer(env['sock'], targets, lambda i: frame.packets, 44)
+    return lambda: streamer.build_batch(frame.packets), len(
+        frame.packets) * len(targets)
+
+
+@benchmark("frame_output_stage", "frame")
+def _frame_output_stage(env):
+    frame = DmxFrame(range(FRAME_UNIVERSES))
+    transform = OutputTransform(gamma=2.2, master=0.8)
+    streamer = DmxStreamer(env['sock'], [LOOPBACK_IP], lambda i: frame.packets,
+                           44, transform)
+    return lambda: streamer.apply_transform(frame.packets), len(frame.packets)
+
+
+@benchmark("send_packet", "send")
+def _send_packet(env):
+    packet = ArtDmxPacket(1, bytes(512))
+    sock = env['sock']
+    return lambda: helpers.send_packet(packet, sock, LOOPBACK_IP, False), 1
+
+
+@benchmark("sendto_loop", "send")
+def _sendto_loop(env):
+    sender = BatchSender(env['sock'], use_sendmmsg=False)
+    batch = _loopback_batch()
+    return lambda: sender.send(batch), len(batch)
+
+
+@benchmark("batch_send", "send")
+def _batch_send(env):
+    sender = BatchSender(env['sock'], use_sendmmsg=True)
+    batch = _loopback_batch()
+    return lambda: sender.send(batch), len(batch)
+
+
+def _loopback_batch():
+    frame = DmxFrame(range(FRAME_UNIVERSES))
+    return [(packet.pack(), LOOPBACK_IP) for packet in frame.packets]
+
+
+def _open_loopback():
+    # Receiving socket on 6454 so sends don't turn into ICMP port unreachables; it's never read, the kernel
+    # just drops whatever overflows its buffer. The port may already be taken (e.g. by a node farm), which is fine
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SINK_RCVBUF)
+    try:
+        sink.bind((LOOPBACK_IP, helpers.DEST_PORT))
+    except OSError:
+        pass
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((LOOPBACK_IP, 0))
+    return sock, sink
+
+
+def run_benchmarks(select=None, repeat=5, min_time=0.2, on_result=None):
+    """Time every benchmark whose name or group contains one of the select substrings (all if None).
+
+    Each callable is run in a loop of timeit's autorange size (scaled up
+    to at least min_time seconds), repeat times, and the fastest loop is
+    kept, since slower runs only add scheduler noise. Returns a results
+    dict ready for save_results(); on_result(name, result) is called as
+    each benchmark finishes.
+    """
+    sock, sink = _open_loopback()
+    env = {
+        'sock': sock,
+        'poll_reply': VirtualNode("10.0.0.1", range(4)).poll_replies[0],
+    }
+    results = {}
+    try:
+        sendmmsg = BatchSender(sock, use_sendmmsg=True).use_sendmmsg
+        for name, group, unit, setup in BENCHMARKS:
+            if select and not any(s in name or s in group for s in select):
+                continue
+            fn, items = setup(env)
+            timer = timeit.Timer(fn)
+            number, elapsed = timer.autorange()
+            if elapsed < min_time:
+                number = max(number,
+                             int(number * min_time / max(elapsed, 1e-9)))
+            best = min(timer.repeat(repeat, number)) / number
+            result = {
+                'group': group,
+                'unit': unit,
+                'items_per_call': items,
+                'ns_per_call': best * 1e9,
+                'per_sec': items / best,
+            }
+            results[name] = result
+            if on_result is not None:
+                on_result(name, result)
+    finally:
+        sock.close()
+        sink.close()
+    return {
+        'version': RESULTS_VERSION,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'sendmmsg': sendmmsg,
+        'results': results,
+    }
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(
+            f"{path} is not a version {RESULTS_VERSION} benchmark results file"
+        )
+    return results
+
+
+def compare(current,
+            baseline,
+            threshold=DEFAULT_THRESHOLD,
+            include_missing=True):
+    """Compare two results dicts benchmark by benchmark on throughput.
+
+    Returns [{'name', 'baseline', 'current', 'change', 'status'}], change being
+    the fractional change in per_sec (+0.25 = 25% faster) and status one of
+    'regression' (slower by more than threshold), 'improved' (faster by more
+    than threshold), 'ok', 'new' (no baseline) or 'missing' (in the baseline but
+    not run now, only listed with include_missing).
+    """
+    rows = []
+    current_results = current['results']
+    baseline_results = baseline['results']
+    names = list(current_results)
+    if include_missing:
+        names += [n for n in baseline_results if n not in current_results]
+    for name in names:
+        cur = current_results.get(name)
+        base = baseline_results.get(name)
+        row = {
+            'name': name,
+            'baseline': base['per_sec'] if base else None,
+            'current': cur['per_sec'] if cur else None,
+            'change': None,
+        }
+        if base is None:
+            row['status'] = 'new'
+        elif cur is None:
+            row['status'] = 'missing'
+        else:
+            change = cur['per_sec'] / base['per_sec'] - 1.0
+            row['change'] = change
+            if change < -threshold:
+                row['status'] = 'regression'
+            elif change > threshold:
+                row['status'] = 'improved'
+            else:
+                row['status'] = 'ok'
+        rows.append(row)
+    return rows
+
+
+def print_result(name, result):
+    print(
+        f"  {name:<22} {result['per_sec']:>14,.0f} {result['unit']}/sec  "
+        f"({result['ns_per_call']:,.0f} ns per call of {result['items_per_call']})"
+    )
+
+
+def print_comparison(rows, threshold=DEFAULT_THRESHOLD):
+    print(f"Against baseline (threshold {threshold * 100:.0f}%):")
+    for row in rows:
+        base = f"{row['baseline']:,.0f}" if row['baseline'] is not None else "-"
+        cur = f"{row['current']:,.0f}" if row['current'] is not None else "-"
+        change = ""
+        if row['change'] is not None:
+            change = f"{row['change'] * 100:+.1f}%"
+        print(
+            f"  {row['name']:<22} {base:>14} -> {cur:>14} {change:>8}  {row['status']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=
+        "Micro-benchmarks for Art-Net packet encode/decode and send paths")
+    parser.add_argument(
+        "-k",
+        dest="select",
+        action="append",
+        help=
+        "only run benchmarks whose name or group contains this (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--save", metavar="PATH", help="write results as JSON")
+    parser.add_argument(
+        "--baseline",
+        metavar="PATH",
+        help="compare against saved results; exits 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, group, unit, _ in BENCHMARKS:
+            print(f"  {name:<22} {group:<8} {unit}")
+        sys.exit(0)
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    print(f"Python {platform.python_version()} on {platform.platform()}")
+    results = run_benchmarks(args.select, args.repeat, args.min_time,
+                             print_result)
+    if args.save:
+        save_results(results, args.save)
+        print(f"Saved results to {args.save}")
+    if baseline is not None:
+        # A -k run only covers part of the baseline; don't list the rest as missing
+        rows = compare(results, baseline, args.threshold, not args.select)
+        print_comparison(rows, args.threshold)
+        if any(row['status'] == 'regression' for row in rows):
+            sys.exit(1)
@@ -0,0 +1,643 @@
+import argparse
+import contextlib
+import json
+import sys
+from ipaddress import IPv4Address
+
+import helpers
+from artnet_packet_common import OP_POLL_REPLY, OP_IP_PROG_REPLY
+from artnet_packet_rx import ArtPollReplyPacket, ArtIpProgReplyPacket
+from artnet_packet_tx import ArtPollPacket, ArtProgIpPacket, ArtDmxPacket
+from node_cache import NodeCache, DEFAULT_CACHE_PATH
+from output_stage import OutputTransform
+
+MAX_UNIVERSE = 32767
+
+# Heavier modules (asyncio, ctypes, numpy) are imported by the subcommands that use them, so a scripted
+# scan or poll starts without them. The interactive terminal modules are never imported here.
+
+
+def parse_universes(spec):
+    """Parse a universe list like '0-1023,2000 2002-2005' into a sorted list of unique universes."""
+    universes = set()
+    for token in spec.replace(",", " ").split():
+        low, _, high = token.partition("-")
+        try:
+            first = int(low)
+            last = int(high) if high else first
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"not a universe or range: {token}")
+        if first > last or first < 0 or last > MAX_UNIVERSE:
+            raise argparse.ArgumentTypeError(
+                f"invalid universe range {token} (universes are 0-{MAX_UNIVERSE})"
+            )
+        universes.update(range(first, last + 1))
+    if not universes:
+        raise argparse.ArgumentTypeError("no universes given")
+    return sorted(universes)
+
+
+def parse_dmx_data(spec):
+    """Parse space- or comma-delimited DMX values (decimal or 0x hex), 1-512 of them."""
+    values = []
+    for token in spec.replace(",", " ").split():
+        try:
+            value = int(token, 0)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid value: {token}")
+        if value < 0 or value > 255:
+            raise argparse.ArgumentTypeError(
+                f"value {token} out of range (0-255)")
+        values.append(value)
+    if not 1 <= len(values) <= 512:
+        raise argparse.ArgumentTypeError(
+            f"must give 1-512 values, got {len(values)}")
+    return values
+
+
+def resolve_targets(tokens, cache_path):
+    """Expand target tokens into IPs: literal IPv4 addresses, 'discovered' for every node in the node
+    cache (as left by the last scan) and 'broadcast' for the bound subnet's broadcast address."""
+    targets = []
+    for token in tokens:
+        if token == "discovered":
+            cache = NodeCache(cache_path)
+            cache.load()
+            ips = [node['ip'] for node in cache.nodes()]
+            if not ips:
+                raise RuntimeError(
+                    f"No discovered nodes cached in {cache_path}; run scan first"
+                )
+        elif token == "broadcast":
+            ips = [helpers.bound_broadcast]
+        else:
+            try:
+                ips = [str(IPv4Address(token))]
+            except ValueError:
+                raise ValueError(
+                    f"Not an IPv4 address, 'discovered' or 'broadcast': {token}"
+                )
+        for ip in ips:
+            if ip not in targets:
+                targets.append(ip)
+    return targets
+
+
+def cmd_scan(args):
+    import artnet_scan
+
+    scan_kwargs = {'poll_count': args.polls, 'max_duration': args.max_duration}
+    if args.all_interfaces:
+        opened = helpers.open_all_interfaces()
+        targets = [(o['sock'], o['broadcast'], o['iface']) for o in opened]
+        socks = [o['sock'] for o in opened]
+    else:
+        sock = helpers.open_connection()
+        targets = [(sock, helpers.bound_broadcast, helpers.bound_iface)]
+        socks = [sock]
+    try:
+        done = None
+        for event in artnet_scan.scan_targets_events(targets, **scan_kwargs):
+            if event['event'] == 'done':
+                done = event
+    finally:
+        for sock in socks:
+            sock.close()
+
+    result = {key: value for key, value in done.items() if key != 'event'}
+    if not args.no_cache:
+        cache = NodeCache(args.cache)
+        cache.load()
+        result['cache'] = cache.update_all(done['nodes'])
+        cache.save()
+    return result
+
+
+def cmd_poll(args):
+    import artnet_async
+
+    sock = helpers.open_connection()
+    try:
+        responses = artnet_async.send_packet_to_all(ArtPollPacket(), sock,
+                                                    args.targets,
+                                                    OP_POLL_REPLY,
+                                                    args.timeout)
+    finally:
+        sock.close()
+    replies = []
+    for ip, raw in responses.items():
+        reply = {'target': ip, 'responded': raw is not None}
+        if raw is not None:
+            reply.update(poll_reply_fields(ArtPollReplyPacket(raw)))
+        replies.append(reply)
+    return _reply_result(replies)
+
+
+def cmd_ipprog(args):
+    import artnet_async
+
+    packet = ArtProgIpPacket()
+    if args.ip is not None:
+        packet.set_new_ip(args.ip)
+    if args.netmask is not None:
+        packet.set_new_subnet_mask(args.netmask)
+    if args.gateway is not None:
+        packet.set_new_gateway(args.gateway)
+    if args.port is not None:
+        packet.set_new_port(args.port)
+    if args.dhcp is not None:
+        packet.set_dhcp(args.dhcp)
+
+    sock = helpers.open_connection()
+    try:
+        responses = artnet_async.send_packet_to_all(packet, sock, args.targets,
+                                                    OP_IP_PROG_REPLY,
+                                                    args.timeout)
+    finally:
+        sock.close()
+    replies = []
+    for ip, raw in responses.items():
+        reply = {'target': ip, 'responded': raw is not None}
+        if raw is not None:
+            reply.update(ip_prog_reply_fields(ArtIpProgReplyPacket(raw)))
+        replies.append(reply)
+    result = _reply_result(replies)
+    result['command_byte'] = packet.command
+    return result
+
+
+def cmd_dmx_static(args):
+    data = args.data if args.data is not None else [args.value] * 512
+    packets = [ArtDmxPacket(universe, data) for universe in args.universes]
+    transform = _output_transform(args)
+    if args.duration is None:
+        # One-shot: a single frame, like the interactive menu
+        from batch_send import BatchSender
+
+        if not transform.is_identity():
+            for packet in packets:
+                transform.apply_packet(packet)
+        from universe_routing import dmx_messages
+
+        routes = _routing_table(args)
+        sock = helpers.open_connection()
+        try:
+            result = BatchSender(sock).send(
+                dmx_messages(packets, args.targets, routes,
+                             _broadcast_ip(args), args.broadcast_threshold))
+        finally:
+            sock.close()
+        result['universes'] = len(packets)
+        _add_routing(result, routes, args)
+        return result
+    if args.workers:
+        row = bytes(data).ljust(512, b"\x00")
+
+        def fill(store):
+            store.begin_write()
+            for universe in store.universes:
+                store.write(universe, row)
+            store.commit()
+            return None  # static: nothing to redraw per frame
+
+        return _stream_sharded(args, fill)
+    return _stream(args, lambda frame_index: packets, transform)
+
+
+def cmd_dmx_pattern(args):
+    try:
+        import dmx_patterns
+    except ImportError:
+        raise RuntimeError(
+            "Pattern streaming requires numpy (pip install numpy)")
+    if args.pattern not in dmx_patterns.PATTERNS:
+        raise ValueError(
+            f"Unknown pattern {args.pattern}, expected one of {', '.join(dmx_patterns.PATTERNS)}"
+        )
+    pattern = dmx_patterns.PATTERNS[args.pattern](
+        channels_per_pixel=args.channels)
+    if args.workers:
+        return _stream_sharded(
+            args, lambda store: dmx_patterns.pattern_producer(
+                pattern, store, args.rate))
+    render = dmx_patterns.pattern_render(pattern, args.universes, args.rate)
+    return _stream(args, render, _output_transform(args))
+
+
+def cmd_stream(args):
+    if args.show is not None:
+        return _play_show(args)
+    import dmx_stream
+
+    if args.cycle == "rgbw":
+        colors, stride, end = [("R", 0), ("G", 1), ("B", 2), ("W", 3)], 4, 512
+    else:
+        colors, stride, end = [("R", 0), ("G", 1), ("B", 2)], 3, 510
+    # One colour step per second, as in the interactive menu
+    frames_per_step = max(1, round(args.rate))
+    render = dmx_stream.color_cycle_render(args.universes, colors, stride, end,
+                                           frames_per_step)
+    return _stream(args, render, _output_transform(args))
+
+
+def _stream(args, render, transform):
+    import dmx_stream
+
+    sync_ip = helpers.bound_broadcast if args.sync else None
+    routes = _routing_table(args)
+    threshold = args.broadcast_threshold or 2
+    sock = helpers.open_connection()
+    streamer = dmx_stream.DmxStreamer(sock,
+                                      args.targets,
+                                      render,
+                                      args.rate,
+                                      transform,
+                                      send_on_change=args.send_on_change,
+                                      keepalive=args.keepalive,
+                                      sync_ip=sync_ip,
+                                      record_path=args.record,
+                                      routes=routes,
+                                      broadcast_ip=_broadcast_ip(args),
+                                      broadcast_threshold=threshold)
+    interrupted = False
+    try:
+        streamer.run(duration=args.duration)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        sock.close()
+    result = streamer.stats()
+    result['universes'] = len(args.universes)
+    result['interrupted'] = interrupted
+    _add_routing(result, routes, args)
+    return result
+
+
+def _routing_table(args):
+    # --route: who outputs what, as recorded in the node cache by the last scan
+    if not args.route:
+        return None
+    from universe_routing import RoutingTable
+
+    cache = NodeCache(args.cache)
+    cache.load()
+    routes = RoutingTable()
+    routes.update_nodes(cache.nodes())
+    if not routes.universes():
+        raise RuntimeError(
+            f"No node outputs cached in {args.cache}; run scan first")
+    return routes
+
+
+def _broadcast_ip(args):
+    if args.broadcast_threshold is None:
+        return None
+    if args.broadcast_threshold < 1:
+        raise ValueError(
+            f"--broadcast-threshold must be at least 1, got {args.broadcast_threshold}"
+        )
+    return helpers.bound_broadcast
+
+
+def _add_routing(result, routes, args):
+    broadcast_ip = _broadcast_ip(args)
+    if routes is not None or broadcast_ip is not None:
+        from universe_routing import plan_routes, route_summary
+
+        plans = plan_routes(args.universes, args.targets, routes, broadcast_ip,
+                            args.broadcast_threshold)
+        result['routing'] = route_summary(plans, args.targets, broadcast_ip)
+
+
+def cmd_serve_store(args):
+    # No producer here: whatever attaches to the store by name writes it
+    return _stream_sharded(args, None, args.name)
+
+
+def _stream_sharded(args, make_producer, name=None):
+    import sharded_sender
+    from frame_store import FrameStore
+
+    if args.sync or args.record or args.route or args.broadcast_threshold is not None:
+        raise ValueError(
+            "--sync, --record, --route and --broadcast-threshold aren't supported with --workers"
+        )
+    with FrameStore(args.universes, name) as store:
+        print(f"Frame store {store.name}: {len(store.universes)} universe(s)")
+        producer = make_producer(store) if make_producer is not None else None
+        sender = sharded_sender.ShardedSender(
+            store,
+            args.targets,
+            args.rate,
+            args.workers,
+            _output_transform(args),
+            send_on_change=args.send_on_change,
+            keepalive=args.keepalive)
+        try:
+            result = sender.run(producer, args.duration)
+        finally:
+            producer = None  # drop the producer's views of the store before it's closed
+    result['store'] = store.name
+    return result
+
+
+def _play_show(args):
+    import show_log
+
+    if args.route or args.broadcast_threshold is not None:
+        raise ValueError(
+            "--route and --broadcast-threshold aren't supported for show playback"
+        )
+    sock = helpers.open_connection()
+    interrupted = False
+    try:
+        with show_log.ShowPlayer(args.show) as player:
+            result = {
+                'show_records': player.record_count,
+                'show_duration': player.duration()
+            }
+            try:
+                result.update(
+                    player.play(sock,
+                                args.targets,
+                                args.start,
+                                args.speed,
+                                duration=args.duration))
+            except KeyboardInterrupt:
+                interrupted = True
+    finally:
+        sock.close()
+    result['interrupted'] = interrupted
+    return result
+
+
+def _output_transform(args):
+    return OutputTransform(args.channels, gamma=args.gamma, master=args.master)
+
+
+def _reply_result(replies):
+    responded = sum(1 for reply in replies if reply['responded'])
+    return {
+        'responded': responded,
+        'timed_out': len(replies) - responded,
+        'replies': replies
+    }
+
+
+def poll_reply_fields(reply):
+    """The fields of an ArtPollReplyPacket worth reporting, as a JSON-friendly dict."""
+    ports = min(reply.num_ports, 4)
+    return {
+        'ip': str(IPv4Address(reply.ip_addr)),
+        'port': reply.port_number,
+        'firmware': reply.vers_info,
+        'oem': reply.oem,
+        'esta_mfgr': reply.esta_mfgr,
+        'short_name': reply.port_name,
+        'long_name': reply.long_name,
+        'node_report': reply.node_report,
+        'ports': ports,
+        'port_types':
+        helpers.uint32_to_big_endian_bytes(reply.port_types)[:ports],
+        'outputs': reply.output_universes,
+        'mac': reply.mac,
+        'bind_ip': str(IPv4Address(reply.bind_ip)),
+        'bind_index': reply.bind_index,
+        'status_1': reply.status_1,
+        'status_2': reply.status_2,
+        'status_3': reply.status_3,
+        'style': reply.style,
+        'refresh_rate': reply.refresh_rate,
+    }
+
+
+def ip_prog_reply_fields(reply):
+    return {
+        'ip': str(IPv4Address(reply.ip_addr)),
+        'subnet_mask': str(IPv4Address(reply.subnet_mask)),
+        'gateway': str(IPv4Address(reply.gateway)),
+        'port': reply.port,
+        'dhcp': bool(reply.status & 0x40),
+        'status': reply.status,
+    }
+
+
+def print_text(result, indent=""):
+    for key, value in result.items():
+        if isinstance(value, dict):
+            print(f"{indent}{key}:")
+            print_text(value, indent + "  ")
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            print(f"{indent}{key}:")
+            for item in value:
+                fields = ", ".join(f"{k}={v}" for k, v in item.items())
+                print(f"{indent}  {fields}")
+        else:
+            print(f"{indent}{key}: {value}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description=
+        "Headless Art-Net tester: every subcommand prints its result as JSON (or text) and exits"
+    )
+    parser.add_argument(
+        "-i",
+        "--iface",
+        help=
+        "interface name or local IP to bind (default: highest priority non-loopback)"
+    )
+    parser.add_argument("--format", choices=("json", "text"), default="json")
+    parser.add_argument("--cache",
+                        default=DEFAULT_CACHE_PATH,
+                        help="node cache file used for 'discovered'")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser(
+        "scan", help="broadcast ArtPoll and list responding nodes")
+    scan.add_argument("--all-interfaces", action="store_true")
+    scan.add_argument("--polls", type=int, default=3)
+    scan.add_argument("--max-duration", type=float, default=5.0)
+    scan.add_argument("--no-cache",
+                      action="store_true",
+                      help="don't update the node cache")
+    scan.set_defaults(handler=cmd_scan)
+
+    poll = commands.add_parser(
+        "poll", help="unicast ArtPoll to targets and decode the replies")
+    _add_targets(poll)
+    poll.add_argument("--timeout", type=float, default=2.0)
+    poll.set_defaults(handler=cmd_poll)
+
+    ipprog = commands.add_parser(
+        "ipprog", help="send ArtIpProg (reads the config if nothing is set)")
+    _add_targets(ipprog)
+    ipprog.add_argument("--ip", type=IPv4Address)
+    ipprog.add_argument("--netmask", type=IPv4Address)
+    ipprog.add_argument("--gateway", type=IPv4Address)
+    ipprog.add_argument("--port", type=int)
+    ipprog.add_argument("--dhcp",
+                        dest="dhcp",
+                        action="store_true",
+                        default=None)
+    ipprog.add_argument("--static", dest="dhcp", action="store_false")
+    ipprog.add_argument("--timeout", type=float, default=2.0)
+    ipprog.set_defaults(handler=cmd_ipprog)
+
+    static = commands.add_parser(
+        "dmx-static",
+        help=
+        "send one frame of static DMX, or repeat it at --rate for --duration")
+    _add_targets(static)
+    _add_dmx_options(static)
+    _add_workers(static)
+    values = static.add_mutually_exclusive_group()
+    values.add_argument("--value",
+                        type=int,
+                        choices=range(256),
+                        metavar="0-255",
+                        default=0)
+    values.add_argument("--data",
+                        type=parse_dmx_data,
+                        help="explicit channel values, e.g. '255 0 0x80'")
+    static.set_defaults(handler=cmd_dmx_static)
+
+    pattern = commands.add_parser(
+        "dmx-pattern", help="stream a generated pattern (needs numpy)")
+    _add_targets(pattern)
+    _add_dmx_options(pattern)
+    _add_workers(pattern)
+    pattern.add_argument("--pattern",
+                         default="rainbow",
+                         help="chase, gradient, rainbow, strobe or noise")
+    pattern.set_defaults(handler=cmd_dmx_pattern)
+
+    stream = commands.add_parser(
+        "stream",
+        help="stream an RGB/RGBW colour cycle, or replay a show file")
+    _add_targets(stream)
+    _add_dmx_options(stream)
+    stream.add_argument("--cycle", choices=("rgb", "rgbw"), default="rgb")
+    stream.add_argument("--show",
+                        help="show file to replay instead of the colour cycle")
+    stream.add_argument("--start",
+                        type=float,
+                        default=0.0,
+                        help="show position to start from (s)")
+    stream.add_argument("--speed",
+                        type=float,
+                        default=1.0,
+                        help="show playback speed factor")
+    stream.set_defaults(handler=cmd_stream)
+
+    serve = commands.add_parser(
+        "serve-store",
+        help=
+        "create a named shared-memory frame store and send whatever other processes write into it"
+    )
+    _add_targets(serve)
+    _add_dmx_options(serve)
+    _add_workers(serve)
+    serve.add_argument("--name",
+                       default="artnet_frames",
+                       help="shared memory name producers attach to")
+    serve.set_defaults(handler=cmd_serve_store)
+    return parser
+
+
+def _add_targets(parser):
+    parser.add_argument("-t",
+                        "--targets",
+                        nargs="+",
+                        required=True,
+                        metavar="TARGET",
+                        help="IPs, 'discovered' (node cache) or 'broadcast'")
+
+
+def _add_dmx_options(parser):
+    parser.add_argument("-u",
+                        "--universes",
+                        type=parse_universes,
+                        default=[0],
+                        help="e.g. '0-1023' or '0,5,10-12'")
+    parser.add_argument("--rate",
+                        type=float,
+                        default=44.0,
+                        help="frames per second")
+    parser.add_argument("--duration",
+                        type=float,
+                        help="seconds to run (until ctrl+c if omitted)")
+    parser.add_argument("--channels",
+                        type=int,
+                        choices=(1, 3, 4),
+                        default=3,
+                        help="channels per pixel")
+    parser.add_argument("--master",
+                        type=float,
+                        default=1.0,
+                        help="master dimmer 0.0-1.0")
+    parser.add_argument("--gamma", type=float, default=1.0)
+    parser.add_argument("--send-on-change", action="store_true")
+    parser.add_argument("--keepalive", type=float, default=1.0)
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="ArtSync to the subnet broadcast after each frame")
+    parser.add_argument("--record",
+                        metavar="PATH",
+                        help="record what is sent to a show file")
+    parser.add_argument(
+        "--route",
+        action="store_true",
+        help=
+        "send each universe only to targets that output it (node cache, see scan)"
+    )
+    parser.add_argument(
+        "--broadcast-threshold",
+        type=int,
+        metavar="N",
+        help=
+        "send a universe once to the subnet broadcast instead when N or more targets on the subnet take it"
+    )
+
+
+def _add_workers(parser):
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help=
+        "send from this many processes via shared memory (0 = in this process)"
+    )
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        # Library code prints progress to stdout; keep stdout for the result alone
+        with contextlib.redirect_stdout(sys.stderr):
+            helpers.choose_interface(args.iface)
+            if hasattr(args, 'targets'):
+                args.targets = resolve_targets(args.targets, args.cache)
+            result = {
+                'command': args.command,
+                'iface': helpers.bound_iface,
+                'local_ip': helpers.bound_local_ip,
+            }
+            if hasattr(args, 'targets'):
+                result['targets'] = args.targets
+            # Under its own key, so nothing a subcommand returns can shadow the fields above
+            result['result'] = args.handler(args)
+    except (RuntimeError, OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    if args.format == "json":
+        print(json.dumps(result, indent=2))
+    else:
+        print_text(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
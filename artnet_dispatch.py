@@ -0,0 +1,66 @@
+import struct
+
+from artnet_packet_common import ARTNET_ID, OP_POLL, OP_POLL_REPLY, OP_DMX, OP_SYNC, OP_IP_PROG, OP_IP_PROG_REPLY, artnet_standard_packet_fmt
+from artnet_packet_tx import artnet_poll_packet_fmt, artnet_ipprog_packet_fmt, artnet_dmx_header_fmt
+from artnet_packet_rx import artnet_poll_reply_packet_fmt, artnet_ipprog_reply_packet_fmt
+
+# Precompiled decoders for the fixed part of each packet we understand, keyed by opcode. ArtDmx only decodes its
+# 18-byte header; the DMX data is left in the buffer for the handler to slice
+DECODERS = {
+    OP_POLL: struct.Struct(artnet_poll_packet_fmt),
+    OP_POLL_REPLY: struct.Struct(artnet_poll_reply_packet_fmt),
+    OP_DMX: struct.Struct(artnet_dmx_header_fmt),
+    OP_SYNC: struct.Struct(artnet_standard_packet_fmt + "2B"),
+    OP_IP_PROG: struct.Struct(artnet_ipprog_packet_fmt),
+    OP_IP_PROG_REPLY: struct.Struct(artnet_ipprog_reply_packet_fmt),
+}
+
+
+class ArtNetDispatcher:
+    """Routes received datagrams to per-opcode handlers without trial-parsing them.
+
+    The 8-byte Art-Net ID and the opcode are checked straight from a
+    memoryview; only datagrams whose opcode has a registered handler and which
+    are long enough for its decoder get unpacked. Everything else is dropped
+    and counted, which keeps a scan or monitor cheap on a port flooded with
+    ArtDmx.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+        self.counts = {}
+        self.not_artnet = 0
+        self.unknown = 0
+        self.short = 0
+
+    def register(self, opcode, handler, decoder=None):
+        """Call handler(fields, view, addr) for every valid packet with this opcode.
+        fields is decoder.unpack_from(view), decoder defaulting to DECODERS[opcode]."""
+        if decoder is None:
+            decoder = DECODERS[opcode]
+        self._handlers[opcode] = (decoder, handler)
+        self.counts.setdefault(opcode, 0)
+
+    def dispatch(self, data, addr):
+        """Decode and hand off one datagram. Returns the handler's result, or None if it was dropped."""
+        view = memoryview(data)
+        if len(view) < 10 or view[:8] != ARTNET_ID:
+            self.not_artnet += 1
+            return None
+
+        opcode = view[8] | (view[9] << 8)  # opcode is low byte first
+        entry = self._handlers.get(opcode)
+        if entry is None:
+            self.unknown += 1
+            return None
+
+        decoder, handler = entry
+        if len(view) < decoder.size:
+            self.short += 1
+            return None
+
+        self.counts[opcode] += 1
+        return handler(decoder.unpack_from(view), view, addr)
+
+    def dropped(self):
+        return self.not_artnet + self.unknown + self.short
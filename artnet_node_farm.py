@@ -0,0 +1,482 @@
+import argparse
+import asyncio
+import random
+import socket
+import struct
+import time
+from ipaddress import IPv4Address
+
+from artnet_dispatch import ArtNetDispatcher
+from artnet_packet_common import ARTNET_ID, OP_POLL, OP_POLL_REPLY, OP_DMX, OP_SYNC, OP_IP_PROG, OP_IP_PROG_REPLY
+from artnet_packet_rx import artnet_poll_reply_packet_fmt, artnet_ipprog_reply_packet_fmt
+from dmx_sequence import SequenceTracker
+from helpers import DEST_PORT, bswap16
+
+_poll_reply = struct.Struct(artnet_poll_reply_packet_fmt)
+_ip_prog_reply = struct.Struct(artnet_ipprog_reply_packet_fmt)
+
+PROTOCOL_VERSION = 14
+ESTA_PROTOTYPE = 0x7FF0  # ESTA code set aside for prototypes and test equipment
+PORT_TYPE_DMX_OUTPUT = 0x80
+GOOD_OUTPUT_TRANSMITTING = 0x80
+STATUS_2_15_BIT_ADDRESSES = 0x08
+IP_PROG_DHCP = 0x40  # ArtIpProgReply status bit
+
+# ArtIpProg command bits
+_PROG_ENABLE = 0x80
+_PROG_DHCP = 0x40
+_PROG_GATEWAY = 0x10
+_PROG_RESET = 0x08
+_PROG_IP = 0x04
+_PROG_SUBNET = 0x02
+_PROG_PORT = 0x01
+
+NODE_REPORT = "#0001 [0000] Emulated node"
+FD_HEADROOM = 64  # descriptors left for the rest of the process when raising the open file limit
+
+
+class VirtualNode:
+    """One emulated Art-Net node: its configuration, the ArtPollReplies it answers with and what it has received.
+
+    Output universes (15-bit port-addresses) are grouped four to a reply by
+    net/sub-net, each group with its own bind index, the way multi-port
+    Art-Net 4 nodes report themselves. The replies are packed once up front
+    so answering a poll is just sends. ArtIpProg updates the node's reported
+    network configuration but not the address its socket is bound to.
+    """
+
+    def __init__(self,
+                 ip,
+                 universes=(0, ),
+                 short_name=None,
+                 long_name=None,
+                 mac=None,
+                 subnet_mask="255.0.0.0",
+                 gateway="0.0.0.0"):
+        self.ip = str(ip)
+        self.universes = sorted(set(universes))
+        self.short_name = short_name if short_name is not None else f"Farm {self.ip}"
+        self.long_name = long_name if long_name is not None else f"Emulated Art-Net node {self.ip}"
+        # Locally administered MAC built from the IP, so every node's is unique and stable
+        ip_bytes = IPv4Address(self.ip).packed
+        self.mac = bytes(mac) if mac is not None else b"\x02\x00" + ip_bytes
+        self.default_config = {
+            'ip': int(IPv4Address(self.ip)),
+            'subnet_mask': int(IPv4Address(subnet_mask)),
+            'gateway': int(IPv4Address(gateway)),
+            'port': DEST_PORT,
+            'dhcp': False,
+        }
+        self.config = dict(self.default_config)
+        self.transport = None  # set while a NodeFarm is serving this node
+        self.poll_replies = self._build_poll_replies()
+        self.sequences = SequenceTracker()
+        self.universe_packets = dict.fromkeys(self.universes, 0)
+        self.counts = {
+            'polls': 0,
+            'poll_replies': 0,
+            'ip_progs': 0,
+            'dmx': 0,
+            'dmx_unpatched': 0,
+            'syncs': 0,
+        }
+
+    def _build_poll_replies(self):
+        groups = []
+        for universe in self.universes:
+            if groups and groups[-1][0] >> 4 == universe >> 4 and len(
+                    groups[-1]) < 4:
+                groups[-1].append(universe)
+            else:
+                groups.append([universe])
+        if not groups:
+            groups = [[]]  # a node with nothing patched still answers polls
+        return [
+            self._pack_poll_reply(bind_index, group)
+            for bind_index, group in enumerate(groups, start=1)
+        ]
+
+    def _pack_poll_reply(self, bind_index, universes):
+        ip = int(IPv4Address(self.ip))
+        net = universes[0] >> 8 if universes else 0
+        sub = (universes[0] >> 4) & 0x0F if universes else 0
+        ports = len(universes)
+        port_types = _port_bytes([PORT_TYPE_DMX_OUTPUT] * ports)
+        good_output = _port_bytes([GOOD_OUTPUT_TRANSMITTING] * ports)
+        sw_out = _port_bytes([u & 0x0F for u in universes])
+        return _poll_reply.pack(
+            ARTNET_ID,
+            bswap16(OP_POLL_REPLY),
+            ip,
+            bswap16(DEST_PORT),  # port is low byte first
+            1,  # firmware version
+            net,
+            sub,
+            0,  # OEM
+            0,  # UBEA version
+            0,  # status 1
+            bswap16(ESTA_PROTOTYPE),
+            _name_bytes(self.short_name, 18),
+            _name_bytes(self.long_name, 64),
+            _name_bytes(NODE_REPORT, 64),
+            ports,
+            port_types,
+            0,  # good input
+            good_output,
+            0,  # switch in
+            sw_out,
+            100,  # sACN priority
+            0,  # switch macro
+            0,  # switch remote
+            0,
+            0,
+            0,  # spare
+            0,  # style: StNode
+            *self.mac,
+            ip,  # bind IP
+            bind_index,
+            STATUS_2_15_BIT_ADDRESSES,
+            0,  # good output B
+            0,  # status 3
+            *bytes(6),  # default responder UID
+            0,  # user
+            44,  # refresh rate
+            *bytes(11))
+
+    def ip_prog_reply(self):
+        config = self.config
+        status = IP_PROG_DHCP if config['dhcp'] else 0
+        return _ip_prog_reply.pack(ARTNET_ID, bswap16(OP_IP_PROG_REPLY),
+                                   PROTOCOL_VERSION, 0, config['ip'],
+                                   config['subnet_mask'], config['port'],
+                                   status, 0, config['gateway'], 0)
+
+    def program(self, command, new_ip, subnet_mask, port, gateway):
+        """Apply an ArtIpProg command byte to the reported configuration."""
+        if not command & _PROG_ENABLE:
+            return
+        config = self.config
+        if command & _PROG_RESET:
+            config.update(self.default_config)
+        if command & _PROG_DHCP:
+            config['dhcp'] = True
+            return  # DHCP set means the address bits are ignored
+        if command & _PROG_IP:
+            config['ip'] = new_ip
+            config['dhcp'] = False
+        if command & _PROG_SUBNET:
+            config['subnet_mask'] = subnet_mask
+        if command & _PROG_GATEWAY:
+            config['gateway'] = gateway
+        if command & _PROG_PORT:
+            config['port'] = port
+
+    def receive_dmx(self, source, universe, sequence):
+        if universe not in self.universe_packets:
+            self.counts['dmx_unpatched'] += 1
+            return
+        self.counts['dmx'] += 1
+        self.universe_packets[universe] += 1
+        self.sequences.record(source, universe, sequence)
+
+
+class NodeFarm:
+    """Runs many VirtualNodes in one asyncio event loop, for load-testing discovery and DMX senders on one box.
+
+    Each node gets its own UDP socket bound to (node IP, port), so unicast
+    ArtPoll, ArtIpProg and ArtDmx reach exactly that node and its replies come
+    from its own address. Any 127.x.y.z works on Linux loopback with no setup;
+    otherwise add the addresses to a dummy interface. With broadcast=True one
+    more socket is bound to the wildcard address: a broadcast ArtPoll there
+    is answered by every node (each after a random 0 to reply_delay seconds,
+    as real nodes spread their replies), and broadcast ArtDmx is delivered to
+    every node patched to its universe. The open file limit is raised to fit
+    one socket per node where the hard limit allows.
+    """
+
+    def __init__(self, nodes, port=DEST_PORT, broadcast=True, reply_delay=0.0):
+        self.nodes = list(nodes)
+        self.port = port
+        self.broadcast = broadcast
+        self.reply_delay = reply_delay
+        self.universe_nodes = {}  # universe -> nodes patched to it
+        for node in self.nodes:
+            for universe in node.universes:
+                self.universe_nodes.setdefault(universe, []).append(node)
+        self.broadcasts = 0
+        self.dmx_rate = 0.0
+        self._rate_dmx = 0
+        self.start_time = None
+        self._transports = []
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        raise_open_file_limit(len(self.nodes) + 1 + FD_HEADROOM)
+        try:
+            for node in self.nodes:
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda node=node: _NodeProtocol(self, node),
+                    sock=_bind_socket(node.ip, self.port))
+                node.transport = transport
+                self._transports.append(transport)
+            if self.broadcast:
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _NodeProtocol(self, None),
+                    sock=_bind_socket("", self.port))
+                self._transports.append(transport)
+        except OSError:
+            self.close()
+            raise
+        self.start_time = time.monotonic()
+
+    def close(self):
+        for transport in self._transports:
+            transport.close()
+        self._transports.clear()
+        for node in self.nodes:
+            node.transport = None
+
+    async def run(self, duration=None, refresh=1.0, on_refresh=None):
+        """Start the farm and serve until duration seconds pass (forever if None) or the task is cancelled.
+        on_refresh(farm) is called every refresh seconds with rates updated. Returns totals()."""
+        await self.start()
+        try:
+            last_refresh = time.monotonic()
+            while True:
+                now = time.monotonic()
+                if duration is not None and now - self.start_time >= duration:
+                    break
+                wake_at = last_refresh + refresh
+                if duration is not None:
+                    wake_at = min(wake_at, self.start_time + duration)
+                await asyncio.sleep(max(0.0, wake_at - now))
+                now = time.monotonic()
+                if now - last_refresh >= refresh:
+                    self.update_rates(now - last_refresh)
+                    last_refresh = now
+                    if on_refresh is not None:
+                        on_refresh(self)
+        finally:
+            self.close()
+        return self.totals()
+
+    def answer_poll(self, node, addr, broadcast):
+        if broadcast and self.reply_delay > 0:
+            asyncio.get_running_loop().call_later(
+                random.uniform(0.0, self.reply_delay), self._send_poll_replies,
+                node, addr)
+        else:
+            self._send_poll_replies(node, addr)
+
+    def _send_poll_replies(self, node, addr):
+        if node.transport is None:
+            return  # farm closed while the reply was waiting
+        for reply in node.poll_replies:
+            node.transport.sendto(reply, addr)
+        node.counts['poll_replies'] += len(node.poll_replies)
+
+    def update_rates(self, elapsed):
+        if elapsed <= 0:
+            return
+        dmx = sum(node.counts['dmx'] for node in self.nodes)
+        self.dmx_rate = (dmx - self._rate_dmx) / elapsed
+        self._rate_dmx = dmx
+
+    def totals(self):
+        totals = dict.fromkeys(('polls', 'poll_replies', 'ip_progs', 'dmx',
+                                'dmx_unpatched', 'syncs'), 0)
+        sequence_totals = {'gaps': 0, 'missing': 0, 'out_of_order': 0}
+        for node in self.nodes:
+            for name, value in node.counts.items():
+                totals[name] += value
+            node_sequences = node.sequences.totals()
+            for name in sequence_totals:
+                sequence_totals[name] += node_sequences[name]
+        totals.update(sequence_totals)
+        totals['nodes'] = len(self.nodes)
+        totals['broadcasts'] = self.broadcasts
+        totals['elapsed'] = 0.0
+        if self.start_time is not None:
+            totals['elapsed'] = time.monotonic() - self.start_time
+        return totals
+
+
+class _NodeProtocol(asyncio.DatagramProtocol):
+    """Datagram endpoint for one VirtualNode, or for the farm's broadcast socket when node is None."""
+
+    def __init__(self, farm, node):
+        self.farm = farm
+        self.node = node
+        self.dispatcher = ArtNetDispatcher()
+        self.dispatcher.register(OP_POLL, self._on_poll)
+        self.dispatcher.register(OP_DMX, self._on_dmx)
+        self.dispatcher.register(OP_SYNC, self._on_sync)
+        if node is not None:
+            # ArtIpProg is always unicast
+            self.dispatcher.register(OP_IP_PROG, self._on_ip_prog)
+
+    def datagram_received(self, data, addr):
+        if self.node is None:
+            self.farm.broadcasts += 1
+        self.dispatcher.dispatch(data, addr)
+
+    def error_received(self, exc):
+        # ICMP errors for one controller address shouldn't take the node down
+        pass
+
+    def _on_poll(self, fields, view, addr):
+        broadcast = self.node is None
+        nodes = self.farm.nodes if broadcast else (self.node, )
+        for node in nodes:
+            node.counts['polls'] += 1
+            self.farm.answer_poll(node, addr, broadcast)
+
+    def _on_ip_prog(self, fields, view, addr):
+        command = fields[5]
+        new_ip, subnet_mask, port, gateway = fields[7:]
+        node = self.node
+        node.counts['ip_progs'] += 1
+        node.program(command, new_ip, subnet_mask, port, gateway)
+        node.transport.sendto(node.ip_prog_reply(), addr)
+
+    def _on_dmx(self, fields, view, addr):
+        _, _, _, sequence, _, sub_uni, net, _ = fields
+        universe = (net << 8) | sub_uni
+        if self.node is not None:
+            self.node.receive_dmx(addr[0], universe, sequence)
+            return
+        for node in self.farm.universe_nodes.get(universe, ()):
+            node.receive_dmx(addr[0], universe, sequence)
+
+    def _on_sync(self, fields, view, addr):
+        nodes = self.farm.nodes if self.node is None else (self.node, )
+        for node in nodes:
+            node.counts['syncs'] += 1
+
+
+def _bind_socket(ip, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind((ip, port))
+    except OSError as e:
+        sock.close()
+        raise OSError(
+            e.errno,
+            f"Can't bind virtual node to {ip or '*'}:{port}: {e.strerror}")
+    sock.setblocking(False)
+    return sock
+
+
+def _port_bytes(values):
+    # Four per-port bytes, port 1 first, as the big-endian uint32 the reply struct packs
+    padded = bytes(values) + bytes(4 - len(values))
+    return int.from_bytes(padded, "big")
+
+
+def _name_bytes(name, size):
+    # Null-terminated and truncated to fit the field
+    return name.encode("utf-8")[:size - 1]
+
+
+def raise_open_file_limit(needed):
+    """Raise the soft RLIMIT_NOFILE towards needed (capped at the hard limit). Returns the soft limit, None if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return soft
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError):
+        return soft
+    return target
+
+
+def farm_ips(count, first_ip="127.0.1.1"):
+    """count consecutive IPv4 addresses from first_ip, skipping any ending in .0 or .255."""
+    ips = []
+    ip = IPv4Address(first_ip)
+    while len(ips) < count:
+        if ip.packed[3] not in (0, 255):
+            ips.append(str(ip))
+        ip += 1
+    return ips
+
+
+def make_nodes(count,
+               first_ip="127.0.1.1",
+               universes_per_node=1,
+               first_universe=0,
+               shared_universes=False):
+    """Build count VirtualNodes. Each gets universes_per_node consecutive universes: the same ones on every node
+    if shared_universes (fan-out testing), otherwise the next block after the previous node's."""
+    nodes = []
+    for i, ip in enumerate(farm_ips(count, first_ip)):
+        start = first_universe
+        if not shared_universes:
+            start += i * universes_per_node
+        universes = [
+            u & 0x7FFF for u in range(start, start + universes_per_node)
+        ]
+        nodes.append(
+            VirtualNode(ip,
+                        universes,
+                        short_name=f"Farm {i + 1}",
+                        long_name=f"Emulated Art-Net node {i + 1} ({ip})"))
+    return nodes
+
+
+def print_farm_stats(farm):
+    totals = farm.totals()
+    print(
+        f"{totals['nodes']} node(s), {totals['elapsed']:.1f}s: {totals['polls']} poll(s) answered with "
+        f"{totals['poll_replies']} repl(ies), {totals['ip_progs']} ArtIpProg, {totals['syncs']} ArtSync"
+    )
+    print(
+        f"ArtDmx: {totals['dmx']} received ({farm.dmx_rate:.0f}/sec), {totals['dmx_unpatched']} unpatched, "
+        f"{totals['missing']} missing in {totals['gaps']} gap(s), {totals['out_of_order']} out of order"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run emulated Art-Net nodes on local addresses")
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--first-ip", default="127.0.1.1")
+    parser.add_argument("--universes",
+                        type=int,
+                        default=1,
+                        help="universes per node")
+    parser.add_argument("--first-universe", type=int, default=0)
+    parser.add_argument("--shared",
+                        action="store_true",
+                        help="patch every node to the same universes")
+    parser.add_argument("--port", type=int, default=DEST_PORT)
+    parser.add_argument("--no-broadcast", action="store_true")
+    parser.add_argument(
+        "--reply-delay",
+        type=float,
+        default=0.0,
+        help="max random delay before answering a broadcast poll (seconds)")
+    parser.add_argument("--duration", type=float, default=None)
+    parser.add_argument("--refresh", type=float, default=5.0)
+    args = parser.parse_args()
+
+    farm = NodeFarm(make_nodes(args.nodes, args.first_ip, args.universes,
+                               args.first_universe, args.shared),
+                    port=args.port,
+                    broadcast=not args.no_broadcast,
+                    reply_delay=args.reply_delay)
+    print(
+        f"Starting {args.nodes} node(s) from {args.first_ip} on port {args.port} (ctrl+c to stop)"
+    )
+    try:
+        asyncio.run(farm.run(args.duration, args.refresh, print_farm_stats))
+    except KeyboardInterrupt:
+        pass
+    print_farm_stats(farm)
@@ -4,6 +4,16 @@ import struct
 artnet_base_packet_fmt = "!8sH"
 artnet_standard_packet_fmt = artnet_base_packet_fmt + "H"
 
+# 8-byte packet ID every Art-Net packet starts with, and the opcodes we send or parse. Opcodes are the host values; they go over the wire low byte first
+ARTNET_ID = b"Art-Net\x00"
+OP_POLL = 0x2000
+OP_POLL_REPLY = 0x2100
+OP_COMMAND = 0x2400
+OP_DMX = 0x5000
+OP_SYNC = 0x5200
+OP_IP_PROG = 0xF800
+OP_IP_PROG_REPLY = 0xF900
+
 
 class BaseArtNetPacket(struct.Struct):
 
@@ -19,6 +29,13 @@ class BaseArtNetPacket(struct.Struct):
         return super().pack(id_bytes,
                             (opcode_low_byte << 8) | opcode_high_byte, *args)
 
+    def pack_into(self, buffer, offset, *args):
+        id_bytes = bytearray(self.id, "utf-8")
+        opcode_high_byte = (self.opcode & 0xFF00) >> 8
+        opcode_low_byte = (self.opcode & 0xFF)
+        super().pack_into(buffer, offset, id_bytes,
+                          (opcode_low_byte << 8) | opcode_high_byte, *args)
+
 
 class StandardArtNetPacket(BaseArtNetPacket):
 
@@ -28,3 +45,6 @@ class StandardArtNetPacket(BaseArtNetPacket):
 
     def pack(self, *args):
         return super().pack(self.protocol_version, *args)
+
+    def pack_into(self, buffer, offset, *args):
+        super().pack_into(buffer, offset, self.protocol_version, *args)
@@ -1,85 +1,137 @@
 import struct
 from ipaddress import ip_address, IPv4Address
 
-from helpers import bswap16, bswap32, uint32_to_big_endian_bytes
-from artnet_packet_common import BaseArtNetPacket, StandardArtNetPacket, artnet_base_packet_fmt, artnet_standard_packet_fmt
+from helpers import bswap16, bswap32, uint32_to_big_endian_bytes, decode_null_terminated
+from artnet_packet_common import StandardArtNetPacket, artnet_base_packet_fmt, artnet_standard_packet_fmt
 
 artnet_poll_reply_packet_fmt = artnet_base_packet_fmt + "I 2H 2B H 2B H 18s 64s 64s H 5I 13B I 2B I 7B 2H 11B"
+# Just the fields discovery needs: node IP (offset 10), short/port name (26), long name (44) and MAC (201)
+artnet_poll_reply_discovery_fmt = "!10xI12x18s64s93x6s"
+# Just the fields routing needs: node IP (10), NetSwitch/SubSwitch (18), NumPorts (172), SwOut (190), BindIndex (211)
+artnet_poll_reply_routing_fmt = "!10xI4x2B152xH16xI17xB"
 artnet_ipprog_reply_packet_fmt = artnet_standard_packet_fmt + "3I H 2B I H"
 
+_poll_reply_struct = struct.Struct(artnet_poll_reply_packet_fmt)
+_poll_reply_discovery_struct = struct.Struct(artnet_poll_reply_discovery_fmt)
+_poll_reply_routing_struct = struct.Struct(artnet_poll_reply_routing_fmt)
+_MAC_OFFSET = 201
+_UID_OFFSET = 218
 
-class ArtPollReplyPacket(BaseArtNetPacket):
 
-    def __init__(self, raw_bytes):
-        format_str = artnet_poll_reply_packet_fmt
+def _unpacked_field(idx, convert=None):
+    if convert is None:
+        return property(lambda self: self._unpacked()[idx])
+    return property(lambda self: convert(self._unpacked()[idx]))
 
-        super().__init__(format_str, 0x2100)
 
-        unpacked_data = None
-        try:
-            unpacked_data = super().unpack(raw_bytes)
-        except struct.error as e:
+def _cached_field(slot, compute):
+
+    def getter(self):
+        value = getattr(self, slot)
+        if value is None:
+            value = compute(self)
+            setattr(self, slot, value)
+        return value
+
+    return property(getter)
+
+
+class ArtPollReplyPacket:
+    """ArtPollReply that keeps the raw datagram and decodes fields on first access.
+
+    Discovery only ever reads ip_addr, port_name and long_name, so nothing is
+    unpacked at construction time: the precompiled struct runs once on the
+    first field access, and the strings, MAC and UID are formatted only when
+    asked for and then cached. Use discovery_fields() to pull just the
+    discovery fields out of many replies at once.
+    """
+
+    __slots__ = ("raw", "_fields", "_port_name", "_long_name", "_node_report",
+                 "_mac", "_default_response_uid")
+
+    opcode = 0x2100
+    size = _poll_reply_struct.size
+
+    def __init__(self, raw_bytes):
+        if isinstance(raw_bytes, memoryview):
+            # Likely a view into a reused receive buffer, so take our own copy
+            raw_bytes = raw_bytes.tobytes()
+        self.raw = raw_bytes
+        self._fields = None
+        self._port_name = None
+        self._long_name = None
+        self._node_report = None
+        self._mac = None
+        self._default_response_uid = None
+
+        if len(raw_bytes) != self.size:
             print(
                 f"Error unpacking struct, number of bytes in buffer ({len(raw_bytes)}) does not match expected unpack length ({self.size}!"
             )
-
-        # All of our struct subclasses have a big endian format string, so anything the artnet spec says is little endian in the packet (LSB first, i.e. port), must be flipped from what we parse it as here
-        if (unpacked_data):
-            # idx 0 and 1 are artnet header and opcode
-            self.ip_addr = unpacked_data[2]
-            self.port_number = bswap16(
-                unpacked_data[3])  # port is low byte first
-            self.vers_info = unpacked_data[4]
-            self.net_switch = unpacked_data[5]
-            self.sub_switch = unpacked_data[6]
-            self.oem = unpacked_data[7]
-            self.ubea_version = unpacked_data[8]
-            self.status_1 = unpacked_data[9]
-            self.esta_mfgr = bswap16(unpacked_data[10])
-            self.port_name = unpacked_data[11].rstrip(b'\x00').decode("utf-8")
-            self.long_name = unpacked_data[12].rstrip(b'\x00').decode("utf-8")
-            self.node_report = unpacked_data[13].rstrip(b'\x00').decode(
-                "utf-8")
-            self.num_ports = unpacked_data[14]
-            self.port_types = unpacked_data[15]
-            self.good_input = unpacked_data[16]
-            self.good_output = unpacked_data[17]
-            self.sw_in = unpacked_data[18]
-            self.sw_out = unpacked_data[19]
-            self.acn_priority = unpacked_data[20]
-            self.sw_macro = unpacked_data[21]
-            self.sw_remote = unpacked_data[22]
-            self.padding_1 = (unpacked_data[23] << 16) | (
-                unpacked_data[24] << 8) | (unpacked_data[25])
-            self.style = unpacked_data[26]
-            self.mac = ":".join(
-                str(b)[2:] for b in [
-                    hex(unpacked_data[27]),
-                    hex(unpacked_data[28]),
-                    hex(unpacked_data[29]),
-                    hex(unpacked_data[30]),
-                    hex(unpacked_data[31]),
-                    hex(unpacked_data[32])
-                ])
-            self.bind_ip = unpacked_data[33]
-            self.bind_index = unpacked_data[34]
-            self.status_2 = unpacked_data[35]
-            self.good_output_B = unpacked_data[36]
-            self.status_3 = unpacked_data[37]
-            self.default_response_uid = ":".join(
-                str(b)[2:] for b in [
-                    hex(unpacked_data[38]),
-                    hex(unpacked_data[39]),
-                    hex(unpacked_data[40]),
-                    hex(unpacked_data[41]),
-                    hex(unpacked_data[42]),
-                    hex(unpacked_data[43])
-                ])
-            self.user = unpacked_data[44]
-            self.refresh_rate = unpacked_data[45]
-        else:
             print("Returning empty ArtPollReplyPacket")
 
+    def _unpacked(self):
+        if self._fields is None:
+            if len(self.raw) != self.size:
+                raise AttributeError("Empty ArtPollReplyPacket")
+            self._fields = _poll_reply_struct.unpack(self.raw)
+        return self._fields
+
+    def _hex_field(self, offset):
+        self._unpacked()  # raises on an empty packet
+        return self.raw[offset:offset + 6].hex(":")
+
+    # All of our structs have a big endian format string, so anything the artnet spec says is little endian in the packet (LSB first, i.e. port), must be flipped from what we parse it as here
+    # idx 0 and 1 are artnet header and opcode
+    ip_addr = _unpacked_field(2)
+    port_number = _unpacked_field(3, bswap16)  # port is low byte first
+    vers_info = _unpacked_field(4)
+    net_switch = _unpacked_field(5)
+    sub_switch = _unpacked_field(6)
+    oem = _unpacked_field(7)
+    ubea_version = _unpacked_field(8)
+    status_1 = _unpacked_field(9)
+    esta_mfgr = _unpacked_field(10, bswap16)
+    port_name = _cached_field(
+        "_port_name",
+        lambda self: decode_null_terminated(self._unpacked()[11]))
+    long_name = _cached_field(
+        "_long_name",
+        lambda self: decode_null_terminated(self._unpacked()[12]))
+    node_report = _cached_field(
+        "_node_report",
+        lambda self: decode_null_terminated(self._unpacked()[13]))
+    num_ports = _unpacked_field(14)
+    port_types = _unpacked_field(15)
+    good_input = _unpacked_field(16)
+    good_output = _unpacked_field(17)
+    sw_in = _unpacked_field(18)
+    sw_out = _unpacked_field(19)
+    acn_priority = _unpacked_field(20)
+    sw_macro = _unpacked_field(21)
+    sw_remote = _unpacked_field(22)
+    style = _unpacked_field(26)
+    mac = _cached_field("_mac", lambda self: self._hex_field(_MAC_OFFSET))
+    bind_ip = _unpacked_field(33)
+    bind_index = _unpacked_field(34)
+    status_2 = _unpacked_field(35)
+    good_output_B = _unpacked_field(36)
+    status_3 = _unpacked_field(37)
+    default_response_uid = _cached_field(
+        "_default_response_uid", lambda self: self._hex_field(_UID_OFFSET))
+    user = _unpacked_field(44)
+    refresh_rate = _unpacked_field(45)
+
+    @property
+    def output_universes(self):
+        return port_universes(self.net_switch, self.sub_switch, self.num_ports,
+                              self.sw_out)
+
+    @property
+    def padding_1(self):
+        fields = self._unpacked()
+        return (fields[23] << 16) | (fields[24] << 8) | fields[25]
+
     def print_fields(self):
         print("ArtNetPollReply packet:")
         print(f'{"IP addr:":<20} {IPv4Address(self.ip_addr)}')
@@ -127,6 +179,45 @@ class ArtPollReplyPacket(BaseArtNetPacket):
         print(f'{"Refresh rate:":<20} {self.refresh_rate}')
 
 
+def discovery_fields(raw_replies):
+    """Pull (ip_addr, port_name, long_name, mac) out of many raw ArtPollReplies in one pass.
+    Replies are de-duplicated by node IP before any names are decoded, so a node that
+    answered every poll costs one decode. Wrong-length datagrams are skipped."""
+    size = _poll_reply_struct.size
+    unpack_from = _poll_reply_discovery_struct.unpack_from
+    names_by_ip = {}
+    for raw in raw_replies:
+        if len(raw) != size:
+            continue
+        ip_addr, port_name, long_name, mac = unpack_from(raw)
+        if ip_addr not in names_by_ip:
+            names_by_ip[ip_addr] = (port_name, long_name, mac)
+    return [(ip_addr, decode_null_terminated(port_name),
+             decode_null_terminated(long_name),
+             mac.hex(":") if any(mac) else '')
+            for ip_addr, (port_name, long_name, mac) in names_by_ip.items()]
+
+
+def port_universes(net_switch, sub_switch, num_ports, sw_out):
+    """15-bit universes of a reply's output ports: net (7 bits), sub-net (4) and each port's SwOut nibble."""
+    base = ((net_switch & 0x7F) << 8) | ((sub_switch & 0x0F) << 4)
+    ports = min(num_ports, 4)
+    return [
+        base | (port & 0x0F)
+        for port in uint32_to_big_endian_bytes(sw_out)[:ports]
+    ]
+
+
+def routing_fields(raw):
+    """(ip_addr, bind_index, output universes) of one raw ArtPollReply, or None if it's the wrong length."""
+    if len(raw) != _poll_reply_struct.size:
+        return None
+    fields = _poll_reply_routing_struct.unpack_from(raw)
+    ip_addr, net_switch, sub_switch, num_ports, sw_out, bind_index = fields
+    universes = port_universes(net_switch, sub_switch, num_ports, sw_out)
+    return ip_addr, bind_index, universes
+
+
 class ArtIpProgReplyPacket(StandardArtNetPacket):
 
     def __init__(self, raw_bytes):
@@ -6,7 +6,9 @@ from artnet_packet_common import artnet_standard_packet_fmt, StandardArtNetPacke
 artnet_poll_packet_fmt = artnet_standard_packet_fmt + "2B4H"
 artnet_ipprog_packet_fmt = artnet_standard_packet_fmt + "4B2IHI"
 artnet_command_packet_partial_fmt = artnet_standard_packet_fmt + "HH"  # partial format because # of trailing string format specifier depends on length of command string passed into constructor
-artnet_dmx_packet_fmt = artnet_standard_packet_fmt + "BBBBH512s"
+artnet_dmx_header_fmt = artnet_standard_packet_fmt + "BBBBH"
+artnet_dmx_packet_fmt = artnet_dmx_header_fmt + "512s"
+artnet_sync_packet_fmt = artnet_standard_packet_fmt + "2B"
 
 
 class ArtPollPacket(StandardArtNetPacket):
@@ -91,24 +93,123 @@ class ArtCommandPacket(StandardArtNetPacket):
                             bytes(self.command_string, "utf-8"))
 
 
+class ArtSyncPacket(StandardArtNetPacket):
+    """Tells nodes in synchronous mode to output the ArtDmx data they've buffered.
+    Send it once after every universe of a frame has gone out."""
+
+    def __init__(self):
+        format_str = artnet_sync_packet_fmt
+
+        self.aux1 = 0
+        self.aux2 = 0
+
+        super().__init__(format_str, 0x5200)
+
+    def pack(self):
+        return super().pack(self.aux1, self.aux2)
+
+
+_zero_data = memoryview(bytes(512))
+
+
 class ArtDmxPacket(StandardArtNetPacket):
+    """Reusable ArtDmx packet backed by a single preallocated bytearray.
+
+    The header is packed once with pack_into; after that the universe, sequence
+    and DMX values are updated in place and pack() hands back the same buffer,
+    so a streaming loop can resend one packet object forever without allocating.
+    data is a writable memoryview over the 512-slot DMX area of the buffer,
+    and payload a read-only one over the length field and DMX area together.
+    Pass buffer (a writable memoryview of exactly packet size) to place the
+    packet inside a larger shared allocation, as DmxFrame does; with
+    initialise=False the buffer must already hold an ArtDmx packet (e.g. a
+    frame_store slot) and is adopted as is, universe and data untouched.
+    """
+
+    # Byte offsets of the fields we update in place
+    SEQUENCE_OFFSET = 12
+    PHYSICAL_OFFSET = 13
+    SUB_UNI_OFFSET = 14
+    NET_OFFSET = 15
+    LENGTH_OFFSET = 16
+    DATA_OFFSET = 18
+
+    def __init__(self, universe, data_bytes=b"", buffer=None, initialise=True):
+        super().__init__(artnet_dmx_packet_fmt, 0x5000)
 
-    def __init__(self, universe, data_bytes):
+        self.buffer = bytearray(self.size) if buffer is None else buffer
+        view = memoryview(self.buffer)
+        self.data = view[self.DATA_OFFSET:]
+        self.payload = view.toreadonly()[self.LENGTH_OFFSET:]
+        if not initialise:
+            self._data_len = self.length
+            return
+        # sequence 0 disables sequence checking, physical 0, data area left zeroed
+        super().pack_into(self.buffer, 0, 0, 0, 0, 0, 0, b"")
+        self._data_len = 0
+
+        self.set_universe(universe)
+        self.set_data(data_bytes)
+
+    @property
+    def sequence(self):
+        return self.buffer[self.SEQUENCE_OFFSET]
+
+    @sequence.setter
+    def sequence(self, value):
+        self.buffer[self.SEQUENCE_OFFSET] = value
+
+    @property
+    def physical(self):
+        return self.buffer[self.PHYSICAL_OFFSET]
+
+    @physical.setter
+    def physical(self, value):
+        self.buffer[self.PHYSICAL_OFFSET] = value
+
+    @property
+    def sub_uni(self):
+        return self.buffer[self.SUB_UNI_OFFSET]
+
+    @property
+    def net(self):
+        return self.buffer[self.NET_OFFSET]
+
+    @property
+    def universe(self):
+        return (self.net << 8) | self.sub_uni
+
+    @property
+    def length(self):
+        return int.from_bytes(self.buffer[self.LENGTH_OFFSET:self.DATA_OFFSET],
+                              "big")
+
+    def set_universe(self, universe):
         # universe is a 15-bit value: low 8 bits -> sub_uni, high 7 bits -> net
-        self.sequence = 0  # 0 disables sequence checking
-        self.physical = 0
-        self.sub_uni = universe & 0xFF
-        self.net = (universe >> 8) & 0x7F
+        self.buffer[self.SUB_UNI_OFFSET] = universe & 0xFF
+        self.buffer[self.NET_OFFSET] = (universe >> 8) & 0x7F
+
+    def set_length(self, length):
         # length must be even and between 2-512
-        length = max(2, len(data_bytes))
+        length = max(2, length)
         if length % 2 != 0:
             length += 1
-        self.length = length
-        padded = list(data_bytes) + [0] * (512 - len(data_bytes))
-        self.data = bytes(padded)
-
-        super().__init__(artnet_dmx_packet_fmt, 0x5000)
+        self.buffer[self.LENGTH_OFFSET] = length >> 8
+        self.buffer[self.LENGTH_OFFSET + 1] = length & 0xFF
+
+    def set_data(self, data_bytes):
+        """Copy data_bytes (any bytes-like or list of ints, <= 512 long) into the DMX area,
+        zeroing whatever was left over from a longer previous payload."""
+        if not isinstance(data_bytes, (bytes, bytearray, memoryview)):
+            data_bytes = bytes(data_bytes)
+        new_len = len(data_bytes)
+        old_len = self._data_len
+        self.data[:new_len] = data_bytes
+        if old_len > new_len:
+            self.data[new_len:old_len] = _zero_data[new_len:old_len]
+        self._data_len = new_len
+        self.set_length(new_len)
 
     def pack(self):
-        return super().pack(self.sequence, self.physical, self.sub_uni,
-                            self.net, self.length, self.data)
+        # The buffer is live: callers must send it before the next in-place update
+        return self.buffer
@@ -0,0 +1,410 @@
+import socket
+import struct
+import time
+
+from artnet_dispatch import DECODERS
+from artnet_packet_common import OP_POLL_REPLY, OP_IP_PROG_REPLY
+from artnet_packet_rx import ArtPollReplyPacket, ArtIpProgReplyPacket, artnet_poll_reply_discovery_fmt
+from dmx_listen import DmxMonitor
+from helpers import DEST_PORT, decode_null_terminated
+
+READ_BUFFER_SIZE = 1024 * 1024
+INITIAL_RECORD_BUFFER = 65536  # grown on demand for captures with bigger snaplens
+
+_PCAP_MAGIC_US = 0xA1B2C3D4
+_PCAP_MAGIC_NS = 0xA1B23C4D
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# pcapng block types we read; everything else is skipped
+_BLOCK_IDB = 1
+_BLOCK_OPB = 2  # obsolete Packet Block
+_BLOCK_SPB = 3
+_BLOCK_EPB = 6
+
+# Link-layer header types we can find IPv4 in (see ipv4_offset)
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+# 12 and 14 are also raw IP on some platforms
+_RAW_IP_LINKTYPES = (LINKTYPE_RAW, LINKTYPE_IPV4, 12, 14)
+
+_ETHERTYPE_IPV4 = 0x0800
+_VLAN_ETHERTYPES = (0x8100, 0x88A8, 0x9100)
+_IPPROTO_UDP = 17
+_AF_INET = 2
+
+# Version/IHL, flags + fragment offset, protocol and source address; then UDP source port, destination port, length
+_ipv4_header = struct.Struct("!B5xHxB2xI4x")
+_udp_header = struct.Struct("!HHH")
+_poll_reply_discovery = struct.Struct(artnet_poll_reply_discovery_fmt)
+_ip_prog_reply_size = DECODERS[OP_IP_PROG_REPLY].size
+
+
+class CaptureFormatError(ValueError):
+    pass
+
+
+def read_capture(path):
+    """Yield (timestamp, linktype, frame) for every packet in a pcap or pcapng file, reading it sequentially.
+
+    frame is a memoryview into a reused buffer and is only valid until the
+    next iteration; copy it if it has to outlive that. timestamp is seconds
+    since the epoch as a float (None for pcapng Simple Packet Blocks, which
+    carry none). A capture cut short mid-record just ends early.
+    """
+    with open(path, "rb", buffering=READ_BUFFER_SIZE) as f:
+        head = f.read(4)
+        if len(head) < 4:
+            raise CaptureFormatError(f"{path} is empty")
+        if int.from_bytes(head, "little") == _PCAPNG_SHB:
+            yield from _read_pcapng(f, head)
+        else:
+            yield from _read_pcap(f, head, path)
+
+
+def _read_pcap(f, head, path):
+    for order in ("<", ">"):
+        magic = struct.unpack(order + "I", head)[0]
+        if magic in (_PCAP_MAGIC_US, _PCAP_MAGIC_NS):
+            break
+    else:
+        raise CaptureFormatError(f"{path} is not a pcap or pcapng file")
+    scale = 1e-9 if magic == _PCAP_MAGIC_NS else 1e-6
+    rest = f.read(20)
+    if len(rest) < 20:
+        return
+    linktype = struct.unpack(order + "HHiIII", rest)[5] & 0xFFFF
+    record_header = struct.Struct(order + "IIII")
+
+    buf = bytearray(INITIAL_RECORD_BUFFER)
+    view = memoryview(buf)
+    while True:
+        header = f.read(record_header.size)
+        if len(header) < record_header.size:
+            return
+        seconds, fraction, captured, _ = record_header.unpack(header)
+        if captured > len(buf):
+            buf = bytearray(captured)
+            view = memoryview(buf)
+        frame = view[:captured]
+        if f.readinto(frame) < captured:
+            return
+        yield seconds + fraction * scale, linktype, frame
+
+
+def _read_pcapng(f, head):
+    order = "<"
+    # Interfaces of the current section: (linktype, seconds per tick, offset seconds)
+    interfaces = []
+    buf = bytearray(INITIAL_RECORD_BUFFER)
+    view = memoryview(buf)
+    while True:
+        if head is None:
+            head = f.read(4)
+            if len(head) < 4:
+                return
+        length_bytes = f.read(4)
+        if len(length_bytes) < 4:
+            return
+
+        if int.from_bytes(head, "little") == _PCAPNG_SHB:
+            # The section header's byte-order magic decides how this and every following block is read
+            bom = f.read(4)
+            if len(bom) < 4:
+                return
+            order = ">"
+            if int.from_bytes(bom, "little") == _PCAPNG_BYTE_ORDER_MAGIC:
+                order = "<"
+            block_length = struct.unpack(order + "I", length_bytes)[0]
+            interfaces = []
+            f.seek(block_length - 12, 1)
+            head = None
+            continue
+
+        block_type = struct.unpack(order + "I", head)[0]
+        block_length = struct.unpack(order + "I", length_bytes)[0]
+        head = None
+        body_length = block_length - 12
+        if body_length < 0:
+            raise CaptureFormatError(f"Bad pcapng block length {block_length}")
+        if block_type not in (_BLOCK_IDB, _BLOCK_EPB, _BLOCK_SPB, _BLOCK_OPB):
+            f.seek(body_length + 4, 1)
+            continue
+
+        if body_length + 4 > len(buf):
+            buf = bytearray(body_length + 4)
+            view = memoryview(buf)
+        body = view[:body_length + 4]  # body plus the trailing length
+        if f.readinto(body) < len(body):
+            return
+
+        if block_type == _BLOCK_EPB:
+            interface, high, low, captured = struct.unpack_from(
+                order + "IIII", body)
+            linktype, tick, offset = interfaces[interface]
+            timestamp = offset + ((high << 32) | low) * tick
+            yield timestamp, linktype, body[20:20 + captured]
+        elif block_type == _BLOCK_SPB:
+            original = struct.unpack_from(order + "I", body)[0]
+            captured = min(original, body_length - 4)
+            yield None, interfaces[0][0], body[4:4 + captured]
+        elif block_type == _BLOCK_OPB:
+            interface, _, high, low, captured = struct.unpack_from(
+                order + "HHIII", body)
+            linktype, tick, offset = interfaces[interface]
+            timestamp = offset + ((high << 32) | low) * tick
+            yield timestamp, linktype, body[20:20 + captured]
+        else:
+            interfaces.append(_interface_description(body[:body_length],
+                                                     order))
+
+
+def _interface_description(body, order):
+    linktype = struct.unpack_from(order + "H", body)[0]
+    tick = 1e-6
+    offset = 0
+    pos = 8
+    while pos + 4 <= len(body):
+        code, length = struct.unpack_from(order + "HH", body, pos)
+        value = body[pos + 4:pos + 4 + length]
+        if code == 0:
+            break
+        if code == 9 and length >= 1:  # if_tsresol
+            resolution = value[0]
+            if resolution & 0x80:
+                tick = 2.0**-(resolution & 0x7F)
+            else:
+                tick = 10.0**-resolution
+        elif code == 14 and length >= 8:  # if_tsoffset
+            offset = struct.unpack_from(order + "q", value)[0]
+        pos += 4 + (length + 3) // 4 * 4
+    return linktype, tick, offset
+
+
+def ipv4_offset(linktype, frame):
+    """Byte offset of the IPv4 header in a link-layer frame, or None if it isn't IPv4."""
+    if linktype == LINKTYPE_ETHERNET:
+        offset = 12
+        ethertype = (frame[offset] << 8) | frame[offset + 1]
+        while ethertype in _VLAN_ETHERTYPES and len(frame) >= offset + 6:
+            offset += 4
+            ethertype = (frame[offset] << 8) | frame[offset + 1]
+        return offset + 2 if ethertype == _ETHERTYPE_IPV4 else None
+    if linktype in _RAW_IP_LINKTYPES:
+        return 0
+    if linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+        # Address family in the capturing host's byte order (NULL) or big-endian (LOOP)
+        return 4 if _AF_INET in (frame[0], frame[3]) else None
+    if linktype == LINKTYPE_LINUX_SLL:
+        ethertype = (frame[14] << 8) | frame[15]
+        return 16 if ethertype == _ETHERTYPE_IPV4 else None
+    if linktype == LINKTYPE_LINUX_SLL2:
+        ethertype = (frame[0] << 8) | frame[1]
+        return 20 if ethertype == _ETHERTYPE_IPV4 else None
+    return None
+
+
+class CaptureAnalyser:
+    """Streams a capture through the same decoders as the live tools and accumulates a report.
+
+    UDP datagrams to or from port 6454 are fed to a dmx_listen.DmxMonitor
+    (per-universe rates, jitter, sequence gaps), with extra dispatcher
+    handlers building a node inventory from ArtPollReply and the IP
+    configuration from ArtIpProgReply. Only fixed-size counters and one entry
+    per stream/node are kept, so memory doesn't grow with capture size.
+    IPv4 fragments are counted and skipped.
+    """
+
+    def __init__(self, port=DEST_PORT):
+        self.port = port
+        self.monitor = DmxMonitor()
+        self.monitor.dispatcher.register(OP_POLL_REPLY, self._on_poll_reply,
+                                         _poll_reply_discovery)
+        self.monitor.dispatcher.register(OP_IP_PROG_REPLY,
+                                         self._on_ip_prog_reply)
+        self.nodes = {}  # (node ip, bind index) -> inventory dict
+        self.ip_configs = {}  # source ip -> ArtIpProgReply fields
+        self._ip_names = {}  # packed IPv4 int -> dotted string
+        self._time = 0.0
+        self.counts = {
+            'frames': 0,
+            'bytes': 0,
+            'not_ipv4': 0,
+            'not_udp': 0,
+            'fragments': 0,
+            'other_ports': 0,
+            'artnet': 0,
+        }
+        self.first_time = None
+        self.last_time = None
+        self.elapsed = 0.0
+
+    def analyse(self, path, on_progress=None, progress_every=1000000):
+        """Read the whole capture. on_progress(analyser) is called every progress_every frames."""
+        start = time.monotonic()
+        counts = self.counts
+        frames = 0
+        for timestamp, linktype, frame in read_capture(path):
+            frames += 1
+            counts['bytes'] += len(frame)
+            if timestamp is not None:
+                self._time = timestamp
+            self._handle_frame(linktype, frame)
+            if on_progress is not None and frames % progress_every == 0:
+                counts['frames'] = frames
+                self.elapsed = time.monotonic() - start
+                on_progress(self)
+        counts['frames'] = frames
+        self.elapsed = time.monotonic() - start
+        return self
+
+    def _handle_frame(self, linktype, frame):
+        counts = self.counts
+        try:
+            ip = ipv4_offset(linktype, frame)
+            if ip is None:
+                counts['not_ipv4'] += 1
+                return
+            version_ihl, fragment, protocol, src = _ipv4_header.unpack_from(
+                frame, ip)
+            if version_ihl >> 4 != 4:
+                counts['not_ipv4'] += 1
+                return
+            if protocol != _IPPROTO_UDP:
+                counts['not_udp'] += 1
+                return
+            if fragment & 0x3FFF:
+                counts['fragments'] += 1
+                return
+            udp = ip + (version_ihl & 0x0F) * 4
+            src_port, dst_port, udp_length = _udp_header.unpack_from(
+                frame, udp)
+        except (IndexError, struct.error):
+            counts['not_ipv4'] += 1  # too short to hold the headers
+            return
+        if src_port != self.port and dst_port != self.port:
+            counts['other_ports'] += 1
+            return
+
+        src_ip = self._ip_names.get(src)
+        if src_ip is None:
+            src_ip = _ipv4_string(src)
+            self._ip_names[src] = src_ip
+        if self.first_time is None:
+            self.first_time = self._time
+        self.last_time = self._time
+        counts['artnet'] += 1
+        self.monitor.feed(frame[udp + 8:udp + udp_length], (src_ip, src_port),
+                          self._time)
+
+    def _on_poll_reply(self, fields, view, addr):
+        if len(view) >= ArtPollReplyPacket.size:
+            reply = ArtPollReplyPacket(view[:ArtPollReplyPacket.size])
+            info = {
+                'short_name': reply.port_name,
+                'long_name': reply.long_name,
+                'mac': '' if reply.mac == "00:00:00:00:00:00" else reply.mac,
+                'bind_index': reply.bind_index,
+                'ports': min(reply.num_ports, 4),
+                'outputs': reply.output_universes,
+            }
+        else:
+            # Older, shorter replies: just the discovery fields
+            _, port_name, long_name, mac = fields
+            info = {
+                'short_name': decode_null_terminated(port_name),
+                'long_name': decode_null_terminated(long_name),
+                'mac': mac.hex(":") if any(mac) else '',
+                'bind_index': 0,
+                'ports': 0,
+                'outputs': [],
+            }
+
+        node_ip = _ipv4_string(fields[0])
+        key = (node_ip, info['bind_index'])
+        node = self.nodes.get(key)
+        if node is None:
+            node = {'ip': node_ip, 'first_seen': self._time, 'replies': 0}
+            self.nodes[key] = node
+        node.update(info)
+        node['last_seen'] = self._time
+        node['replies'] += 1
+
+    def _on_ip_prog_reply(self, fields, view, addr):
+        reply = ArtIpProgReplyPacket(view[:_ip_prog_reply_size].tobytes())
+        self.ip_configs[addr[0]] = {
+            'ip': _ipv4_string(reply.ip_addr),
+            'subnet_mask': _ipv4_string(reply.subnet_mask),
+            'gateway': _ipv4_string(reply.gateway),
+            'dhcp': bool(reply.status & 0x40),
+            'seen': self._time,
+        }
+
+
+def _ipv4_string(value):
+    return socket.inet_ntoa(value.to_bytes(4, "big"))
+
+
+def print_capture_progress(analyser):
+    counts = analyser.counts
+    print(
+        f"  {counts['frames']} frame(s), {counts['artnet']} Art-Net, {analyser.elapsed:.1f}s..."
+    )
+
+
+def print_capture_report(analyser, max_streams=None):
+    counts = analyser.counts
+    span = 0.0
+    if analyser.first_time is not None:
+        span = analyser.last_time - analyser.first_time
+    megabytes = counts['bytes'] / 1e6
+    rate = megabytes / analyser.elapsed if analyser.elapsed > 0 else 0.0
+    print(
+        f"{counts['frames']} frame(s), {megabytes:.1f} MB read in {analyser.elapsed:.2f}s ({rate:.0f} MB/s)"
+    )
+    print(
+        f"{counts['artnet']} Art-Net datagram(s) over {span:.2f}s of capture; skipped {counts['not_ipv4']} non-IPv4, "
+        f"{counts['not_udp']} non-UDP, {counts['fragments']} fragment(s), {counts['other_ports']} other port(s)"
+    )
+
+    monitor = analyser.monitor
+    totals = monitor.totals()
+    print(
+        f"{totals['dmx_packets']} ArtDmx packet(s) on {totals['streams']} stream(s); sequence: {totals['gaps']} gap(s), "
+        f"{totals['missing']} missing, {totals['duplicates']} duplicate, {totals['out_of_order']} out of order"
+    )
+    print()
+    print(
+        f"{'Source':<15} {'Univ':>5} {'avg pkt/s':>9} {'packets':>9} {'len':>4} {'jitter ms':>9} "
+        f"{'missing':>7} {'dup':>5} {'ooo':>5}")
+    streams = sorted(monitor.streams.items())
+    if max_streams is not None:
+        streams = streams[:max_streams]
+    for (source, universe), stream in streams:
+        seq = monitor.sequences.stream_stats(source, universe)
+        print(
+            f"{source:<15} {universe:>5} {stream.average_rate():>9.1f} {stream.packets:>9} {stream.length:>4} "
+            f"{stream.jitter * 1000.0:>9.3f} {seq['missing']:>7} {seq['duplicates']:>5} {seq['out_of_order']:>5}"
+        )
+
+    print()
+    print(f"{len(analyser.nodes)} node(s) seen in ArtPollReply:")
+    for (ip, bind_index), node in sorted(analyser.nodes.items()):
+        name = node['short_name'] or node['long_name']
+        outputs = ", ".join(str(u) for u in node['outputs']) or "-"
+        print(
+            f"  {ip:<15} bind {bind_index:<3} {node['mac'] or '-':<17}  {name:<18} outputs {outputs}  "
+            f"({node['replies']} replies)")
+    if analyser.ip_configs:
+        print()
+        print("ArtIpProgReply configurations:")
+        for source, config in sorted(analyser.ip_configs.items()):
+            dhcp = "DHCP" if config['dhcp'] else "static"
+            print(
+                f"  {source:<15} -> {config['ip']}/{config['subnet_mask']} gw {config['gateway']} ({dhcp})"
+            )
@@ -0,0 +1,185 @@
+import selectors
+import struct
+import time
+from ipaddress import IPv4Address
+
+from artnet_dispatch import ArtNetDispatcher
+from artnet_packet_common import OP_POLL_REPLY
+from artnet_packet_rx import ArtPollReplyPacket, artnet_poll_reply_discovery_fmt, routing_fields
+from artnet_packet_tx import ArtPollPacket
+from helpers import DEST_PORT, decode_null_terminated
+
+MAX_DRAIN = 1024  # datagrams read per wakeup, so a flood of replies can't hold off the next poll or the deadline
+
+_discovery_decoder = struct.Struct(artnet_poll_reply_discovery_fmt)
+
+
+def scan_events(sock, broadcast_ip, **kwargs):
+    """Event-driven ArtPoll scan of one socket/broadcast address. See scan_targets_events()."""
+    return scan_targets_events([(sock, broadcast_ip, None)], **kwargs)
+
+
+def scan_targets_events(targets,
+                        poll_count=3,
+                        poll_interval=0.5,
+                        quiet_period=0.3,
+                        max_duration=5.0):
+    """Event-driven ArtPoll scan over one or more (sock, broadcast_ip, iface) targets, yielding progress events.
+
+    Every target gets poll_count ArtPolls poll_interval apart, all from one
+    selector (epoll on Linux) that sleeps until a socket is readable or the
+    next poll/quiet deadline comes up, so there's no busy polling and N
+    interfaces cost no more wall time than one. The scan ends early once every
+    poll has gone out and no new node has answered for quiet_period seconds,
+    and never runs past max_duration. iface may be None; otherwise it is
+    recorded on each node found through that socket.
+
+    Yields dicts with an 'event' key:
+      'poll'     - {'sent', 'total', 'targets'} after each round of ArtPolls goes out
+      'node'     - {'node': {'ip', 'short_name', 'long_name', 'mac', 'universes'[, 'iface']}} for each new
+                   responder; 'universes' (the node's output universes) grows as its other bind indexes answer
+      'progress' - {'replies', 'new', 'duplicate', 'replies_per_sec'} after each batch of replies
+      'done'     - the same counters plus 'elapsed', 'ignored' and 'nodes' (list of node dicts)
+    """
+    poll_bytes = ArtPollPacket().pack()
+    discovered = {}
+    counters = {'replies': 0, 'new': 0, 'duplicate': 0}
+    new_nodes = []
+    current_iface = [None]
+
+    def on_poll_reply(fields, view, addr):
+        ip_addr, port_name, long_name, mac = fields
+        if len(view) != ArtPollReplyPacket.size:
+            return
+        counters['replies'] += 1
+        _, _, universes = routing_fields(view)
+        node = discovered.get(ip_addr)
+        if node is not None:
+            counters['duplicate'] += 1
+            # Nodes with more than four ports answer once per bind index, four ports per reply
+            if not set(universes).issubset(node['universes']):
+                node['universes'] = sorted(
+                    set(node['universes']).union(universes))
+            return
+        counters['new'] += 1
+        node = {
+            'ip': str(IPv4Address(ip_addr)),
+            'short_name': decode_null_terminated(port_name),
+            'long_name': decode_null_terminated(long_name),
+            'mac': mac.hex(":")
+            if any(mac) else '',  # nodes without a MAC report zeros
+            'universes': sorted(set(universes)),
+        }
+        if current_iface[0] is not None:
+            node['iface'] = current_iface[0]
+        discovered[ip_addr] = node
+        new_nodes.append(node)
+
+    dispatcher = ArtNetDispatcher()
+    dispatcher.register(OP_POLL_REPLY, on_poll_reply, _discovery_decoder)
+    recv_buf = bytearray(2048)
+    recv_view = memoryview(recv_buf)
+
+    old_timeouts = [sock.gettimeout() for sock, _, _ in targets]
+    selector = selectors.DefaultSelector()
+    for sock, _, iface in targets:
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, iface)
+    broadcast_ips = [broadcast_ip for _, broadcast_ip, _ in targets]
+
+    try:
+        scan_start = time.monotonic()
+        scan_deadline = scan_start + max_duration
+        polls_sent = 0
+        next_poll_at = scan_start
+        last_change = scan_start
+
+        while True:
+            now = time.monotonic()
+            if now >= scan_deadline:
+                break
+            if polls_sent < poll_count and now >= next_poll_at:
+                for sock, broadcast_ip, _ in targets:
+                    sock.sendto(poll_bytes, (broadcast_ip, DEST_PORT))
+                polls_sent += 1
+                next_poll_at = now + poll_interval
+                last_change = now
+                yield {
+                    'event': 'poll',
+                    'sent': polls_sent,
+                    'total': poll_count,
+                    'targets': broadcast_ips
+                }
+                continue
+
+            if polls_sent < poll_count:
+                wake_at = next_poll_at
+            else:
+                wake_at = last_change + quiet_period
+                if now >= wake_at:
+                    break
+            wake_at = min(wake_at, scan_deadline)
+
+            ready = selector.select(wake_at - now)
+            if not ready:
+                continue
+
+            replies_before = counters['replies']
+            for key, _ in ready:
+                current_iface[0] = key.data
+                _drain(key.fileobj, recv_buf, recv_view, dispatcher)
+
+            if new_nodes:
+                last_change = time.monotonic()
+                for node in new_nodes:
+                    yield {'event': 'node', 'node': node}
+                new_nodes.clear()
+            if counters['replies'] != replies_before:
+                yield _progress('progress', counters, scan_start)
+    finally:
+        selector.close()
+        for (sock, _, _), old_timeout in zip(targets, old_timeouts):
+            sock.settimeout(old_timeout)
+
+    done = _progress('done', counters, scan_start)
+    done['ignored'] = dispatcher.dropped()
+    done['nodes'] = list(discovered.values())
+    yield done
+
+
+def _drain(sock, recv_buf, recv_view, dispatcher, max_packets=MAX_DRAIN):
+    for _ in range(max_packets):
+        try:
+            nbytes, addr = sock.recvfrom_into(recv_buf)
+        except BlockingIOError:
+            return
+        except ConnectionRefusedError:
+            # ICMP port unreachable left over from an earlier send
+            continue
+        dispatcher.dispatch(recv_view[:nbytes], addr)
+
+
+def _progress(event, counters, scan_start):
+    elapsed = time.monotonic() - scan_start
+    progress = dict(counters)
+    progress['event'] = event
+    progress['elapsed'] = elapsed
+    rate = counters['replies'] / elapsed if elapsed > 0 else 0.0
+    progress['replies_per_sec'] = rate
+    return progress
+
+
+def scan(sock, broadcast_ip, on_event=None, **kwargs):
+    """Run scan_events() to completion, passing each event to on_event. Returns the list of node dicts."""
+    return scan_targets([(sock, broadcast_ip, None)], on_event, **kwargs)
+
+
+def scan_targets(targets, on_event=None, **kwargs):
+    """Run scan_targets_events() to completion, passing each event to on_event. Returns the merged node list."""
+    nodes = []
+    for event in scan_targets_events(targets, **kwargs):
+        if on_event is not None:
+            on_event(event)
+        if event['event'] == 'done':
+            nodes = event['nodes']
+    return nodes
@@ -1,9 +1,16 @@
 from ipaddress import ip_address
 
 import helpers
+import dmx_stream
+import artnet_async
+from batch_send import BatchSender
+from node_cache import NodeCache
+from output_stage import OutputTransform
+from universe_routing import RoutingTable, dmx_messages, plan_routes, print_routes
 
 from artnet_packet_tx import ArtPollPacket, ArtProgIpPacket, ArtCommandPacket, ArtDmxPacket
 from artnet_packet_rx import ArtPollReplyPacket, ArtIpProgReplyPacket
+from artnet_packet_common import OP_POLL_REPLY, OP_IP_PROG_REPLY
 
 if __name__ == "__main__":
     print("Art-Net packet tester")
@@ -11,9 +18,27 @@ if __name__ == "__main__":
     helpers.choose_interface_at_startup()
     sock = helpers.open_connection()
 
-    discovered_devices = []
+    node_cache = NodeCache()
+    if node_cache.load():
+        print(
+            f"Loaded {len(node_cache)} cached device(s) from {node_cache.path}"
+        )
+    discovered_devices = node_cache.nodes()
+    # Which discovered device outputs which universe, for sending each universe only where it's used
+    routing_table = RoutingTable()
+    routing_table.update_nodes(discovered_devices)
     selected_ips = []
     selected_universes = [0]
+    output_transform = OutputTransform()
+    stream_options = {
+        'send_on_change': False,
+        'keepalive': 1.0,
+        'sync_ip': None,
+        'record_path': None,
+        'routes': None,
+        'broadcast_ip': None,
+        'broadcast_threshold': 2
+    }
 
     while True:
         print()
@@ -23,9 +48,11 @@ if __name__ == "__main__":
         print(
             f"Selected devices: {selected_ips if selected_ips else '(none)'}")
         print(f"Selected universes: {selected_universes}")
+        print(f"Output stage: {output_transform.describe()}")
+        print(f"Streaming options: {stream_options}")
         print()
         print("Device options:")
-        print("1)  Scan for ArtNodes")
+        print("1)  Scan for ArtNodes (bound or all interfaces)")
         print("2)  Select devices from discovered")
         print("3)  Manually select IP")
         print("4)  Deselect devices")
@@ -39,15 +66,52 @@ if __name__ == "__main__":
         print("10) Send static ArtDMX (full universe of one byte value)")
         print("11) Send cycling RGB ArtDMX (ctrl+c or any key to stop)")
         print("12) Send cycling RGBW ArtDMX (ctrl+c or any key to stop)")
-        print("13) Exit")
+        print(
+            "13) Stream pattern ArtDMX (chase/gradient/rainbow/strobe/noise, any key to stop)"
+        )
+        print(
+            "14) Stream rainbow test to an LED matrix (pixel map, any key to stop)"
+        )
+        print("15) Output settings (gamma, master dimmer, colour balance)")
+        print(
+            "16) Streaming options (send-on-change, keepalive, ArtSync, recording, routing, broadcast)"
+        )
+        print("17) Listen for ArtDmx (per-universe stats, any key to stop)")
+        print("18) Play back a show file (any key to stop)")
+        print("19) Analyse a pcap/pcapng capture")
+        print("20) Exit")
         print()
 
-        num = helpers.prompt_for_number_in_range("Choice: ", range(1, 14))
+        num = helpers.prompt_for_number_in_range("Choice: ", range(1, 21))
 
         if num == 1:
+            scan_all = False
+            interfaces = helpers.list_local_interfaces()
+            if len(interfaces) > 1:
+                scan_all = helpers.prompt_for_string_in_range(
+                    "Scan bound interface only or all interfaces? (bound/all): ",
+                    ["bound", "all"]) == "all"
             print("Scanning...")
-            discovered_devices = helpers.scan_for_artnodes(sock)
-            print(f"Discovered {len(discovered_devices)} device(s):")
+            if scan_all:
+                scanned = helpers.scan_all_interfaces()
+            else:
+                scanned = helpers.scan_for_artnodes(sock)
+            counts = node_cache.update_all(scanned)
+            node_cache.save()
+            discovered_devices = node_cache.nodes()
+            # Nodes that were polled but didn't answer are gone, so stop routing universes to them
+            if scan_all or len(interfaces) <= 1:
+                routing_table.update_nodes(scanned, prune=True)
+            else:
+                routing_table.update_nodes(scanned)
+                answered = {node['ip'] for node in scanned}
+                for node in discovered_devices:
+                    ip = node['ip']
+                    if node['iface'] == helpers.bound_iface and ip not in answered:
+                        routing_table.remove(ip)
+            print(
+                f"Discovered {len(scanned)} device(s) ({counts['new']} new, {counts['changed']} changed); "
+                f"{len(discovered_devices)} cached:")
             helpers.print_discovered(discovered_devices)
 
         elif num == 2:
@@ -118,10 +182,11 @@ if __name__ == "__main__":
             if not selected_ips:
                 print("No devices selected")
                 continue
-            for ip in selected_ips:
-                print(f"-> ArtPoll to {ip}")
-                packet = ArtPollPacket()
-                raw_byte_response = helpers.send_packet(packet, sock, ip, True)
+            print(f"-> ArtPoll to {selected_ips}")
+            responses = artnet_async.send_packet_to_all(
+                ArtPollPacket(), sock, selected_ips, OP_POLL_REPLY)
+            for ip, raw_byte_response in responses.items():
+                print(f"<- {ip}")
                 if not raw_byte_response:
                     print("Timed out waiting for response")
                 else:
@@ -162,10 +227,11 @@ if __name__ == "__main__":
             elif sub == 6:
                 pass
 
-            for target_ip in selected_ips:
-                print(f"-> ArtIPProg to {target_ip}")
-                raw_byte_response = helpers.send_packet(
-                    packet, sock, target_ip, True)
+            print(f"-> ArtIPProg to {selected_ips}")
+            responses = artnet_async.send_packet_to_all(
+                packet, sock, selected_ips, OP_IP_PROG_REPLY)
+            for target_ip, raw_byte_response in responses.items():
+                print(f"<- {target_ip}")
                 if not raw_byte_response:
                     print("Timed out waiting for response")
                 else:
@@ -178,8 +244,7 @@ if __name__ == "__main__":
                 continue
             command_string = input("Enter the command string: ")
             packet = ArtCommandPacket(command_string)
-            for ip in selected_ips:
-                helpers.send_packet(packet, sock, ip, False)
+            artnet_async.send_packet_to_all(packet, sock, selected_ips)
             print(f"Sent ArtCommand to {selected_ips}")
 
         elif num == 9:
@@ -214,13 +279,21 @@ if __name__ == "__main__":
                         break
                 if not error:
                     data_bytes = parsed
-            for universe in selected_universes:
-                packet = ArtDmxPacket(universe, data_bytes)
-                for ip in selected_ips:
-                    helpers.send_packet(packet, sock, ip, False)
+            packets = [
+                ArtDmxPacket(universe, data_bytes)
+                for universe in selected_universes
+            ]
+            if not output_transform.is_identity():
+                for packet in packets:
+                    output_transform.apply_packet(packet)
+            result = BatchSender(sock).send(
+                dmx_messages(packets, selected_ips, stream_options['routes'],
+                             stream_options['broadcast_ip'],
+                             stream_options['broadcast_threshold']))
             print(
                 f"Sent ArtDMX to {selected_ips} on universes {selected_universes}, {len(data_bytes)} byte(s)"
             )
+            helpers.print_batch_result(result)
 
         elif num == 10:
             if not selected_ips:
@@ -229,69 +302,286 @@ if __name__ == "__main__":
             byte_val = helpers.prompt_for_number_in_range(
                 "Byte value (0-255): ", range(0, 256))
             data_bytes = [byte_val] * 512
-            for universe in selected_universes:
-                packet = ArtDmxPacket(universe, data_bytes)
-                for ip in selected_ips:
-                    helpers.send_packet(packet, sock, ip, False)
+            packets = [
+                ArtDmxPacket(universe, data_bytes)
+                for universe in selected_universes
+            ]
+            if not output_transform.is_identity():
+                for packet in packets:
+                    output_transform.apply_packet(packet)
+            result = BatchSender(sock).send(
+                dmx_messages(packets, selected_ips, stream_options['routes'],
+                             stream_options['broadcast_ip'],
+                             stream_options['broadcast_threshold']))
             print(
                 f"Sent ArtDMX to {selected_ips} on universes {selected_universes}, 512 bytes of {byte_val}"
             )
+            helpers.print_batch_result(result)
 
         elif num == 11:
             if not selected_ips:
                 print("No devices selected")
                 continue
+            rate = helpers.prompt_for_number_in_range(
+                "Frame rate (1-1000 fps): ", range(1, 1001))
             print(
-                f"Cycling R -> G -> B on {selected_ips} × {selected_universes}. Press any key to stop."
+                f"Cycling R -> G -> B on {selected_ips} × {selected_universes} at {rate} fps. Press any key to stop."
             )
             colors = [("R", 0), ("G", 1), ("B", 2)]
-            idx = 0
+            render = dmx_stream.color_cycle_render(selected_universes, colors,
+                                                   3, 510, rate)
+            streamer = dmx_stream.DmxStreamer(sock, selected_ips, render, rate,
+                                              output_transform,
+                                              **stream_options)
             try:
-                while True:
-                    label, offset = colors[idx]
-                    data_bytes = [0] * 512
-                    for i in range(offset, 510, 3):
-                        data_bytes[i] = 128
-                    for universe in selected_universes:
-                        packet = ArtDmxPacket(universe, data_bytes)
-                        for ip in selected_ips:
-                            helpers.send_packet(packet, sock, ip, False)
-                    print(f"Sent {label}=128")
-                    if helpers.wait_or_key_pressed(1.0):
-                        break
-                    idx = (idx + 1) % len(colors)
+                streamer.run(wait_fn=helpers.wait_or_key_pressed)
             except KeyboardInterrupt:
                 print()
             print("Stopped RGB cycle")
+            dmx_stream.print_stream_stats(streamer.stats())
 
         elif num == 12:
             if not selected_ips:
                 print("No devices selected")
                 continue
+            rate = helpers.prompt_for_number_in_range(
+                "Frame rate (1-1000 fps): ", range(1, 1001))
             print(
-                f"Cycling R -> G -> B -> W on {selected_ips} × {selected_universes}. Press any key to stop."
+                f"Cycling R -> G -> B -> W on {selected_ips} × {selected_universes} at {rate} fps. Press any key to stop."
             )
             colors = [("R", 0), ("G", 1), ("B", 2), ("W", 3)]
-            idx = 0
+            render = dmx_stream.color_cycle_render(selected_universes, colors,
+                                                   4, 512, rate)
+            streamer = dmx_stream.DmxStreamer(sock, selected_ips, render, rate,
+                                              output_transform,
+                                              **stream_options)
             try:
-                while True:
-                    label, offset = colors[idx]
-                    data_bytes = [0] * 512
-                    for i in range(offset, 512, 4):
-                        data_bytes[i] = 128
-                    for universe in selected_universes:
-                        packet = ArtDmxPacket(universe, data_bytes)
-                        for ip in selected_ips:
-                            helpers.send_packet(packet, sock, ip, False)
-                    print(f"Sent {label}=128")
-                    if helpers.wait_or_key_pressed(1.0):
-                        break
-                    idx = (idx + 1) % len(colors)
+                streamer.run(wait_fn=helpers.wait_or_key_pressed)
             except KeyboardInterrupt:
                 print()
             print("Stopped RGBW cycle")
+            dmx_stream.print_stream_stats(streamer.stats())
 
         elif num == 13:
+            if not selected_ips:
+                print("No devices selected")
+                continue
+            try:
+                import dmx_patterns
+            except ImportError:
+                print("Pattern streaming requires numpy (pip install numpy)")
+                continue
+            names = list(dmx_patterns.PATTERNS)
+            name = helpers.prompt_for_string_in_range(
+                f"Pattern ({'/'.join(names)}): ", names)
+            channels = helpers.prompt_for_number_in_range(
+                "Channels per pixel (3=RGB, 4=RGBW): ", [3, 4])
+            rate = helpers.prompt_for_number_in_range(
+                "Frame rate (1-1000 fps): ", range(1, 1001))
+            pattern = dmx_patterns.PATTERNS[name](channels_per_pixel=channels)
+            render = dmx_patterns.pattern_render(pattern, selected_universes,
+                                                 rate)
+            streamer = dmx_stream.DmxStreamer(sock, selected_ips, render, rate,
+                                              output_transform,
+                                              **stream_options)
+            print(
+                f"Streaming {name} on {selected_ips} × {selected_universes} at {rate} fps. Press any key to stop."
+            )
+            try:
+                streamer.run(wait_fn=helpers.wait_or_key_pressed)
+            except KeyboardInterrupt:
+                print()
+            print(f"Stopped {name}")
+            dmx_stream.print_stream_stats(streamer.stats())
+
+        elif num == 14:
+            if not selected_ips:
+                print("No devices selected")
+                continue
+            try:
+                import pixel_map
+            except ImportError:
+                print("Pixel mapping requires numpy (pip install numpy)")
+                continue
+            width = helpers.prompt_for_number_in_range(
+                "Matrix width (pixels): ", range(1, 4097))
+            height = helpers.prompt_for_number_in_range(
+                "Matrix height (pixels): ", range(1, 4097))
+            channels = helpers.prompt_for_number_in_range(
+                "Channels per pixel (3=RGB, 4=RGBW): ", [3, 4])
+            start_universe = helpers.prompt_for_number_in_range(
+                "Start universe (0-32767): ", range(0, 32768))
+            start_address = helpers.prompt_for_number_in_range(
+                "Start address (1-512): ", range(1, 513))
+            serpentine = helpers.prompt_for_string_in_range(
+                "Serpentine wiring? (y/n): ", ["y", "n"]) == "y"
+            rate = helpers.prompt_for_number_in_range(
+                "Frame rate (1-1000 fps): ", range(1, 1001))
+            wall = pixel_map.PixelMap(width, height, channels)
+            wall.add_matrix(start_universe=start_universe,
+                            start_address=start_address,
+                            serpentine=serpentine)
+            render = pixel_map.pixel_map_render(wall, pixel_map.canvas_rainbow,
+                                                rate)
+            streamer = dmx_stream.DmxStreamer(sock, selected_ips, render, rate,
+                                              output_transform,
+                                              **stream_options)
+            print(
+                f"Streaming {width}x{height} matrix on universes {wall.universes[0]}-{wall.universes[-1]} "
+                f"to {selected_ips} at {rate} fps. Press any key to stop.")
+            try:
+                streamer.run(wait_fn=helpers.wait_or_key_pressed)
+            except KeyboardInterrupt:
+                print()
+            print("Stopped matrix")
+            dmx_stream.print_stream_stats(streamer.stats())
+
+        elif num == 15:
+            print(f"Current: {output_transform.describe()}")
+            channels = helpers.prompt_for_number_in_range(
+                "Channels per pixel (1=mono, 3=RGB, 4=RGBW): ", [1, 3, 4])
+            if channels != output_transform.channels_per_pixel:
+                output_transform.set_layout(channels)
+            master = helpers.prompt_for_number_in_range(
+                "Master dimmer (0-100%): ", range(0, 101))
+            output_transform.set_master(master / 100.0)
+            gamma = helpers.prompt_for_float_in_range(
+                f"Gamma, one value or {channels} space-delimited (e.g. 2.2, 1.0 = off): ",
+                0.1, 5.0, channels)
+            output_transform.set_gamma(gamma)
+            balance = helpers.prompt_for_float_in_range(
+                f"Colour balance 0.0-1.0, one value or {channels} space-delimited: ",
+                0.0, 1.0, channels)
+            output_transform.set_balance(balance)
+            print(f"Output stage: {output_transform.describe()}")
+
+        elif num == 16:
+            send_on_change = helpers.prompt_for_string_in_range(
+                "Only send universes whose data changed? (y/n): ",
+                ["y", "n"]) == "y"
+            stream_options['send_on_change'] = send_on_change
+            if send_on_change:
+                keepalive = helpers.prompt_for_float_in_range(
+                    "Keepalive refresh interval in seconds (0.1-4.0): ", 0.1,
+                    4.0)
+                stream_options['keepalive'] = keepalive
+            sync = helpers.prompt_for_string_in_range(
+                f"Send ArtSync to {helpers.bound_broadcast} after each frame? (y/n): ",
+                ["y", "n"]) == "y"
+            sync_ip = helpers.bound_broadcast if sync else None
+            stream_options['sync_ip'] = sync_ip
+            record_path = input("Record output to file (blank for none): ")
+            stream_options['record_path'] = record_path.strip() or None
+            route = helpers.prompt_for_string_in_range(
+                "Send each universe only to selected devices that output it (from discovery)? (y/n): ",
+                ["y", "n"]) == "y"
+            stream_options['routes'] = routing_table if route else None
+            broadcast = helpers.prompt_for_string_in_range(
+                f"Broadcast a universe to {helpers.bound_broadcast} when enough devices take it? (y/n): ",
+                ["y", "n"]) == "y"
+            stream_options['broadcast_ip'] = None
+            if broadcast:
+                threshold = helpers.prompt_for_number_in_range(
+                    "Broadcast from how many devices per universe (1-1000): ",
+                    range(1, 1001))
+                stream_options['broadcast_ip'] = helpers.bound_broadcast
+                stream_options['broadcast_threshold'] = threshold
+            if route or broadcast:
+                plans = plan_routes(selected_universes, selected_ips,
+                                    stream_options['routes'],
+                                    stream_options['broadcast_ip'],
+                                    stream_options['broadcast_threshold'])
+                print_routes(plans, selected_ips,
+                             len(selected_universes) <= 32,
+                             stream_options['broadcast_ip'])
+            print(f"Streaming options: {stream_options}")
+
+        elif num == 17:
+            import dmx_listen
+            import show_log
+            record_path = input(
+                "Record to show file (blank for none): ").strip()
+            try:
+                listen_sock = helpers.open_listen_socket()
+            except OSError as e:
+                print(f"Could not listen on port {helpers.DEST_PORT}: {e}")
+                continue
+            recorder = None
+            if record_path:
+                try:
+                    recorder = show_log.ShowRecorder(record_path)
+                except OSError as e:
+                    print(f"Could not create show file: {e}")
+                    listen_sock.close()
+                    continue
+            listener = dmx_listen.DmxListener(listen_sock, recorder)
+            print(
+                f"Listening for ArtDmx on {helpers.bound_iface} port {helpers.DEST_PORT}. Press any key to stop."
+            )
+            try:
+                with helpers.stdin_cbreak() as stdin:
+                    totals = listener.run(
+                        on_refresh=dmx_listen.print_listen_table,
+                        stop_fds=[stdin])
+            except KeyboardInterrupt:
+                totals = listener.totals()
+            finally:
+                listen_sock.close()
+                if recorder is not None:
+                    recorder.close()
+            print()
+            dmx_listen.print_listen_totals(totals)
+            if recorder is not None:
+                print(f"Recorded {recorder.records} frame(s) to {record_path}")
+
+        elif num == 18:
+            if not selected_ips:
+                print("No devices selected")
+                continue
+            import show_log
+            path = input("Show file: ").strip()
+            try:
+                player = show_log.ShowPlayer(path)
+            except (OSError, ValueError) as e:
+                print(f"Could not open show file: {e}")
+                continue
+            with player:
+                length = player.duration()
+                print(f"{player.record_count} frame(s), {length:.2f}s of show")
+                start = helpers.prompt_for_float_in_range(
+                    f"Start at (0-{length:.2f} s): ", 0.0, length)
+                speed = helpers.prompt_for_float_in_range(
+                    "Speed factor (0.1-10): ", 0.1, 10.0)
+                print(
+                    f"Playing to {selected_ips} from {start:.2f}s at {speed}x. Press any key to stop."
+                )
+                try:
+                    play_stats = player.play(
+                        sock,
+                        selected_ips,
+                        start,
+                        speed,
+                        wait_fn=helpers.wait_or_key_pressed)
+                except KeyboardInterrupt:
+                    print()
+                    continue
+            show_log.print_play_stats(play_stats)
+
+        elif num == 19:
+            import artnet_pcap
+            path = input("Capture file: ").strip()
+            analyser = artnet_pcap.CaptureAnalyser()
+            try:
+                analyser.analyse(path, artnet_pcap.print_capture_progress)
+            except (OSError, ValueError) as e:
+                print(f"Could not read capture: {e}")
+                continue
+            except KeyboardInterrupt:
+                print("Stopped early, partial report:")
+            artnet_pcap.print_capture_report(analyser)
+
+        elif num == 20:
             break
 
+    node_cache.save()
     sock.close()
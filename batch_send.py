@@ -0,0 +1,207 @@
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import sys
+
+from helpers import DEST_PORT
+
+# Kernel caps a single sendmmsg() call at UIO_MAXIOV messages
+MAX_BATCH = 1024
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p),
+                ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(_IoVec)),
+                ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p),
+                ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16),
+                ("sin_addr", ctypes.c_uint8 * 4),
+                ("sin_zero", ctypes.c_uint8 * 8)]
+
+
+def _load_sendmmsg():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None,
+                           use_errno=True)
+        fn = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [
+        ctypes.c_int,
+        ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int
+    ]
+    fn.restype = ctypes.c_int
+    return fn
+
+
+_sendmmsg = _load_sendmmsg()
+
+
+class BatchSender:
+    """Sends a frame's worth of (packet bytes, destination IP) pairs in as few syscalls as possible.
+
+    With use_sendmmsg on Linux the whole batch is handed to the kernel with
+    sendmmsg() (up to MAX_BATCH messages per call). The mmsghdr, iovec and
+    sockaddr arrays are built once for a list of (buffer, IP) pairs and
+    reused for as long as the next batch is made of the same buffer objects
+    to the same IPs, which is what a streamer resending its packet buffers
+    every frame does; only a changed batch pays for rebuilding them. The
+    buffers of the last batch are referenced until the next different batch
+    or release(). Otherwise (the default, which is faster for small
+    batches, or where libc lacks sendmmsg) it is one sendto() per message.
+    Either way send() returns {'sent', 'short', 'failed'} counts.
+    """
+
+    def __init__(self, sock, port=DEST_PORT, use_sendmmsg=False):
+        self.sock = sock
+        self.port = port
+        self.use_sendmmsg = use_sendmmsg and _sendmmsg is not None
+        self._addrs = {}
+        self._buffers = []  # buffers the prepared arrays point into
+        self._buffer_ids = []
+        self._ips = []
+        self._lengths = []
+        self._msgs = None
+        self._iovs = None
+        self._msg_lens = None
+
+    def send(self, messages):
+        """Send an iterable of (packet_bytes, target_ip) pairs. Returns per-batch counts."""
+        result = {'sent': 0, 'short': 0, 'failed': 0}
+        if self.use_sendmmsg:
+            messages = messages if isinstance(messages,
+                                              list) else list(messages)
+            if not self._is_prepared(messages):
+                self._prepare(messages)
+            for start in range(0, len(messages), MAX_BATCH):
+                end = min(start + MAX_BATCH, len(messages))
+                self._send_range(start, end, result)
+        else:
+            self._send_loop(messages, result)
+        return result
+
+    def release(self):
+        """Drop the prepared arrays and the references they hold to the last batch's buffers."""
+        self._buffers = []
+        self._buffer_ids = []
+        self._ips = []
+        self._lengths = []
+        self._msg_lens = None
+        self._msgs = None
+        self._iovs = None
+
+    def _send_loop(self, messages, result):
+        for packet_bytes, target_ip in messages:
+            try:
+                sent_len = self.sock.sendto(packet_bytes,
+                                            (target_ip, self.port))
+            except OSError:
+                result['failed'] += 1
+                continue
+            if sent_len < len(packet_bytes):
+                result['short'] += 1
+            else:
+                result['sent'] += 1
+
+    def _is_prepared(self, messages):
+        # Ids can be compared safely: the previous buffers are still referenced, so no new object shares an id
+        if len(messages) != len(self._buffer_ids):
+            return False
+        return ([id(packet_bytes)
+                 for packet_bytes, _ in messages] == self._buffer_ids
+                and [target_ip for _, target_ip in messages] == self._ips)
+
+    def _prepare(self, messages):
+        count = len(messages)
+        self._msg_lens = None
+        self._msgs = (_MMsgHdr * count)()
+        self._iovs = (_IoVec * count)()
+        self._buffers = [packet_bytes for packet_bytes, _ in messages]
+        self._buffer_ids = [id(packet_bytes) for packet_bytes in self._buffers]
+        self._ips = [target_ip for _, target_ip in messages]
+        self._lengths = [len(packet_bytes) for packet_bytes in self._buffers]
+        iov_size = ctypes.sizeof(_IoVec)
+        iov_base = ctypes.addressof(self._iovs)
+        for i, (packet_bytes, target_ip) in enumerate(messages):
+            addr = self._sockaddr(target_ip)
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(addr)
+            hdr.msg_namelen = ctypes.sizeof(addr)
+            hdr.msg_iov = ctypes.cast(iov_base + i * iov_size,
+                                      ctypes.POINTER(_IoVec))
+            hdr.msg_iovlen = 1
+            self._iovs[i].iov_base = _buffer_address(packet_bytes)
+            self._iovs[i].iov_len = self._lengths[i]
+        if count:
+            # msg_len of every message, read back in one go after each call
+            words = ctypes.sizeof(_MMsgHdr) // 4
+            offset = _MMsgHdr.msg_len.offset // 4
+            self._msg_lens = memoryview(
+                self._msgs).cast("B").cast("I")[offset::words]
+
+    def _send_range(self, start, end, result):
+        fd = self.sock.fileno()
+        done = start
+        while done < end:
+            n = _sendmmsg(fd, ctypes.byref(self._msgs[done]), end - done, 0)
+            if n < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # Sockets with a timeout are non-blocking under the hood; wait for buffer space
+                    _, writable, _ = select.select([], [self.sock], [],
+                                                   self.sock.gettimeout())
+                    if writable:
+                        continue
+                # sendmmsg only reports an error for the first message of the call; skip it and keep going
+                result['failed'] += 1
+                done += 1
+                continue
+            sent_lens = self._msg_lens[done:done + n].tolist()
+            lengths = self._lengths[done:done + n]
+            short = 0
+            if sent_lens != lengths:
+                short = sum(1 for sent_len, length in zip(sent_lens, lengths)
+                            if sent_len < length)
+            result['short'] += short
+            result['sent'] += n - short
+            done += n
+
+    def _sockaddr(self, target_ip):
+        addr = self._addrs.get(target_ip)
+        if addr is None:
+            addr = _SockAddrIn()
+            addr.sin_family = socket.AF_INET
+            addr.sin_port = socket.htons(self.port)
+            addr.sin_addr[:] = socket.inet_aton(target_ip)
+            self._addrs[target_ip] = addr
+        return addr
+
+
+def _buffer_address(packet_bytes):
+    # Only the address is kept, not a ctypes export, so the buffer (e.g. a view of shared memory) can still be
+    # released once the sender lets go of it; the caller keeps packet_bytes alive while it's in use
+    if isinstance(packet_bytes, bytes):
+        return ctypes.cast(ctypes.c_char_p(packet_bytes),
+                           ctypes.c_void_p).value
+    return ctypes.addressof(
+        (ctypes.c_char * len(packet_bytes)).from_buffer(packet_bytes))
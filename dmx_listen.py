@@ -0,0 +1,253 @@
+import os
+import select
+import socket
+import struct
+import sys
+import time
+
+from artnet_dispatch import ArtNetDispatcher
+from artnet_packet_common import OP_DMX
+from artnet_packet_tx import ArtDmxPacket
+from dmx_sequence import SequenceTracker
+
+RECV_BUFFER_SIZE = 2048  # larger than any Art-Net packet
+SOCKET_RCVBUF = 4 * 1024 * 1024  # room to absorb bursts between drains
+MAX_DRAIN = 4096  # datagrams read per wakeup, so a flood can't starve the table refresh or the stop key
+
+# Kernel receive timestamps (Linux) give inter-arrival times that don't depend on how late we got round to reading
+_SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS",
+                          35 if sys.platform.startswith("linux") else None)
+_timespec = struct.Struct("@qq")
+_ANCDATA_SIZE = 0
+if hasattr(socket, "CMSG_SPACE"):
+    _ANCDATA_SIZE = socket.CMSG_SPACE(_timespec.size)
+
+
+class UniverseStats:
+    """Counters for one (source IP, universe) ArtDmx stream."""
+
+    __slots__ = ("packets", "first_arrival", "last_arrival", "last_interval",
+                 "jitter", "length", "snapshot", "pps", "_rate_packets",
+                 "last_sequence_status")
+
+    def __init__(self):
+        self.packets = 0
+        self.first_arrival = 0.0
+        self.last_arrival = 0.0
+        self.last_interval = 0.0
+        self.jitter = 0.0  # seconds, smoothed |change in inter-arrival time| as in RFC 3550
+        self.length = 0
+        # DMX data of the latest packet, first length bytes valid
+        self.snapshot = bytearray(512)
+        self.pps = 0.0
+        self._rate_packets = 0
+        self.last_sequence_status = None
+
+    def record(self, arrival, length, data):
+        if self.packets:
+            interval = arrival - self.last_arrival
+            if self.packets > 1:
+                delta = abs(interval - self.last_interval)
+                self.jitter += (delta - self.jitter) / 16.0
+            self.last_interval = interval
+        else:
+            self.first_arrival = arrival
+        self.last_arrival = arrival
+        self.packets += 1
+        self.length = length
+        self.snapshot[:len(data)] = data
+
+    def update_rate(self, elapsed):
+        self.pps = (self.packets - self._rate_packets) / elapsed
+        self._rate_packets = self.packets
+
+    def average_rate(self):
+        """Packets/sec over the whole stream, from first to last arrival."""
+        span = self.last_arrival - self.first_arrival
+        return (self.packets - 1) / span if span > 0 else 0.0
+
+
+class DmxMonitor:
+    """Per-(source IP, universe) ArtDmx statistics for datagrams fed in from anywhere.
+
+    Datagrams go through an ArtNetDispatcher, so only the 18-byte ArtDmx
+    header is unpacked and everything else is dropped and counted (register
+    more opcodes on self.dispatcher to handle them too). For each stream it
+    tracks packet rate, inter-arrival jitter, the last length and DMX data,
+    and sequence gaps/duplicates/reordering (dmx_sequence.SequenceTracker).
+    Pass recorder (a show_log.ShowRecorder) to also append every ArtDmx
+    packet to a show file, stamped with its arrival time.
+    """
+
+    def __init__(self, recorder=None):
+        self.recorder = recorder
+        self.dispatcher = ArtNetDispatcher()
+        self.dispatcher.register(OP_DMX, self._on_dmx)
+        self.sequences = SequenceTracker()
+        self.streams = {}  # (source ip, universe) -> UniverseStats
+        self.datagrams = 0
+        self._arrival = 0.0
+
+    def feed(self, data, addr, arrival):
+        """Account for one datagram (bytes-like) from addr ((ip, port)) that arrived at arrival seconds."""
+        self._arrival = arrival
+        self.datagrams += 1
+        self.dispatcher.dispatch(data, addr)
+
+    def _on_dmx(self, fields, view, addr):
+        _, _, _, sequence, _, sub_uni, net, length = fields
+        universe = (net << 8) | sub_uni
+        key = (addr[0], universe)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = UniverseStats()
+            self.streams[key] = stream
+        data_start = ArtDmxPacket.DATA_OFFSET
+        data = view[data_start:data_start + min(length, 512)]
+        stream.record(self._arrival, length, data)
+        if self.recorder is not None:
+            self.recorder.record(universe, data, length, self._arrival)
+        stream.last_sequence_status = self.sequences.record(
+            addr[0], universe, sequence)
+
+    def totals(self):
+        totals = self.sequences.totals()
+        totals['datagrams'] = self.datagrams
+        totals['dmx_packets'] = self.dispatcher.counts[OP_DMX]
+        totals['dropped'] = self.dispatcher.dropped()
+        totals['streams'] = len(self.streams)
+        return totals
+
+
+class DmxListener(DmxMonitor):
+    """A DmxMonitor fed from a bound UDP socket in real time.
+
+    Datagrams are read with recvfrom_into/recvmsg_into into one preallocated
+    buffer. The socket is drained in bursts between select() wakeups and the
+    table callback only runs every refresh seconds, so display cost stays
+    out of the per-packet path.
+    """
+
+    def __init__(self, sock, recorder=None):
+        super().__init__(recorder)
+        self.sock = sock
+        self.buffer = bytearray(RECV_BUFFER_SIZE)
+        self._view = memoryview(self.buffer)
+        self.pps = 0.0
+        self._rate_datagrams = 0
+        self.start_time = None
+
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+        except OSError:
+            pass
+        self.kernel_timestamps = False
+        if _SO_TIMESTAMPNS is not None and _ANCDATA_SIZE:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, _SO_TIMESTAMPNS, 1)
+                self.kernel_timestamps = True
+            except OSError:
+                pass
+        sock.setblocking(False)
+
+    def drain(self, max_packets=MAX_DRAIN):
+        """Read and decode datagrams already queued on the socket. Returns how many were read."""
+        view = self._view
+        dispatch = self.dispatcher.dispatch
+        count = 0
+        while count < max_packets:
+            try:
+                if self.kernel_timestamps:
+                    nbytes, ancdata, _, addr = self.sock.recvmsg_into(
+                        [self.buffer], _ANCDATA_SIZE)
+                    self._arrival = _kernel_time(ancdata)
+                else:
+                    nbytes, addr = self.sock.recvfrom_into(self.buffer)
+                    self._arrival = time.time()
+            except (BlockingIOError, InterruptedError):
+                break
+            count += 1
+            dispatch(view[:nbytes], addr)
+        self.datagrams += count
+        return count
+
+    def run(self, duration=None, refresh=1.0, on_refresh=None, stop_fds=()):
+        """Receive until duration seconds pass or one of stop_fds (e.g. sys.stdin in cbreak mode) becomes readable;
+        one byte is read from it. on_refresh(listener) is called every refresh seconds with rates updated."""
+        self.start_time = time.monotonic()
+        last_refresh = self.start_time
+        watched = [self.sock] + list(stop_fds)
+        while True:
+            now = time.monotonic()
+            if duration is not None and now - self.start_time >= duration:
+                break
+            if now - last_refresh >= refresh:
+                self.update_rates(now - last_refresh)
+                last_refresh = now
+                if on_refresh is not None:
+                    on_refresh(self)
+
+            timeout = last_refresh + refresh - now
+            if duration is not None:
+                timeout = min(timeout, self.start_time + duration - now)
+            readable, _, _ = select.select(watched, [], [], max(0.0, timeout))
+            if self.sock in readable:
+                self.drain()
+            stop = [f for f in readable if f is not self.sock]
+            for f in stop:
+                os.read(f.fileno(), 1)
+            if stop:
+                break
+        return self.totals()
+
+    def update_rates(self, elapsed):
+        if elapsed <= 0:
+            return
+        for stream in self.streams.values():
+            stream.update_rate(elapsed)
+        self.pps = (self.datagrams - self._rate_datagrams) / elapsed
+        self._rate_datagrams = self.datagrams
+
+    def totals(self):
+        totals = super().totals()
+        totals['elapsed'] = time.monotonic() - self.start_time
+        return totals
+
+
+def _kernel_time(ancdata):
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == _SO_TIMESTAMPNS:
+            seconds, nanoseconds = _timespec.unpack_from(data)
+            return seconds + nanoseconds * 1e-9
+    return time.time()
+
+
+def print_listen_table(listener, preview_channels=8):
+    """Redraw the per-stream table in place (ANSI clear + home)."""
+    lines = [
+        f"{listener.datagrams} datagram(s), {listener.pps:.0f}/sec, "
+        f"{listener.dispatcher.dropped()} non-ArtDmx dropped. Press any key to stop.",
+        "",
+        f"{'Source':<15} {'Univ':>5} {'pkt/s':>7} {'total':>9} {'len':>4} {'jitter ms':>9} "
+        f"{'missing':>7} {'dup':>5} {'ooo':>5}  first channels",
+    ]
+    for (source, universe), stream in sorted(listener.streams.items()):
+        seq = listener.sequences.stream_stats(source, universe)
+        preview = " ".join(
+            f"{v:3d}"
+            for v in stream.snapshot[:min(stream.length, preview_channels)])
+        lines.append(
+            f"{source:<15} {universe:>5} {stream.pps:>7.1f} {stream.packets:>9} {stream.length:>4} "
+            f"{stream.jitter * 1000.0:>9.3f} {seq['missing']:>7} {seq['duplicates']:>5} "
+            f"{seq['out_of_order']:>5}  {preview}")
+    print("\033[2J\033[H" + "\n".join(lines), flush=True)
+
+
+def print_listen_totals(totals):
+    print(
+        f"{totals['dmx_packets']} ArtDmx packet(s) on {totals['streams']} stream(s) in {totals['elapsed']:.2f}s, "
+        f"{totals['dropped']} other datagram(s) dropped")
+    print(
+        f"Sequence: {totals['gaps']} gap(s), {totals['missing']} missing, {totals['duplicates']} duplicate, "
+        f"{totals['out_of_order']} out of order, {totals['unsequenced']} unsequenced"
+    )
@@ -0,0 +1,202 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from artnet_packet_tx import ArtDmxPacket
+from dmx_stream import DmxFrame
+from frame_store import DATA_OFFSET, SLOT_SIZE
+
+
+def frame_array(frame):
+    """(universes, 512) uint8 view over the DMX data of every packet in a DmxFrame.
+    Writing into it writes straight into the packet buffers."""
+    raw = np.frombuffer(frame.buffer, dtype=np.uint8)
+    raw = raw.reshape(len(frame.packets), frame.packet_size)
+    return raw[:, ArtDmxPacket.DATA_OFFSET:]
+
+
+def pixel_view(out, channels_per_pixel):
+    """(universes, pixels per universe, channels_per_pixel) view of a (universes, 512) frame.
+    Trailing channels that don't fit a whole pixel (e.g. 510-511 for RGB) are left out."""
+    pixels_per_universe = out.shape[1] // channels_per_pixel
+    return np.lib.stride_tricks.as_strided(
+        out,
+        shape=(out.shape[0], pixels_per_universe, channels_per_pixel),
+        strides=(out.strides[0], channels_per_pixel * out.strides[1],
+                 out.strides[1]),
+        writeable=True)
+
+
+def fill_hue(pixels, hue, level=255):
+    """Write full-saturation colours for hue (0.0-1.0, shaped like pixels[..., 0]) into the RGB channels of pixels."""
+    hue6 = hue * 6.0
+    scale = float(level)
+    pixels[..., 0] = np.clip(np.abs(hue6 - 3.0) - 1.0, 0.0, 1.0) * scale
+    pixels[..., 1] = np.clip(2.0 - np.abs(hue6 - 2.0), 0.0, 1.0) * scale
+    pixels[..., 2] = np.clip(2.0 - np.abs(hue6 - 4.0), 0.0, 1.0) * scale
+    if pixels.shape[-1] > 3:
+        pixels[..., 3:] = 0
+
+
+class Pattern(ABC):
+    """Base for frame generators that fill a whole (universes, 512) uint8 array per call.
+
+    Pixels are numbered continuously across universes (universe 0's pixels,
+    then universe 1's, ...), so moving patterns flow from one universe into
+    the next. Subclasses implement _render(pixels, t) on the pixel view and
+    can precompute per-shape tables in _prepare(); nothing loops per channel
+    in Python.
+    """
+
+    def __init__(self, channels_per_pixel=3, level=255):
+        self.channels_per_pixel = channels_per_pixel
+        self.level = level
+        self._shape = None
+        self.position = None  # each pixel's place along the whole rig, 0.0-1.0
+
+    def render(self, out, t):
+        """Fill out (a (universes, 512) uint8 array) with the pattern at time t seconds."""
+        pixels = pixel_view(out, self.channels_per_pixel)
+        if pixels.shape != self._shape:
+            self._shape = pixels.shape
+            self._prepare(pixels.shape)
+        self._render(pixels, t)
+
+    def _prepare(self, shape):
+        universes, pixels_per_universe, _ = shape
+        total = universes * pixels_per_universe
+        self.total_pixels = total
+        self.pixel_index = np.arange(total).reshape(universes,
+                                                    pixels_per_universe)
+        self.position = (self.pixel_index / total).astype(np.float32)
+
+    @abstractmethod
+    def _render(self, pixels, t):
+        """Fill pixels (see pixel_view) with the pattern at time t seconds."""
+
+    def _color(self, color):
+        # Pad/truncate an RGB(W) tuple to this pattern's channel count and apply the level
+        color = list(color)[:self.channels_per_pixel]
+        color += [0] * (self.channels_per_pixel - len(color))
+        return (np.array(color, dtype=np.float32) *
+                (self.level / 255.0)).astype(np.uint8)
+
+
+class Chase(Pattern):
+    """A block of width lit pixels running along the rig at speed pixels/second."""
+
+    def __init__(self,
+                 width=10,
+                 speed=100.0,
+                 color=(255, 255, 255, 255),
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.width = width
+        self.speed = speed
+        self.color = self._color(color)
+
+    def _render(self, pixels, t):
+        head = int(t * self.speed) % self.total_pixels
+        lit = (head - self.pixel_index) % self.total_pixels < self.width
+        pixels[...] = 0
+        pixels[lit] = self.color
+
+
+class Gradient(Pattern):
+    """Triangle-wave blend between two colours along the rig, scrolling speed rig-lengths/second."""
+
+    def __init__(self,
+                 color_a=(255, 0, 0, 0),
+                 color_b=(0, 0, 255, 0),
+                 speed=0.25,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.color_a = self._color(color_a).astype(np.float32)
+        self.color_b = self._color(color_b).astype(np.float32)
+        self.speed = speed
+
+    def _render(self, pixels, t):
+        phase = (self.position + t * self.speed) % 1.0
+        mix = (1.0 - np.abs(2.0 * phase - 1.0))[..., np.newaxis]
+        pixels[...] = self.color_a + (self.color_b - self.color_a) * mix
+
+
+class Rainbow(Pattern):
+    """Full-saturation hue sweep, cycles rainbows across the rig, scrolling speed rig-lengths/second."""
+
+    def __init__(self, cycles=1.0, speed=0.25, **kwargs):
+        super().__init__(**kwargs)
+        self.cycles = cycles
+        self.speed = speed
+
+    def _render(self, pixels, t):
+        hue = (self.position * self.cycles + t * self.speed) % 1.0
+        fill_hue(pixels, hue, self.level)
+
+
+class Strobe(Pattern):
+    """Every channel flashes to level at rate_hz, on for duty of each period."""
+
+    def __init__(self, rate_hz=10.0, duty=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_hz = rate_hz
+        self.duty = duty
+
+    def _render(self, pixels, t):
+        on = (t * self.rate_hz) % 1.0 < self.duty
+        pixels[...] = self.level if on else 0
+
+
+class Noise(Pattern):
+    """Uniform random values 0-level on every channel, new each frame."""
+
+    def __init__(self, seed=None, **kwargs):
+        super().__init__(**kwargs)
+        self.rng = np.random.default_rng(seed)
+
+    def _render(self, pixels, t):
+        pixels[...] = self.rng.integers(0,
+                                        self.level + 1,
+                                        size=pixels.shape,
+                                        dtype=np.uint8)
+
+
+PATTERNS = {
+    'chase': Chase,
+    'gradient': Gradient,
+    'rainbow': Rainbow,
+    'strobe': Strobe,
+    'noise': Noise,
+}
+
+
+def pattern_render(pattern, universes, rate_hz):
+    """Build a DmxStreamer render callback that draws pattern into one shared DmxFrame per frame."""
+    frame = DmxFrame(universes)
+    out = frame_array(frame)
+
+    def render(frame_index):
+        pattern.render(out, frame_index / rate_hz)
+        return frame.packets
+
+    return render
+
+
+def store_array(store):
+    """(universes, 512) uint8 view of the DMX data in a frame_store.FrameStore's slots, like frame_array.
+    Drop it before closing the store, which can't unmap memory that's still exported."""
+    slots = np.frombuffer(store.slots,
+                          dtype=np.uint8).reshape(len(store.universes),
+                                                  SLOT_SIZE)
+    return slots[:, DATA_OFFSET:]
+
+
+def pattern_producer(pattern, store, rate_hz):
+    """Build a sharded_sender.ShardedSender producer that draws pattern straight into store each frame."""
+    out = store_array(store)
+
+    def produce(frame_index):
+        pattern.render(out, frame_index / rate_hz)
+        store.mark_dirty()
+
+    return produce
@@ -0,0 +1,108 @@
+# Art-Net sequence numbers run 1-255 and wrap back to 1; 0 means the sender isn't sequencing and receivers should
+# ignore the field. A packet more than REORDER_WINDOW steps ahead of the last one is treated as a late (out-of-order)
+# arrival instead of a gap: half the sequence space, as the spec suggests
+REORDER_WINDOW = 127
+
+
+class SequenceCounter:
+    """Wrapping 1-255 ArtDmx sequence counters, one per (universe, destination IP)."""
+
+    def __init__(self):
+        self._last = {}
+
+    def advance(self, universe, target_ips):
+        """Step the counter for universe on each of target_ips. Returns the new numbers in target_ips order."""
+        last = self._last
+        out = []
+        for ip in target_ips:
+            key = (universe, ip)
+            sequence = last.get(key, 0) % 255 + 1
+            last[key] = sequence
+            out.append(sequence)
+        return out
+
+
+# Per-stream counter slots in SequenceTracker entries
+_LAST = 0
+_RECEIVED = 1
+_GAPS = 2
+_MISSING = 3
+_DUPLICATES = 4
+_OUT_OF_ORDER = 5
+_UNSEQUENCED = 6
+_STAT_NAMES = ('received', 'gaps', 'missing', 'duplicates', 'out_of_order',
+               'unsequenced')
+
+
+class SequenceTracker:
+    """Receive-side sequence accounting per (source IP, universe), O(1) per packet.
+
+    record() compares each packet's sequence number with the last one seen on
+    its stream (modulo 255) and classifies it:
+      'ok'           - exactly one step ahead
+      'gap'          - further ahead; the skipped numbers are added to 'missing'
+      'duplicate'    - same number again
+      'out_of_order' - behind the last number (arrived late); the stream
+                       position isn't moved back
+      'first'        - first sequenced packet on the stream
+      'unsequenced'  - sequence 0, sender isn't numbering packets
+    A late packet was already counted as missing when the gap opened, so
+    'missing' is an upper bound on real loss when reordering is present.
+    """
+
+    def __init__(self):
+        self._streams = {}
+
+    def record(self, source, universe, sequence):
+        """Account for one ArtDmx packet. Returns its classification (see class docstring)."""
+        entry = self._streams.get((source, universe))
+        if entry is None:
+            entry = [0, 0, 0, 0, 0, 0, 0]
+            self._streams[(source, universe)] = entry
+        entry[_RECEIVED] += 1
+
+        if sequence == 0:
+            entry[_UNSEQUENCED] += 1
+            return 'unsequenced'
+        last = entry[_LAST]
+        if last == 0:
+            entry[_LAST] = sequence
+            return 'first'
+
+        step = (sequence - last) % 255
+        if step == 1:
+            entry[_LAST] = sequence
+            return 'ok'
+        if step == 0:
+            entry[_DUPLICATES] += 1
+            return 'duplicate'
+        if step <= REORDER_WINDOW:
+            entry[_GAPS] += 1
+            entry[_MISSING] += step - 1
+            entry[_LAST] = sequence
+            return 'gap'
+        entry[_OUT_OF_ORDER] += 1
+        return 'out_of_order'
+
+    def stream_stats(self, source, universe):
+        entry = self._streams.get((source, universe))
+        if entry is None:
+            return None
+        return dict(zip(_STAT_NAMES, entry[_RECEIVED:]))
+
+    def stats(self):
+        """{(source, universe): {'received', 'gaps', 'missing', 'duplicates', 'out_of_order', 'unsequenced'}}"""
+        return {
+            key: dict(zip(_STAT_NAMES, entry[_RECEIVED:]))
+            for key, entry in self._streams.items()
+        }
+
+    def totals(self):
+        totals = dict.fromkeys(_STAT_NAMES, 0)
+        for entry in self._streams.values():
+            for name, value in zip(_STAT_NAMES, entry[_RECEIVED:]):
+                totals[name] += value
+        return totals
+
+    def reset(self):
+        self._streams.clear()
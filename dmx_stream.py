@@ -0,0 +1,508 @@
+from array import array
+import struct
+import time
+
+from batch_send import BatchSender
+from dmx_sequence import SequenceCounter
+from show_log import ShowRecorder
+from artnet_packet_tx import ArtDmxPacket, ArtSyncPacket, artnet_dmx_packet_fmt
+from helpers import DEST_PORT
+from universe_routing import choose_destinations
+
+
+class FrameClock:
+    """Fixed-rate frame scheduler driven by time.monotonic().
+
+    Frame n is due at start + n * period, so deadlines are computed from the
+    start time rather than from the previous wakeup and never accumulate drift.
+    If the sender falls more than a full period behind, the missed slots are
+    counted as late frames and dropped instead of being sent back-to-back.
+    """
+
+    def __init__(self, rate_hz):
+        if rate_hz <= 0:
+            raise ValueError(f"Frame rate must be positive, got {rate_hz}")
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.start_time = None
+        self.frame_index = 0
+        self.frames = 0
+        self.last_frame_time = None
+        self.late_frames = 0
+        self.max_jitter = 0.0
+
+    def start(self, start_time=None):
+        """Make frame 0 due at start_time (a time.monotonic() value, default now). Several processes
+        given the same start_time share one frame clock, since the monotonic clock is system-wide."""
+        self.start_time = time.monotonic(
+        ) if start_time is None else start_time
+        self.frame_index = 0
+        self.frames = 1
+        self.last_frame_time = self.start_time
+        self.late_frames = 0
+        self.max_jitter = 0.0
+
+    def deadline(self, frame_index):
+        return self.start_time + frame_index * self.period
+
+    def wait_next(self, wait_fn=None):
+        """Block until the next frame is due and advance frame_index.
+
+        wait_fn(timeout_sec) is used instead of time.sleep when given; if it
+        returns True (e.g. a key was pressed) the wait is aborted and True is
+        returned so the caller can stop streaming. It is polled with a zero
+        timeout when the frame is already due, so a stream that is always
+        late can still be stopped.
+        """
+        next_index = self.frame_index + 1
+        remaining = self.deadline(next_index) - time.monotonic()
+        if wait_fn is not None:
+            if wait_fn(max(remaining, 0)):
+                return True
+        elif remaining > 0:
+            time.sleep(remaining)
+
+        now = time.monotonic()
+        lateness = now - self.deadline(next_index)
+        if lateness >= self.period:
+            # Skip every slot we've already missed and schedule from the current one
+            skipped = int(lateness // self.period)
+            self.late_frames += skipped
+            next_index += skipped
+            lateness = now - self.deadline(next_index)
+        self.max_jitter = max(self.max_jitter, abs(lateness))
+        self.frame_index = next_index
+        self.frames += 1
+        self.last_frame_time = now
+        return False
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+    def stats(self):
+        elapsed = self.elapsed()
+        # Frame intervals over the time they took: frame 0 went out at the start, not after an interval
+        span = self.last_frame_time - self.start_time
+        fps = (self.frames - 1) / span if span > 0 else 0.0
+        return {
+            'frames': self.frames,
+            'elapsed': elapsed,
+            'target_fps': self.rate_hz,
+            'achieved_fps': fps,
+            'late_frames': self.late_frames,
+            'max_jitter_ms': self.max_jitter * 1000.0,
+        }
+
+
+class DmxFrame:
+    """ArtDmxPackets for a list of universes laid out back-to-back in one bytearray.
+
+    Every packet is a view into the same allocation, so a whole multi-universe
+    frame can be written in one go (see dmx_patterns.frame_array) and then
+    sent packet by packet with no copying. Packets are sent as full
+    512-channel universes.
+    """
+
+    packet_size = struct.calcsize(artnet_dmx_packet_fmt)
+
+    def __init__(self, universes):
+        self.universes = list(universes)
+        self.buffer = bytearray(self.packet_size * len(self.universes))
+        view = memoryview(self.buffer)
+        self.packets = []
+        for i, universe in enumerate(self.universes):
+            start = i * self.packet_size
+            packet = ArtDmxPacket(universe,
+                                  buffer=view[start:start + self.packet_size])
+            packet.set_length(512)
+            self.packets.append(packet)
+
+
+class ChangeFilter:
+    """Send-on-change for a stream of ArtDmxPackets, with a keepalive refresh.
+
+    Keeps a copy of the length + DMX data last sent for each universe (one
+    buffer per universe, compared against and overwritten in place) and
+    drops packets that haven't changed since, except that every universe is
+    still resent at least once per keepalive seconds so nodes don't time out
+    their outputs (Art-Net nodes drop to their fail-over state after ~4s of
+    silence).
+    """
+
+    def __init__(self, keepalive=1.0):
+        self.keepalive = keepalive
+        self._last_sent = {
+        }  # universe -> [length + data copy, time last sent]
+        self.universes_sent = 0
+        self.universes_skipped = 0
+
+    def filter(self, packets, now=None):
+        """Return the subset of packets that changed or are due for a keepalive."""
+        now = time.monotonic() if now is None else now
+        changed = []
+        for packet in packets:
+            # packet.payload is a standing view of the length + data, so comparing it copies nothing
+            payload = packet.payload
+            entry = self._last_sent.get(packet.universe)
+            if entry is None:
+                self._last_sent[packet.universe] = [bytearray(payload), now]
+            elif now - entry[1] < self.keepalive and entry[0] == payload:
+                self.universes_skipped += 1
+                continue
+            else:
+                entry[0][:] = payload
+                entry[1] = now
+            self.universes_sent += 1
+            changed.append(packet)
+        return changed
+
+
+class DmxStreamer:
+    """Sends the ArtDmxPackets render(frame_index) returns to target_ips at a fixed rate, one batch per frame."""
+
+    def __init__(self,
+                 sock,
+                 target_ips,
+                 render,
+                 rate_hz,
+                 transform=None,
+                 send_on_change=False,
+                 keepalive=1.0,
+                 sync_ip=None,
+                 sequence=True,
+                 record_path=None,
+                 routes=None,
+                 broadcast_ip=None,
+                 broadcast_threshold=2,
+                 use_sendmmsg=None):
+        self.sock = sock
+        self.target_ips = list(target_ips)
+        # A universe_routing.RoutingTable, which may keep changing while streaming: each universe only goes
+        # to the targets that output it
+        self.routes = routes
+        if broadcast_ip is not None and broadcast_threshold < 1:
+            raise ValueError(
+                f"Broadcast threshold must be at least 1, got {broadcast_threshold}"
+            )
+        # One send to broadcast_ip instead when broadcast_threshold or more of a universe's targets are on the
+        # bound subnet (see universe_routing.choose_destinations)
+        self.broadcast_ip = broadcast_ip
+        self.broadcast_threshold = broadcast_threshold
+        # universe -> (destination IPs, target IPs routed out, unicasts the broadcast replaces), valid for
+        # routes.version
+        self._plans = {}
+        self._plans_version = None
+        self.render = render
+        # An output_stage.OutputTransform, applied into a separate output frame so the renderer's own buffers
+        # are never corrected twice
+        self.transform = transform
+        # Unchanged universes are skipped, apart from a refresh every keepalive seconds
+        self.change_filter = None
+        if send_on_change:
+            self.change_filter = ChangeFilter(keepalive)
+        self._output_frame = None
+        # 1-255 sequence numbers per (universe, destination), so receivers can spot dropped or reordered frames
+        self.sequence_counter = SequenceCounter() if sequence else None
+        # Show file every packet sent is appended to (show_log.ShowRecorder), rewritten on each run()
+        self.record_path = record_path
+        # ArtSync to sync_ip (normally the subnet broadcast) after each frame, so nodes latch it at once
+        self.sync_ip = sync_ip
+        self._sync_bytes = ArtSyncPacket().pack()
+        # Seconds from the first ArtDmx to the ArtSync, one entry per frame
+        self.sync_spans = array('d')
+        self.clock = FrameClock(rate_hz)
+        if use_sendmmsg is None:
+            # sendmmsg pays off when the batch is the same buffers to the same IPs frame after frame
+            use_sendmmsg = not send_on_change
+        self.sender = BatchSender(sock, use_sendmmsg=use_sendmmsg)
+        # (universe, IP) -> that destination's own copy of the packet, for when sequence numbers differ
+        self._copies = {}
+        self.packets_sent = 0
+        self.packets_short = 0
+        self.packets_failed = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.packets_unrouted = 0
+        self.packets_broadcast = 0
+        self.unicasts_replaced = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def run(self, wait_fn=None, duration=None, start_time=None):
+        """Stream until wait_fn returns True or duration seconds have passed. Returns stats().
+        start_time (time.monotonic()) delays frame 0 until then, see FrameClock.start()."""
+        self.packets_sent = 0
+        self.packets_short = 0
+        self.packets_failed = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.packets_unrouted = 0
+        self.packets_broadcast = 0
+        self.unicasts_replaced = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.sync_spans = array('d')
+        self.clock.start(start_time)
+        remaining = self.clock.start_time - time.monotonic()
+        if remaining > 0:
+            if wait_fn is not None:
+                if wait_fn(remaining):
+                    return self.stats()
+            else:
+                time.sleep(remaining)
+        recorder = None
+        if self.record_path is not None:
+            recorder = ShowRecorder(self.record_path)
+        try:
+            while True:
+                self._send_frame(recorder)
+                # How long after its deadline the frame finished going out
+                lag = time.monotonic() - self.clock.deadline(
+                    self.clock.frame_index)
+                self.max_lag = max(self.max_lag, lag)
+                self.total_lag += lag
+                if duration is not None and self.clock.elapsed() >= duration:
+                    break
+                if self.clock.wait_next(wait_fn):
+                    break
+        finally:
+            self.sender.release()
+            if recorder is not None:
+                recorder.close()
+
+        return self.stats()
+
+    def _send_frame(self, recorder):
+        packets = self.apply_transform(self.render(self.clock.frame_index))
+        if self.change_filter is not None:
+            packets = self._send_on_change(packets)
+        batch = self.build_batch(packets)
+        self.bytes_sent += sum(len(packet_bytes) for packet_bytes, _ in batch)
+        first_sent = time.perf_counter()
+        result = self.sender.send(batch)
+        self.packets_sent += result['sent']
+        self.packets_short += result['short']
+        self.packets_failed += result['failed']
+        if self.sync_ip is not None and batch:
+            self._send_sync(first_sent)
+        if recorder is not None:
+            now = time.monotonic()
+            for packet in packets:
+                recorder.record_packet(packet, now)
+
+    def build_batch(self, packets):
+        """(packet bytes, IP) pairs sending packets to their destinations, sequenced and routed as
+        configured, for the BatchSender. Advances the sequence counters."""
+        planned = self.routes is not None or self.broadcast_ip is not None
+        if not planned and (self.sequence_counter is None
+                            or not self.target_ips):
+            return [(packet.pack(), ip) for packet in packets
+                    for ip in self.target_ips]
+        batch = []
+        for packet in packets:
+            target_ips = self.target_ips
+            if planned:
+                target_ips, unrouted, replaced = self._plan(packet.universe)
+                self.packets_unrouted += unrouted
+                if replaced:
+                    self.packets_broadcast += 1
+                    self.unicasts_replaced += replaced
+                if not target_ips:
+                    continue
+            if self.sequence_counter is None:
+                packet_bytes = packet.pack()
+                batch.extend((packet_bytes, ip) for ip in target_ips)
+                continue
+            sequences = self.sequence_counter.advance(packet.universe,
+                                                      target_ips)
+            if sequences.count(sequences[0]) == len(sequences):
+                # Usual case: every destination is at the same count, so one shared buffer does
+                packet.sequence = sequences[0]
+                packet_bytes = packet.pack()
+                batch.extend((packet_bytes, ip) for ip in target_ips)
+                continue
+            raw = packet.pack()
+            for sequence, ip in zip(sequences, target_ips):
+                # Reuse the same copy every frame so the batch keeps its buffers
+                packet_bytes = self._copies.get((packet.universe, ip))
+                if packet_bytes is None or len(packet_bytes) != len(raw):
+                    packet_bytes = bytearray(raw)
+                    self._copies[(packet.universe, ip)] = packet_bytes
+                else:
+                    packet_bytes[:] = raw
+                packet_bytes[ArtDmxPacket.SEQUENCE_OFFSET] = sequence
+                batch.append((packet_bytes, ip))
+        return batch
+
+    def _plan(self, universe):
+        # Recomputed only when the routing table has changed
+        version = self.routes.version if self.routes is not None else None
+        if self._plans_version != version:
+            self._plans_version = version
+            self._plans = {}
+        plan = self._plans.get(universe)
+        if plan is None:
+            target_ips = self.target_ips
+            if self.routes is not None:
+                subscribed = set(self.routes.subscribers(universe))
+                target_ips = [ip for ip in target_ips if ip in subscribed]
+            unrouted = len(self.target_ips) - len(target_ips)
+            replaced = 0
+            if self.broadcast_ip is not None:
+                destinations = choose_destinations(target_ips,
+                                                   self.broadcast_ip,
+                                                   self.broadcast_threshold)
+                if self.broadcast_ip in destinations:
+                    # Everything that isn't left as a unicast is covered by the broadcast
+                    replaced = len(target_ips) - (len(destinations) - 1)
+                target_ips = destinations
+            plan = (target_ips, unrouted, replaced)
+            self._plans[universe] = plan
+        return plan
+
+    def _send_sync(self, first_sent):
+        try:
+            self.sock.sendto(self._sync_bytes, (self.sync_ip, DEST_PORT))
+        except OSError:
+            self.packets_failed += 1
+            return
+        self.sync_spans.append(time.perf_counter() - first_sent)
+
+    def _send_on_change(self, packets):
+        changed = self.change_filter.filter(packets)
+        if len(changed) != len(packets):
+            # Each skipped packet saves one send per destination it would have gone to (a broadcast is one)
+            planned = self.routes is not None or self.broadcast_ip is not None
+            sent = set(map(id, changed))
+            for packet in packets:
+                if id(packet) in sent:
+                    continue
+                target_ips = self.target_ips
+                if planned:
+                    target_ips = self._plan(packet.universe)[0]
+                self.bytes_saved += len(packet.pack()) * len(target_ips)
+        return changed
+
+    def apply_transform(self, packets):
+        """packets run through the output transform (into a separate output frame), or packets as they
+        are without one."""
+        if self.transform is None or self.transform.is_identity():
+            return packets
+        universes = [packet.universe for packet in packets]
+        if self._output_frame is None or self._output_frame.universes != universes:
+            self._output_frame = DmxFrame(universes)
+        for packet, out in zip(packets, self._output_frame.packets):
+            out.set_length(packet.length)
+            self.transform.apply(packet.data, out.data)
+        return self._output_frame.packets
+
+    def stats(self):
+        stats = self.clock.stats()
+        stats['packets_sent'] = self.packets_sent
+        stats['packets_short'] = self.packets_short
+        stats['packets_failed'] = self.packets_failed
+        elapsed = stats['elapsed']
+        pps = self.packets_sent / elapsed if elapsed > 0 else 0.0
+        stats['packets_per_sec'] = pps
+        stats['bytes_sent'] = self.bytes_sent
+        stats['bytes_saved'] = self.bytes_saved
+        stats['max_lag_ms'] = self.max_lag * 1000.0
+        avg_lag = self.total_lag / stats['frames'] if stats['frames'] else 0.0
+        stats['avg_lag_ms'] = avg_lag * 1000.0
+        if self.change_filter is not None:
+            stats['universes_skipped'] = self.change_filter.universes_skipped
+        if self.routes is not None:
+            stats['packets_unrouted'] = self.packets_unrouted
+        if self.broadcast_ip is not None:
+            stats['broadcast_ip'] = self.broadcast_ip
+            stats['broadcast_threshold'] = self.broadcast_threshold
+            stats['packets_broadcast'] = self.packets_broadcast
+            stats['unicasts_replaced'] = self.unicasts_replaced
+            plans = self._plans.values()
+            stats['broadcast_universes'] = sum(1 for plan in plans if plan[2])
+            stats['unicast_universes'] = sum(1 for plan in plans
+                                             if plan[0] and not plan[2])
+        if self.sync_ip is not None:
+            stats.update(sync_span_stats(self.sync_spans))
+        return stats
+
+
+def sync_span_stats(spans):
+    """Summarise per-frame first-DMX-to-ArtSync spans (seconds) as milliseconds."""
+    if not spans:
+        return {'sync_frames': 0}
+    ordered = sorted(spans)
+    count = len(ordered)
+    return {
+        'sync_frames': count,
+        'sync_min_ms': ordered[0] * 1000.0,
+        'sync_avg_ms': sum(ordered) / count * 1000.0,
+        'sync_p99_ms': ordered[min(count - 1, int(count * 0.99))] * 1000.0,
+        'sync_max_ms': ordered[-1] * 1000.0,
+    }
+
+
+def print_stream_stats(stats):
+    print(
+        f"{stats['frames']} frame(s) in {stats['elapsed']:.2f}s: "
+        f"{stats['achieved_fps']:.2f} fps achieved (target {stats['target_fps']}), "
+        f"{stats['late_frames']} late, worst jitter {stats['max_jitter_ms']:.2f} ms"
+    )
+    if 'packets_sent' in stats:
+        print(
+            f"{stats['packets_sent']} packet(s) sent, {stats['packets_per_sec']:.0f} packets/sec, "
+            f"{stats['packets_short']} short, {stats['packets_failed']} failed, "
+            f"send lag avg {stats['avg_lag_ms']:.2f} ms, max {stats['max_lag_ms']:.2f} ms"
+        )
+    if 'universes_skipped' in stats:
+        total = stats['bytes_sent'] + stats['bytes_saved']
+        saved_pct = 100.0 * stats['bytes_saved'] / total if total else 0.0
+        print(
+            f"Send-on-change skipped {stats['universes_skipped']} unchanged universe frame(s), "
+            f"saved {stats['bytes_saved']} of {total} bytes ({saved_pct:.1f}%)"
+        )
+    if 'packets_unrouted' in stats:
+        print(
+            f"Routing left out {stats['packets_unrouted']} packet(s) to devices not outputting their universe"
+        )
+    if 'packets_broadcast' in stats:
+        print(
+            f"Broadcast to {stats['broadcast_ip']} (from {stats['broadcast_threshold']} subscriber(s)): "
+            f"{stats['broadcast_universes']} universe(s) broadcast, {stats['unicast_universes']} unicast; "
+            f"{stats['packets_broadcast']} broadcast packet(s) replaced {stats['unicasts_replaced']} unicast(s)"
+        )
+    if stats.get('sync_frames'):
+        print(
+            f"ArtSync after {stats['sync_frames']} frame(s), first DMX to sync: "
+            f"min {stats['sync_min_ms']:.3f} ms, avg {stats['sync_avg_ms']:.3f} ms, "
+            f"p99 {stats['sync_p99_ms']:.3f} ms, max {stats['sync_max_ms']:.3f} ms"
+        )
+
+
+def color_cycle_render(universes,
+                       colors,
+                       stride,
+                       end,
+                       frames_per_step,
+                       level=128):
+    """Build a render callback stepping through colors, one step every frames_per_step frames.
+    colors is a list of (label, channel offset) pairs; each step sets every stride-th
+    channel from that offset up to end to level."""
+    packets = [ArtDmxPacket(universe) for universe in universes]
+    data_bytes = bytearray(512)
+    last_step = [None]
+
+    def render(frame_index):
+        step = (frame_index // frames_per_step) % len(colors)
+        if step != last_step[0]:
+            last_step[0] = step
+            label, offset = colors[step]
+            data_bytes[:] = bytes(512)
+            data_bytes[offset:end:stride] = bytes([level]) * len(
+                range(offset, end, stride))
+            for packet in packets:
+                packet.set_data(data_bytes)
+            print(f"Sent {label}={level}")
+        return packets
+
+    return render
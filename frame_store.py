@@ -0,0 +1,224 @@
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from artnet_packet_tx import ArtDmxPacket, artnet_dmx_packet_fmt
+
+UNIVERSE_SIZE = 512
+MAX_UNIVERSES = 32768
+# Every universe's slot is one whole ArtDmx packet
+SLOT_SIZE = struct.calcsize(artnet_dmx_packet_fmt)
+DATA_OFFSET = ArtDmxPacket.DATA_OFFSET
+
+# Layout, native byte order, every section starting on a 64-byte boundary:
+#   header       magic, version, universe count, slot size; frame counter (uint64) at FRAME_COUNTER_OFFSET,
+#                odd while a frame is being written
+#   universes    universe number of each slot (uint16 per slot)
+#   dirty flags  one byte per slot, non-zero once the producer has written the slot
+#   slots        one ArtDmx packet per universe, DMX data at DATA_OFFSET in each
+MAGIC = b"ArtFrame"
+VERSION = 2
+HEADER = struct.Struct("=8sHHII")
+FRAME_COUNTER = struct.Struct("=Q")
+FRAME_COUNTER_OFFSET = 24
+HEADER_SIZE = 64
+ALIGN = 64
+SNAPSHOT_TIMEOUT = 0.005  # seconds snapshot() waits for the producer to finish a frame
+
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(count):
+    """(universe table, dirty flags, slots, total size) offsets for count universes."""
+    table = HEADER_SIZE
+    dirty = _align(table + 2 * count)
+    slots = _align(dirty + count)
+    return table, dirty, slots, slots + count * SLOT_SIZE
+
+
+def _open_shared_memory(name, track):
+    try:
+        return shared_memory.SharedMemory(name=name, track=track)
+    except TypeError:
+        # Before Python 3.13 attaching always registers the block with this process's resource tracker,
+        # which would unlink it from under its creator when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        if not track:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameStore:
+    """Named shared-memory block holding DMX data for a set of universes (all 32768 by default).
+
+    Each universe has a slot that is a complete ArtDmx packet, so a sender
+    sends straight out of the block with no copy, and the block describes
+    itself in a header, so any process can attach by name alone
+    (FrameStore.attach). A producer writes DMX data in place through
+    universe_data() views (or a numpy view of the slots, see
+    dmx_patterns.store_array), flags what it wrote with mark_dirty() (write()
+    does both), bracketing each frame with begin_write() and commit(). The
+    packet headers belong to the sender, one per universe. Views handed out
+    must be released before close().
+
+    The frame counter is a sequence lock between one producer and any number
+    of senders. The producer makes it odd before writing the first byte of
+    a frame and even again after the last; a sender copies slots out with
+    snapshot(), which retries until it gets a copy taken while the counter
+    held one even value, so no packet mixes two frames. An external
+    producer writing the block directly follows the same contract: add 1
+    to the uint64 at FRAME_COUNTER_OFFSET (making it odd), write slot data
+    and dirty flags, then add 1 again, with a store barrier after the first
+    increment and before the second.
+    """
+
+    def __init__(self, universes=None, name=None):
+        if universes is None:
+            universes = range(MAX_UNIVERSES)
+        universes = list(universes)
+        if not universes:
+            raise ValueError("A frame store needs at least one universe")
+        if len(set(universes)) != len(universes):
+            raise ValueError("Duplicate universes in frame store")
+        table, _, slots, size = _layout(len(universes))
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, 0, len(universes),
+                         SLOT_SIZE)
+        struct.pack_into(f"={len(universes)}H", shm.buf, table, *universes)
+        for i, universe in enumerate(universes):
+            start = slots + i * SLOT_SIZE
+            packet = ArtDmxPacket(universe,
+                                  buffer=shm.buf[start:start + SLOT_SIZE])
+            packet.set_length(UNIVERSE_SIZE)
+        self._setup(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name, track=False):
+        """Attach to the store another process created as name. Only the creator removes the block; pass
+        track=True from processes that share the creator's resource tracker (its multiprocessing children)."""
+        store = cls.__new__(cls)
+        store._setup(_open_shared_memory(name, track), owner=False)
+        return store
+
+    def _setup(self, shm, owner):
+        self._shm = shm
+        self.name = shm.name
+        self.owner = owner
+        magic, version, _, count, slot_size = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            shm.close()
+            raise ValueError(
+                f"Shared memory {shm.name} is not a version {VERSION} frame store"
+            )
+        table, dirty, slots, size = _layout(count)
+        self.universes = list(struct.unpack_from(f"={count}H", shm.buf, table))
+        self.index = {universe: i for i, universe in enumerate(self.universes)}
+        self._buf = shm.buf[:size]
+        self._dirty = self._buf[dirty:dirty + count]
+        self.slots = self._buf[slots:size]
+
+    @property
+    def frame_counter(self):
+        return FRAME_COUNTER.unpack_from(self._buf, FRAME_COUNTER_OFFSET)[0]
+
+    @property
+    def frames(self):
+        """Frames committed so far."""
+        return self.frame_counter // 2
+
+    def begin_write(self):
+        """Start writing a frame (single producer): the frame counter stays odd until commit()."""
+        counter = self.frame_counter
+        if not counter & 1:
+            counter += 1
+            FRAME_COUNTER.pack_into(self._buf, FRAME_COUNTER_OFFSET, counter)
+        return counter
+
+    def commit(self):
+        """Finish the frame begun with begin_write() (or count one written without it). Returns the new,
+        even, frame counter."""
+        counter = self.frame_counter
+        counter += 1 if counter & 1 else 2
+        FRAME_COUNTER.pack_into(self._buf, FRAME_COUNTER_OFFSET, counter)
+        return counter
+
+    def snapshot(self, universes, out, timeout=SNAPSHOT_TIMEOUT):
+        """Copy the slots of universes, which must be consecutive in the store, into out (writable, one
+        SLOT_SIZE slot per universe). Retries while the producer is mid-frame; returns False if it still
+        was after timeout seconds, in which case out holds a copy that may mix two frames."""
+        start = self.index[universes[0]]
+        if self.index[universes[-1]] != start + len(universes) - 1:
+            raise ValueError(
+                "Snapshot universes must be consecutive in the store")
+        end = (start + len(universes)) * SLOT_SIZE
+        deadline = None
+        with self.slots[start * SLOT_SIZE:end] as source:
+            while True:
+                before = self.frame_counter
+                if not before & 1:
+                    out[:] = source
+                    if self.frame_counter == before:
+                        return True
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + timeout
+                elif now >= deadline:
+                    out[:] = source
+                    return False
+                time.sleep(0)
+
+    def packet_buffer(self, universe):
+        """Writable memoryview over universe's whole slot, an ArtDmx packet (see ArtDmxPacket initialise)."""
+        start = self.index[universe] * SLOT_SIZE
+        return self.slots[start:start + SLOT_SIZE]
+
+    def universe_data(self, universe):
+        """Writable 512-byte memoryview over universe's DMX data."""
+        start = self.index[universe] * SLOT_SIZE + DATA_OFFSET
+        return self.slots[start:start + UNIVERSE_SIZE]
+
+    def write(self, universe, data):
+        """Copy data (<= 512 bytes, the rest of the universe is left as is) in and mark universe dirty."""
+        start = self.index[universe] * SLOT_SIZE + DATA_OFFSET
+        self.slots[start:start + len(data)] = data
+        self._dirty[self.index[universe]] = 1
+
+    def mark_dirty(self, universes=None):
+        """Flag universes (default all) as written since the sender last took them."""
+        if universes is None:
+            self._dirty[:] = b"\x01" * len(self.universes)
+            return
+        for universe in universes:
+            self._dirty[self.index[universe]] = 1
+
+    def take_dirty(self, universes=None):
+        """Universes (from universes, default all) flagged dirty, clearing just those flags."""
+        flags = self._dirty
+        snapshot = bytes(flags)
+        out = []
+        for universe in (self.universes if universes is None else universes):
+            i = self.index[universe]
+            if snapshot[i]:
+                flags[i] = 0
+                out.append(universe)
+        return out
+
+    def close(self):
+        """Detach from the block; the creator also unlinks (removes) it."""
+        if self._buf is None:
+            return
+        self.slots.release()
+        self._dirty.release()
+        self._buf.release()
+        self._buf = None
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
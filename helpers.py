@@ -1,10 +1,8 @@
+from contextlib import contextmanager
 from ipaddress import ip_address, IPv4Address, IPv4Network
 import select
 import socket
 import sys
-import termios
-import time
-import tty
 import netifaces
 
 DEST_PORT = 6454
@@ -25,15 +23,15 @@ def _interface_priority(ip):
     return 2
 
 
-def list_local_interfaces():
-    """Return [(iface, ip, netmask), ...] for non-loopback IPv4 interfaces, sorted by priority."""
+def list_local_interfaces(include_loopback=False):
+    """Return [(iface, ip, netmask), ...] for IPv4 interfaces (loopback only if include_loopback), sorted by priority."""
     out = []
     for iface in netifaces.interfaces():
         addrs = netifaces.ifaddresses(iface).get(netifaces.AF_INET, [])
         for addr_info in addrs:
             ip = addr_info.get('addr')
             netmask = addr_info.get('netmask')
-            if not ip or ip.startswith("127."):
+            if not ip or (ip.startswith("127.") and not include_loopback):
                 continue
             out.append((iface, ip, netmask))
     out.sort(key=lambda t: (_interface_priority(t[1]), t[1]))
@@ -42,7 +40,6 @@ def list_local_interfaces():
 
 def choose_interface_at_startup():
     """Prompt the user to pick a local interface; record bound_* state and return (iface, ip, netmask)."""
-    global bound_iface, bound_local_ip, bound_netmask, bound_broadcast
     ifaces = list_local_interfaces()
     if not ifaces:
         raise RuntimeError("No non-loopback IPv4 interfaces found")
@@ -63,12 +60,29 @@ def choose_interface_at_startup():
                                          range(1,
                                                len(ifaces) + 1))
 
-    iface, ip, netmask = ifaces[idx - 1]
+    return _bind_interface(*ifaces[idx - 1])
+
+
+def choose_interface(spec=None):
+    """Non-interactive choose_interface_at_startup(): pick the interface named spec or holding the IP spec
+    (loopback included), or the highest-priority non-loopback one if spec is None. Returns (iface, ip, netmask)."""
+    if spec is None:
+        ifaces = list_local_interfaces()
+        if not ifaces:
+            raise RuntimeError("No non-loopback IPv4 interfaces found")
+        return _bind_interface(*ifaces[0])
+    for iface, ip, netmask in list_local_interfaces(include_loopback=True):
+        if spec in (iface, ip):
+            return _bind_interface(iface, ip, netmask)
+    raise RuntimeError(f"No IPv4 interface named or addressed {spec}")
+
+
+def _bind_interface(iface, ip, netmask):
+    global bound_iface, bound_local_ip, bound_netmask, bound_broadcast
     bound_iface = iface
     bound_local_ip = ip
     bound_netmask = netmask
-    bound_broadcast = str(
-        IPv4Network(f"{ip}/{netmask}", strict=False).broadcast_address)
+    bound_broadcast = _broadcast_address(ip, netmask)
     return iface, ip, netmask
 
 
@@ -78,20 +92,65 @@ def open_connection():
         raise RuntimeError(
             "open_connection() called before choose_interface_at_startup()")
 
+    sock, if_index = open_interface_socket(bound_iface, bound_local_ip)
+
+    print(
+        f"UDP socket bound to {bound_local_ip}:{DEST_PORT} on interface {bound_iface} (index {if_index})"
+    )
+    return sock
+
+
+def open_all_interfaces():
+    """Open one UDP socket per entry from list_local_interfaces().
+    Returns [{'iface', 'ip', 'netmask', 'broadcast', 'sock'}, ...]; close the sockets when done."""
+    opened = []
+    for iface, ip, netmask in list_local_interfaces():
+        try:
+            sock, _ = open_interface_socket(iface, ip)
+        except OSError as e:
+            print(f"Skipping {iface} ({ip}): {e}")
+            continue
+        opened.append({
+            'iface': iface,
+            'ip': ip,
+            'netmask': netmask,
+            'broadcast': _broadcast_address(ip, netmask),
+            'sock': sock,
+        })
+    return opened
+
+
+def open_interface_socket(iface, ip):
+    """Open a broadcast-capable UDP socket bound to ip on iface. Returns (sock, interface index)."""
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
     sock.settimeout(2.0)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
 
-    if_index = socket.if_nametoindex(bound_iface)
+    if_index = socket.if_nametoindex(iface)
     sock.setsockopt(socket.IPPROTO_IP, IP_BOUND_IF, if_index)
-    sock.bind((bound_local_ip, 0))
+    sock.bind((ip, 0))
+    return sock, if_index
 
-    print(
-        f"UDP socket bound to {bound_local_ip}:{DEST_PORT} on interface {bound_iface} (index {if_index})"
-    )
+
+def open_listen_socket(port=DEST_PORT):
+    """Open a UDP socket receiving on port (default 6454) on the previously-chosen interface.
+    Bound to the wildcard address so broadcast ArtDmx is received too."""
+    if bound_iface is None:
+        raise RuntimeError(
+            "open_listen_socket() called before choose_interface_at_startup()")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if_index = socket.if_nametoindex(bound_iface)
+    sock.setsockopt(socket.IPPROTO_IP, IP_BOUND_IF, if_index)
+    sock.bind(("", port))
     return sock
 
 
+def _broadcast_address(ip, netmask):
+    return str(IPv4Network(f"{ip}/{netmask}", strict=False).broadcast_address)
+
+
 def ip_in_bound_subnet(ip_str):
     """True if ip_str falls inside the bound interface's subnet."""
     if bound_local_ip is None or bound_netmask is None:
@@ -122,54 +181,49 @@ def send_packet(packet, sock, target_ip, expect_response):
             return response
 
 
-def scan_for_artnodes(sock):
-    """Broadcast 3 ArtPolls 0.5s apart on the bound interface, collect unique responders.
-    Returns list of dicts: [{'ip': str, 'short_name': str, 'long_name': str}, ...]
+def scan_for_artnodes(sock, **scan_kwargs):
+    """Broadcast ArtPolls on the bound interface and collect unique responders, printing nodes as they appear.
+    Stops early once the responder set has been stable for a quiet period (see artnet_scan.scan_events).
+    Returns list of dicts: [{'ip': str, 'short_name': str, 'long_name': str, 'mac': str, 'iface': str,
+    'universes': [int, ...]}, ...]
     """
-    from artnet_packet_tx import ArtPollPacket
-    from artnet_packet_rx import ArtPollReplyPacket
-
-    poll_bytes = ArtPollPacket().pack()
-    discovered = {}
-    old_timeout = sock.gettimeout()
-    sock.settimeout(0.1)
+    import artnet_scan
 
-    try:
-        scan_start = time.time()
-        polls_sent = 0
-        next_poll_at = scan_start
-        # 3 polls every 0.5s = 1.5s of sending, then keep listening 0.5s after last poll
-        scan_deadline = scan_start + 2.0
-
-        while time.time() < scan_deadline:
-            now = time.time()
-            if polls_sent < 3 and now >= next_poll_at:
-                sock.sendto(poll_bytes, (bound_broadcast, DEST_PORT))
-                polls_sent += 1
-                next_poll_at = now + 0.5
-                print(f"  Sent ArtPoll {polls_sent}/3 to {bound_broadcast}")
+    return artnet_scan.scan_targets([(sock, bound_broadcast, bound_iface)],
+                                    print_scan_event, **scan_kwargs)
 
-            try:
-                data, addr = sock.recvfrom(1024)
-            except (TimeoutError, socket.timeout):
-                continue
 
-            try:
-                reply = ArtPollReplyPacket(data)
-                ip_str = str(IPv4Address(reply.ip_addr))
-            except Exception:
-                continue
+def scan_all_interfaces(**scan_kwargs):
+    """Scan every local interface in parallel, one socket each, through a single selector.
+    Returns the merged node list; each node dict also carries the 'iface' it was found on."""
+    import artnet_scan
 
-            if ip_str not in discovered:
-                discovered[ip_str] = {
-                    'ip': ip_str,
-                    'short_name': getattr(reply, 'port_name', ''),
-                    'long_name': getattr(reply, 'long_name', ''),
-                }
+    opened = open_all_interfaces()
+    try:
+        targets = [(o['sock'], o['broadcast'], o['iface']) for o in opened]
+        return artnet_scan.scan_targets(targets, print_scan_event,
+                                        **scan_kwargs)
     finally:
-        sock.settimeout(old_timeout)
+        for o in opened:
+            o['sock'].close()
 
-    return list(discovered.values())
+
+def print_scan_event(event):
+    kind = event['event']
+    if kind == 'poll':
+        print(
+            f"  Sent ArtPoll {event['sent']}/{event['total']} to {', '.join(event['targets'])}"
+        )
+    elif kind == 'node':
+        node = event['node']
+        name = node['short_name'] or node['long_name']
+        iface = f"[{node['iface']}]  " if node.get('iface') else ""
+        print(f"  Found {node['ip']:<15}  {iface}{name}")
+    elif kind == 'done':
+        print(
+            f"  {event['replies']} replies ({event['duplicate']} duplicate, {event['ignored']} ignored) "
+            f"in {event['elapsed']:.2f}s, {event['replies_per_sec']:.0f} replies/sec"
+        )
 
 
 def prompt_for_number(prompt_text):
@@ -243,6 +297,24 @@ def prompt_for_numbers_in_range(prompt_text, allowed_values):
             return parsed
 
 
+# Accepts either a single float or exactly `count` space-delimited floats, all within [low, high]
+def prompt_for_float_in_range(prompt_text, low, high, count=1):
+    while True:
+        tokens = input(prompt_text).split()
+        if len(tokens) not in (1, count):
+            print(f"Enter 1 or {count} values")
+            continue
+        try:
+            values = [float(token) for token in tokens]
+        except ValueError:
+            print("Not a valid number")
+            continue
+        if any(v < low or v > high for v in values):
+            print(f"Values must be between {low} and {high}")
+            continue
+        return values[0] if len(values) == 1 else values
+
+
 def prompt_for_ip(prompt_text):
     valid_input = False
     while not valid_input:
@@ -258,6 +330,10 @@ def prompt_for_ip(prompt_text):
 
 def wait_or_key_pressed(timeout_sec):
     """Wait up to timeout_sec; return True if any key was pressed, False on timeout."""
+    # Terminal modules are only needed interactively, so headless runs don't pay for importing them
+    import termios
+    import tty
+
     fd = sys.stdin.fileno()
     old_settings = termios.tcgetattr(fd)
     try:
@@ -271,13 +347,35 @@ def wait_or_key_pressed(timeout_sec):
         termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
 
 
+@contextmanager
+def stdin_cbreak():
+    """Put the terminal in cbreak mode for the duration, so single key presses can be select()ed on sys.stdin."""
+    import termios
+    import tty
+
+    fd = sys.stdin.fileno()
+    old_settings = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        yield sys.stdin
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, old_settings)
+
+
 def print_discovered(discovered):
     if not discovered:
         print("(no devices discovered yet — run a scan)")
         return
     for i, dev in enumerate(discovered, start=1):
         name = dev.get('short_name') or dev.get('long_name') or ""
-        print(f"  {i}) {dev['ip']:<15}  {name}")
+        iface = f"[{dev['iface']}]  " if dev.get('iface') else ""
+        print(f"  {i}) {dev['ip']:<15}  {iface}{name}")
+
+
+def print_batch_result(result):
+    print(
+        f"{result['sent']} sent, {result['short']} short, {result['failed']} failed"
+    )
 
 
 def print_selected(selected_ips):
@@ -319,6 +417,10 @@ def parse_selection_tokens(raw, source_ips):
     return chosen, True
 
 
+def decode_null_terminated(raw):
+    return raw.split(b'\x00', 1)[0].decode("utf-8", errors="replace")
+
+
 def bswap16(val):
     return ((val & 0xFF) << 8) | ((val & 0xFF00) >> 8)
 
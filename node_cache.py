@@ -0,0 +1,171 @@
+import json
+import os
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"),
+                                  ".artnet_tester_nodes.json")
+DEFAULT_TTL = 24 * 60 * 60  # seconds a node stays cached without being seen
+DEFAULT_MAX_ENTRIES = 4096
+
+# Order of the per-node arrays in the on-disk snapshot; snapshots from before 'universes' was added lack the last one
+_SNAPSHOT_FIELDS = ('ip', 'mac', 'short_name', 'long_name', 'iface',
+                    'first_seen', 'last_seen', 'ttl', 'universes')
+_NODE_DEFAULTS = {
+    'mac': '',
+    'short_name': '',
+    'long_name': '',
+    'iface': '',
+    'universes': (),
+}
+_NODE_FIELDS = tuple(_NODE_DEFAULTS)
+
+
+def _node_field(node, field):
+    value = node.get(field, _NODE_DEFAULTS[field])
+    # Each entry gets its own universes list, never one shared with the scan result or another entry
+    return list(value) if field == 'universes' else value
+
+
+class NodeCache:
+    """Discovered nodes keyed by IP (with a MAC index), persisted between runs.
+
+    Each entry is a dict with the scan fields ('ip', 'mac', 'short_name',
+    'long_name', 'iface', 'universes') plus 'first_seen'/'last_seen' wall-clock timestamps
+    and a per-entry 'ttl'. Entries that haven't been seen within their TTL
+    are dropped, and once max_entries is reached the least recently used entry
+    is evicted. The snapshot on disk is one compact JSON array per node so a
+    restart can target known nodes without waiting for a broadcast scan.
+    """
+
+    def __init__(self,
+                 path=DEFAULT_CACHE_PATH,
+                 ttl=DEFAULT_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # ip -> entry, least recently used first
+        self._ip_by_mac = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, ip):
+        return ip in self._entries
+
+    def update(self, node, now=None, ttl=None):
+        """Record a scan result. Returns 'new', 'changed' or 'unchanged'.
+        Only changed fields are rewritten; last_seen is always refreshed."""
+        now = time.time() if now is None else now
+        ip = node['ip']
+        mac = node.get('mac')
+
+        # Same hardware at a new address (e.g. DHCP lease changed): drop the stale IP
+        old_ip = self._ip_by_mac.get(mac) if mac else None
+        if old_ip is not None and old_ip != ip:
+            self._remove(old_ip)
+
+        entry = self._entries.get(ip)
+        if entry is None:
+            entry = {'ip': ip, 'first_seen': now}
+            for field in _NODE_FIELDS:
+                entry[field] = _node_field(node, field)
+            status = 'new'
+        else:
+            status = 'unchanged'
+            for field in _NODE_FIELDS:
+                value = _node_field(node, field)
+                if entry[field] != value:
+                    if field == 'mac' and entry['mac']:
+                        self._ip_by_mac.pop(entry['mac'], None)
+                    entry[field] = value
+                    status = 'changed'
+        entry['last_seen'] = now
+        entry['ttl'] = self.ttl if ttl is None else ttl
+
+        self._entries[ip] = entry
+        self._entries.move_to_end(ip)
+        if entry['mac']:
+            self._ip_by_mac[entry['mac']] = ip
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return status
+
+    def update_all(self, nodes, now=None):
+        """Record a whole scan. Returns {'new', 'changed', 'unchanged'} counts."""
+        counts = {'new': 0, 'changed': 0, 'unchanged': 0}
+        for node in nodes:
+            counts[self.update(node, now)] += 1
+        return counts
+
+    def get(self, ip):
+        entry = self._entries.get(ip)
+        if entry is not None:
+            self._entries.move_to_end(ip)
+        return entry
+
+    def get_by_mac(self, mac):
+        ip = self._ip_by_mac.get(mac)
+        return self.get(ip) if ip is not None else None
+
+    def expire(self, now=None):
+        """Drop entries not seen within their TTL. Returns how many were removed."""
+        now = time.time() if now is None else now
+        expired = [
+            ip for ip, entry in self._entries.items()
+            if now - entry['last_seen'] > entry['ttl']
+        ]
+        for ip in expired:
+            self._remove(ip)
+        return len(expired)
+
+    def nodes(self, now=None):
+        """Live entries, most recently seen last."""
+        self.expire(now)
+        return list(self._entries.values())
+
+    def _remove(self, ip):
+        entry = self._entries.pop(ip, None)
+        if entry is not None and self._ip_by_mac.get(entry['mac']) == ip:
+            del self._ip_by_mac[entry['mac']]
+
+    def load(self):
+        """Load the snapshot at self.path, skipping expired entries. Returns number of entries loaded."""
+        try:
+            with open(self.path, "r") as f:
+                rows = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable node cache {self.path}: {e}")
+            return 0
+
+        now = time.time()
+        for row in rows:
+            if len(row) == len(_SNAPSHOT_FIELDS) - 1:
+                row = row + [[]]
+            if len(row) != len(_SNAPSHOT_FIELDS):
+                continue
+            entry = dict(zip(_SNAPSHOT_FIELDS, row))
+            if now - entry['last_seen'] > entry['ttl']:
+                continue
+            self._entries[entry['ip']] = entry
+            if entry['mac']:
+                self._ip_by_mac[entry['mac']] = entry['ip']
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return len(self._entries)
+
+    def save(self):
+        """Write the snapshot atomically (temp file + rename)."""
+        self.expire()
+        rows = [[entry[field] for field in _SNAPSHOT_FIELDS]
+                for entry in self._entries.values()]
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(rows, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save node cache to {self.path}: {e}")
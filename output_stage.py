@@ -0,0 +1,90 @@
+class OutputTransform:
+    """Gamma, master dimmer and colour balance for outgoing DMX, as precomputed lookup tables.
+
+    Channels are split into classes by position within a pixel/fixture
+    footprint: with channels_per_pixel=3 channel i is class i % 3 (R, G, B),
+    with 4 it's R, G, B, W. Each class has its own gamma and balance and one
+    256-entry table combining those with the master level. Tables are rebuilt
+    only when a setting changes; applying them is one bytes.translate per
+    class per universe, so nothing is computed per channel in Python.
+    """
+
+    def __init__(self,
+                 channels_per_pixel=3,
+                 gamma=1.0,
+                 master=1.0,
+                 balance=None):
+        self.channels_per_pixel = channels_per_pixel
+        self.master = master
+        self.gamma = self._per_class(gamma)
+        self.balance = self._per_class(1.0 if balance is None else balance)
+        self._tables = None
+
+    def _per_class(self, value):
+        if isinstance(value, (int, float)):
+            return [float(value)] * self.channels_per_pixel
+        values = [float(v) for v in value]
+        if len(values) != self.channels_per_pixel:
+            raise ValueError(
+                f"Expected {self.channels_per_pixel} per-channel values, got {len(values)}"
+            )
+        return values
+
+    def set_layout(self, channels_per_pixel):
+        # Per-class settings don't carry over between layouts
+        self.channels_per_pixel = channels_per_pixel
+        self.gamma = self._per_class(1.0)
+        self.balance = self._per_class(1.0)
+        self._tables = None
+
+    def set_gamma(self, gamma):
+        """Gamma for every class (one number) or per class (one per channel in the pixel)."""
+        self.gamma = self._per_class(gamma)
+        self._tables = None
+
+    def set_balance(self, balance):
+        """Colour balance scale 0.0-1.0 for every class or per class."""
+        self.balance = self._per_class(balance)
+        self._tables = None
+
+    def set_master(self, master):
+        """Master dimmer 0.0-1.0."""
+        self.master = master
+        self._tables = None
+
+    def is_identity(self):
+        if self.master != 1.0:
+            return False
+        return all(value == 1.0 for value in self.gamma + self.balance)
+
+    def tables(self):
+        """The per-class 256-byte lookup tables, rebuilt only after a setting changed."""
+        if self._tables is None:
+            self._tables = [
+                self._build_table(gamma, balance)
+                for gamma, balance in zip(self.gamma, self.balance)
+            ]
+        return self._tables
+
+    def _build_table(self, gamma, balance):
+        scale = 255.0 * balance * self.master
+        return bytes(
+            min(255, max(0, int(round(scale * (v / 255.0)**gamma))))
+            for v in range(256))
+
+    def apply(self, src, dst=None):
+        """Translate a 512-channel DMX area (bytes-like) into dst (writable, defaults to src in place)."""
+        if dst is None:
+            dst = src
+        step = self.channels_per_pixel
+        for offset, table in enumerate(self.tables()):
+            dst[offset::step] = bytes(src[offset::step]).translate(table)
+
+    def apply_packet(self, packet):
+        """Transform an ArtDmxPacket's data in place. Only use on freshly built packets, or the
+        correction is applied again on every send."""
+        self.apply(packet.data)
+
+    def describe(self):
+        return (f"master {self.master:.2f}, gamma {self.gamma}, "
+                f"balance {self.balance} ({self.channels_per_pixel} ch/pixel)")
@@ -0,0 +1,135 @@
+import numpy as np
+
+from dmx_patterns import fill_hue, frame_array
+from dmx_stream import DmxFrame
+
+
+class PixelMap:
+    """Maps a width × height RGB(W) canvas onto (universe, channel) slots.
+
+    Panels are added with add_matrix(); each one covers a rectangle of the
+    canvas and is wired as a single chain starting at a universe/DMX address,
+    row by row (optionally serpentine) and wrapping to channel 1 of the next
+    universe when the current one is full. compile() turns the whole map into
+    one flat gather-index array over the canvas, so converting a canvas frame
+    into every universe's DMX data is a single np.take no matter how many
+    pixels the wall has.
+
+    Draw into self.canvas (shape (height, width, channels_per_pixel), uint8)
+    and call apply() to fill a (universes, 512) frame. Channels not driven by
+    any pixel are sent as 0.
+    """
+
+    def __init__(self, width, height, channels_per_pixel=3):
+        self.width = width
+        self.height = height
+        self.channels_per_pixel = channels_per_pixel
+        self._panels = []
+        # One spare trailing element that stays 0, used as the source for unmapped channels
+        self._source = np.zeros(width * height * channels_per_pixel + 1,
+                                dtype=np.uint8)
+        self.canvas = self._source[:-1].reshape(height, width,
+                                                channels_per_pixel)
+        self._zero_index = self._source.size - 1
+        self.universes = None
+        self._gather = None
+
+    def add_matrix(self,
+                   x=0,
+                   y=0,
+                   width=None,
+                   height=None,
+                   start_universe=0,
+                   start_address=1,
+                   serpentine=False,
+                   pixels_per_universe=None):
+        """Add a panel covering canvas[y:y+height, x:x+width], wired row by row from start_universe/start_address.
+        With serpentine every other row runs right-to-left. pixels_per_universe caps how many pixels go in one
+        universe before wrapping (default: as many whole pixels as fit in 512 channels)."""
+        width = self.width - x if width is None else width
+        height = self.height - y if height is None else height
+        if x < 0 or y < 0 or x + width > self.width or y + height > self.height:
+            raise ValueError(
+                f"Panel {width}x{height} at ({x}, {y}) does not fit the {self.width}x{self.height} canvas"
+            )
+        if not 1 <= start_address <= 512:
+            raise ValueError(
+                f"Start address must be 1-512, got {start_address}")
+        if pixels_per_universe is None:
+            pixels_per_universe = 512 // self.channels_per_pixel
+        self._panels.append((x, y, width, height, start_universe,
+                             start_address, serpentine, pixels_per_universe))
+        self._gather = None
+
+    def compile(self):
+        """Build the gather table. Called automatically by apply() after the map changes."""
+        cpp = self.channels_per_pixel
+        slots = {}  # (universe, channel 0-511) -> canvas pixel flat index
+        for (x, y, width, height, universe, address, serpentine,
+             pixels_per_universe) in self._panels:
+            channel = address - 1
+            in_universe = 0
+            for row in range(height):
+                cols = range(width)
+                if serpentine and row % 2 == 1:
+                    cols = reversed(cols)
+                for col in cols:
+                    if channel + cpp > 512 or in_universe >= pixels_per_universe:
+                        universe += 1
+                        channel = 0
+                        in_universe = 0
+                    pixel = (y + row) * self.width + (x + col)
+                    for c in range(cpp):
+                        slots[(universe, channel + c)] = pixel * cpp + c
+                    channel += cpp
+                    in_universe += 1
+
+        self.universes = sorted({universe for universe, _ in slots})
+        row_of = {universe: i for i, universe in enumerate(self.universes)}
+        gather = np.full((len(self.universes), 512),
+                         self._zero_index,
+                         dtype=np.intp)
+        if slots:
+            keys = np.array([(row_of[universe], channel)
+                             for universe, channel in slots],
+                            dtype=np.intp)
+            gather[keys[:, 0], keys[:, 1]] = np.fromiter(slots.values(),
+                                                         dtype=np.intp,
+                                                         count=len(slots))
+        self._gather = gather
+
+    def apply(self, out, canvas=None):
+        """Gather the canvas into out, a (len(self.universes), 512) uint8 array (e.g. frame_array of
+        new_frame()). canvas defaults to self.canvas; anything else is copied in first."""
+        if self._gather is None:
+            self.compile()
+        if canvas is not None and canvas is not self.canvas:
+            self.canvas[...] = canvas
+        np.take(self._source, self._gather, out=out, mode='clip')
+
+    def new_frame(self):
+        """A DmxFrame covering exactly the universes this map drives."""
+        if self._gather is None:
+            self.compile()
+        return DmxFrame(self.universes)
+
+
+def canvas_rainbow(canvas, t, speed=0.25):
+    """Test drawing: diagonal rainbow scrolling across the canvas."""
+    height, width, _ = canvas.shape
+    diag = (np.arange(width)[np.newaxis, :] +
+            np.arange(height)[:, np.newaxis]) / float(width + height)
+    fill_hue(canvas, (diag + t * speed) % 1.0)
+
+
+def pixel_map_render(pixel_map, draw, rate_hz):
+    """Build a DmxStreamer render callback: draw(canvas, t) paints the canvas, then one gather fills every universe."""
+    frame = pixel_map.new_frame()
+    out = frame_array(frame)
+
+    def render(frame_index):
+        draw(pixel_map.canvas, frame_index / rate_hz)
+        pixel_map.apply(out)
+        return frame.packets
+
+    return render
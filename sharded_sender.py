@@ -0,0 +1,308 @@
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+import helpers
+from artnet_packet_tx import ArtDmxPacket
+from dmx_stream import DmxFrame, DmxStreamer, FrameClock
+from frame_store import DATA_OFFSET, SLOT_SIZE, UNIVERSE_SIZE, FrameStore
+
+START_DELAY = 0.5  # seconds for every worker to attach and open its socket before frame 0
+REPORT_INTERVAL = 1.0
+JOIN_TIMEOUT = 5.0
+
+
+def shard_universes(universes, shards):
+    """Split universes into at most shards contiguous, nearly equal chunks."""
+    universes = list(universes)
+    shards = max(1, min(shards, len(universes)))
+    size, extra = divmod(len(universes), shards)
+    out = []
+    start = 0
+    for i in range(shards):
+        end = start + size + (1 if i < extra else 0)
+        out.append(universes[start:end])
+        start = end
+    return out
+
+
+class ShardedSender:
+    """Sends every universe of a FrameStore to target_ips from a pool of worker processes.
+
+    The store's universes are split into contiguous shards, one per worker.
+    Each worker attaches to the store by name and runs its own DmxStreamer
+    with its own socket and sequence counters. Each frame a worker takes a
+    snapshot of its shard's slots (FrameStore.snapshot, one copy of a
+    contiguous range) and sends its universes' packets out of that (or,
+    with an output transform, transformed copies of them), so a packet
+    never mixes two of the producer's frames; frames the producer was still
+    writing when the snapshot gave up are counted as torn_frames. With
+    send_on_change only universes the producer flagged dirty go out, plus a
+    keepalive refresh of the rest. All workers and the producer are given
+    one start time on the system-wide monotonic clock, so frame n goes out
+    from every shard at start + n/rate; the producer writes frame n half a
+    period before that deadline, clear of the workers' snapshots. Workers report
+    their DmxStreamer stats every REPORT_INTERVAL seconds; shard_stats holds
+    the latest per shard.
+    """
+
+    def __init__(self,
+                 store,
+                 target_ips,
+                 rate_hz,
+                 workers=None,
+                 transform=None,
+                 bind=None,
+                 send_on_change=False,
+                 keepalive=1.0):
+        if not target_ips:
+            raise ValueError("No target IPs to send to")
+        if rate_hz <= 0:
+            raise ValueError(f"Frame rate must be positive, got {rate_hz}")
+        self.store = store
+        self.target_ips = list(target_ips)
+        self.rate_hz = rate_hz
+        workers = workers or os.cpu_count() or 1
+        self.shards = shard_universes(store.universes, workers)
+        self.transform = transform
+        self.send_on_change = send_on_change
+        self.keepalive = keepalive
+        self.bind = bind if bind is not None else (helpers.bound_iface,
+                                                   helpers.bound_local_ip)
+        self.shard_stats = {}
+        self.producer_clock = None
+
+    def run(self, producer=None, duration=None, wait_fn=None, on_report=None):
+        """Start the workers and call producer(frame_index) between store.begin_write() and store.commit()
+        once per frame until duration seconds pass or wait_fn(timeout_sec) returns True; with no producer
+        the store is left to whatever else writes it (e.g. another process attached by name, following the
+        FrameStore contract). on_report(sender) is called every REPORT_INTERVAL. Returns stats()."""
+        ctx = multiprocessing.get_context()
+        stop = ctx.Event()
+        reports = ctx.Queue()
+        start_time = time.monotonic() + START_DELAY
+        processes = [
+            ctx.Process(target=_shard_worker,
+                        args=(shard, self.store.name, universes,
+                              self.target_ips, self.rate_hz, self.transform,
+                              self.send_on_change, self.keepalive, self.bind,
+                              start_time, duration, stop, reports),
+                        daemon=True)
+            for shard, universes in enumerate(self.shards)
+        ]
+        self.shard_stats = {}
+        for process in processes:
+            process.start()
+        try:
+            self._produce(producer, start_time, duration, wait_fn, reports,
+                          on_report)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            self._collect_final(reports, processes)
+        return self.stats()
+
+    def _produce(self, producer, start_time, duration, wait_fn, reports,
+                 on_report):
+        clock = FrameClock(self.rate_hz)
+        self.producer_clock = clock
+        clock.start(start_time - clock.period / 2)
+        end_time = None if duration is None else start_time + duration
+        next_report = start_time + REPORT_INTERVAL
+
+        def wait(timeout):
+            # Keep draining worker reports while waiting for the next frame
+            deadline = time.monotonic() + timeout
+            while True:
+                now = time.monotonic()
+                if end_time is not None and now >= end_time:
+                    return True
+                self._drain_reports(reports)
+                remaining = deadline - now
+                if remaining <= 0:
+                    return False
+                step = min(remaining, REPORT_INTERVAL)
+                if wait_fn is not None:
+                    if wait_fn(step):
+                        return True
+                else:
+                    time.sleep(step)
+
+        while True:
+            before_start = clock.start_time - time.monotonic()
+            if before_start > 0 and wait(before_start):
+                return
+            if producer is not None:
+                self.store.begin_write()
+                producer(clock.frame_index)
+                self.store.commit()
+            now = time.monotonic()
+            if on_report is not None and now >= next_report:
+                next_report = now + REPORT_INTERVAL
+                on_report(self)
+            if producer is None:
+                if wait(REPORT_INTERVAL):
+                    return
+            elif clock.wait_next(wait):
+                return
+
+    def _drain_reports(self, reports):
+        while True:
+            try:
+                shard, _, stats = reports.get_nowait()
+            except queue.Empty:
+                return
+            self.shard_stats[shard] = stats
+
+    def _collect_final(self, reports, processes):
+        finished = set()
+        deadline = time.monotonic() + JOIN_TIMEOUT
+        while len(finished) < len(processes):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                shard, final, stats = reports.get(timeout=remaining)
+            except queue.Empty:
+                break
+            self.shard_stats[shard] = stats
+            if final:
+                finished.add(shard)
+        for process in processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+    def stats(self):
+        shards = []
+        for shard, universes in enumerate(self.shards):
+            stats = self.shard_stats.get(shard)
+            if stats is None:
+                continue
+            shards.append({
+                'shard': shard,
+                'universes': len(universes),
+                'first_universe': universes[0],
+                'frames': stats['frames'],
+                'packets_sent': stats['packets_sent'],
+                'packets_failed': stats['packets_failed'],
+                'packets_per_sec': stats['packets_per_sec'],
+                'late_frames': stats['late_frames'],
+                'torn_frames': stats['torn_frames'],
+                'avg_lag_ms': stats['avg_lag_ms'],
+                'max_lag_ms': stats['max_lag_ms'],
+            })
+        producer_late = self.producer_clock.late_frames if self.producer_clock else 0
+        store_frames = self.store.frames
+        max_lag = max((s['max_lag_ms'] for s in shards), default=0.0)
+        totals = {
+            'workers': len(self.shards),
+            'universes': len(self.store.universes),
+            'targets': len(self.target_ips),
+            'target_fps': self.rate_hz,
+            'reporting_shards': len(shards),
+            'max_lag_ms': max_lag,
+            'producer_late_frames': producer_late,
+            'store_frames': store_frames,
+        }
+        for name in ('packets_sent', 'packets_failed', 'packets_per_sec',
+                     'late_frames', 'torn_frames'):
+            totals[name] = sum(s[name] for s in shards)
+        totals['shards'] = shards
+        return totals
+
+
+def _shard_worker(shard, store_name, universes, target_ips, rate_hz, transform,
+                  send_on_change, keepalive, bind, start_time, duration, stop,
+                  reports):
+    # The parent owns shutdown: ctrl+c there sets stop, which ends every worker cleanly with a final report
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    store = FrameStore.attach(store_name, track=True)
+    sock, _ = helpers.open_interface_socket(*bind)
+    if transform is not None and transform.is_identity():
+        transform = None
+    # The shard's slots, copied out of the store each frame; they're already ArtDmx packets
+    snapshot = memoryview(bytearray(len(universes) * SLOT_SIZE))
+    slots = [
+        snapshot[i * SLOT_SIZE:(i + 1) * SLOT_SIZE]
+        for i in range(len(universes))
+    ]
+    if transform is None:
+        sources = []
+        packets = [
+            ArtDmxPacket(universe, buffer=slot, initialise=False)
+            for universe, slot in zip(universes, slots)
+        ]
+    else:
+        sources = [
+            slot[DATA_OFFSET:DATA_OFFSET + UNIVERSE_SIZE] for slot in slots
+        ]
+        packets = DmxFrame(universes).packets
+    by_universe = dict(zip(universes, packets))
+    last_sent = dict.fromkeys(universes, 0.0)
+    streamer = None
+    torn_frames = [0]
+    # Waiting out the producer may eat into the frame, but only so far
+    snapshot_timeout = 0.25 / rate_hz
+    next_report = [start_time + REPORT_INTERVAL]
+
+    def shard_stats():
+        stats = streamer.stats()
+        stats['torn_frames'] = torn_frames[0]
+        return stats
+
+    def render(frame_index):
+        # Dirty flags first: one set after this is left for the next frame, whose snapshot has its data
+        send = set(store.take_dirty(universes)) if send_on_change else None
+        if not store.snapshot(universes, snapshot, snapshot_timeout):
+            torn_frames[0] += 1
+        for packet, source in zip(packets, sources):
+            transform.apply(source, packet.data)
+        now = time.monotonic()
+        if now >= next_report[0]:
+            next_report[0] = now + REPORT_INTERVAL
+            reports.put((shard, False, shard_stats()))
+        if not send_on_change:
+            return packets
+        # Dirty universes, plus a keepalive refresh of the rest so nodes don't time out their outputs
+        out = []
+        for universe, packet in by_universe.items():
+            if universe in send or now - last_sent[universe] >= keepalive:
+                last_sent[universe] = now
+                out.append(packet)
+        return out
+
+    # Without send_on_change every frame resends the same snapshot buffers, the batch sendmmsg is fastest on
+    streamer = DmxStreamer(sock,
+                           target_ips,
+                           render,
+                           rate_hz,
+                           use_sendmmsg=not send_on_change)
+    try:
+        streamer.run(wait_fn=stop.wait,
+                     duration=duration,
+                     start_time=start_time)
+        reports.put((shard, True, shard_stats()))
+    finally:
+        sock.close()
+        store.close()
+
+
+def print_sharded_stats(stats):
+    print(
+        f"{stats['workers']} worker(s), {stats['universes']} universe(s) x {stats['targets']} target(s) "
+        f"at {stats['target_fps']} fps: {stats['packets_per_sec']:.0f} packets/sec, "
+        f"{stats['packets_sent']} sent, {stats['packets_failed']} failed, {stats['late_frames']} late frame(s), "
+        f"{stats['torn_frames']} torn frame(s), "
+        f"worst lag {stats['max_lag_ms']:.2f} ms, {stats['store_frames']} frame(s) committed"
+    )
+    for shard in stats['shards']:
+        print(
+            f"  shard {shard['shard']:>2}: {shard['universes']:>5} universe(s) from {shard['first_universe']:<5} "
+            f"{shard['packets_per_sec']:>9.0f} packets/sec, {shard['late_frames']} late, "
+            f"lag avg {shard['avg_lag_ms']:.2f} ms, max {shard['max_lag_ms']:.2f} ms"
+        )
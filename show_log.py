@@ -0,0 +1,283 @@
+from array import array
+import mmap
+import os
+import struct
+import time
+
+from artnet_packet_tx import ArtDmxPacket
+from batch_send import BatchSender
+from dmx_sequence import SequenceCounter
+
+# File layout, all big-endian:
+#   header:  magic, version, payload size (512)
+#   records: timestamp (float64 seconds since the first record), universe, length, 512-byte payload
+#   footer:  index entries (timestamp, record number), one per index_interval seconds of show,
+#            then index offset, entry count and index magic
+# Records are fixed-size, so a file cut short by a crash (no footer) is still readable up to its last whole record.
+SHOW_MAGIC = b"ArtShow\x00"
+INDEX_MAGIC = b"ArtIndex"
+SHOW_VERSION = 1
+PAYLOAD_SIZE = 512
+
+_header = struct.Struct("!8sHH")
+_record_header = struct.Struct("!dHH")
+_index_entry = struct.Struct("!dQ")
+_trailer = struct.Struct("!QI8s")
+RECORD_SIZE = _record_header.size + PAYLOAD_SIZE
+
+# Records recorded within this many seconds of each other are replayed as one batch
+PLAYBACK_GROUP_WINDOW = 0.001
+
+_zero_payload = memoryview(bytes(PAYLOAD_SIZE))
+
+
+class ShowRecorder:
+    """Appends ArtDmx frames to a show file as they happen.
+
+    Every record is written straight through a buffered file with one
+    reused record buffer, so memory use doesn't grow with the length of the
+    show apart from the seek index (16 bytes per index_interval seconds).
+    The index is written as a footer by close().
+    """
+
+    def __init__(self, path, index_interval=1.0):
+        self.path = path
+        self.index_interval = index_interval
+        self._file = open(path, "wb")
+        self._file.write(_header.pack(SHOW_MAGIC, SHOW_VERSION, PAYLOAD_SIZE))
+        self._record = bytearray(RECORD_SIZE)
+        self._payload = memoryview(self._record)[_record_header.size:]
+        self._index_times = array('d')
+        self._index_records = array('Q')
+        self._start = None
+        self._last_time = 0.0
+        self._next_index_time = 0.0
+        self.records = 0
+
+    def record(self, universe, data, length=None, timestamp=None):
+        """Append one universe's DMX data (bytes-like, up to 512). timestamp is any clock in seconds
+        (default time.monotonic()) as long as it's the same clock for the whole recording."""
+        now = time.monotonic() if timestamp is None else timestamp
+        if self._start is None:
+            self._start = now
+        # Keep file timestamps non-decreasing so playback and seeking can rely on the order
+        t = max(now - self._start, self._last_time)
+        self._last_time = t
+        if t >= self._next_index_time:
+            self._index_times.append(t)
+            self._index_records.append(self.records)
+            self._next_index_time = t + self.index_interval
+
+        size = min(len(data), PAYLOAD_SIZE)
+        length = size if length is None else length
+        _record_header.pack_into(self._record, 0, t, universe, length)
+        self._payload[:size] = data[:size]
+        self._payload[size:] = _zero_payload[size:]
+        self._file.write(self._record)
+        self.records += 1
+
+    def record_packet(self, packet, timestamp=None):
+        length = packet.length
+        self.record(packet.universe, packet.data[:length], length, timestamp)
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        for t, record in zip(self._index_times, self._index_records):
+            self._file.write(_index_entry.pack(t, record))
+        self._file.write(
+            _trailer.pack(index_offset, len(self._index_times), INDEX_MAGIC))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShowPlayer:
+    """Replays a show file through ArtDmxPackets, reading it via mmap.
+
+    Nothing is loaded up front: records are unpacked straight out of the
+    mapping as playback reaches them, and seeking does a binary search over
+    the index footer and then over the records inside one index interval, so
+    an hour-long show costs the same memory as a ten-second one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < _header.size:
+                raise ValueError(f"{path} is too short to be a show file")
+            self._mm = mmap.mmap(self._file.fileno(),
+                                 0,
+                                 access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._file.close()
+            raise
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._mm.madvise(mmap.MADV_SEQUENTIAL)
+
+        magic, version, payload_size = _header.unpack_from(self._mm, 0)
+        if magic != SHOW_MAGIC or version != SHOW_VERSION or payload_size != PAYLOAD_SIZE:
+            self.close()
+            raise ValueError(
+                f"{path} is not a version {SHOW_VERSION} show file")
+
+        records_end = size
+        self.index_offset = None
+        self.index_entries = 0
+        if size >= _header.size + _trailer.size:
+            index_offset, entries, index_magic = _trailer.unpack_from(
+                self._mm, size - _trailer.size)
+            if index_magic == INDEX_MAGIC:
+                records_end = index_offset
+                self.index_offset = index_offset
+                self.index_entries = entries
+        self.record_count = (records_end - _header.size) // RECORD_SIZE
+
+    def timestamp(self, i):
+        return _record_header.unpack_from(self._mm, _record_offset(i))[0]
+
+    def duration(self):
+        if not self.record_count:
+            return 0.0
+        return self.timestamp(self.record_count - 1)
+
+    def seek(self, t):
+        """Index of the first record at or after t seconds."""
+        lo, hi = 0, self.record_count
+        if self.index_entries:
+            # Narrow to one index interval first: the index sits together at the end of the file
+            entry_lo, entry_hi = 0, self.index_entries
+            while entry_lo < entry_hi:
+                mid = (entry_lo + entry_hi) // 2
+                if self._index_entry(mid)[0] < t:
+                    entry_lo = mid + 1
+                else:
+                    entry_hi = mid
+            if entry_lo > 0:
+                lo = self._index_entry(entry_lo - 1)[1]
+            if entry_lo < self.index_entries:
+                hi = self._index_entry(entry_lo)[1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp(mid) < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _index_entry(self, i):
+        return _index_entry.unpack_from(
+            self._mm, self.index_offset + i * _index_entry.size)
+
+    def play(self,
+             sock,
+             target_ips,
+             start=0.0,
+             speed=1.0,
+             wait_fn=None,
+             duration=None):
+        """Send the show from start seconds to every IP in target_ips, speed times faster than recorded.
+        wait_fn(timeout_sec) replaces time.sleep and stops playback by returning True. Returns a stats dict."""
+        if speed <= 0:
+            raise ValueError(f"Speed must be positive, got {speed}")
+        if not target_ips:
+            raise ValueError("No target IPs to play to")
+        sender = BatchSender(sock)
+        sequences = SequenceCounter()
+        packets = {}  # universe -> reused ArtDmxPacket
+        view = memoryview(self._mm)
+        stats = {
+            'records': 0,
+            'sent': 0,
+            'short': 0,
+            'failed': 0,
+            'late_batches': 0
+        }
+
+        i = self.seek(start)
+        play_start = time.monotonic()
+        try:
+            while i < self.record_count:
+                t = self.timestamp(i)
+                if duration is not None and t - start >= duration:
+                    break
+                remaining = play_start + (t - start) / speed - time.monotonic()
+                if remaining > 0:
+                    if wait_fn is not None:
+                        if wait_fn(remaining):
+                            break
+                    else:
+                        time.sleep(remaining)
+                elif remaining < -PLAYBACK_GROUP_WINDOW:
+                    stats['late_batches'] += 1
+
+                batch, next_i = self._read_batch(i, view, packets, sequences,
+                                                 target_ips)
+                stats['records'] += next_i - i
+                i = next_i
+                result = sender.send(batch)
+                stats['sent'] += result['sent']
+                stats['short'] += result['short']
+                stats['failed'] += result['failed']
+        finally:
+            # An exported view would stop close() from unmapping the file
+            view.release()
+        stats['elapsed'] = time.monotonic() - play_start
+        played_to = self.timestamp(i - 1) if i else start
+        stats['show_time'] = max(0.0, played_to - start)
+        return stats
+
+    def _read_batch(self, i, view, packets, sequences, target_ips):
+        # Load records from i that fall within one group window into their universe's packet. A universe that
+        # repeats within the window ends the batch, since its packet buffer is still waiting to be sent
+        batch = []
+        batch_universes = set()
+        first_time = self.timestamp(i)
+        while i < self.record_count:
+            offset = _record_offset(i)
+            t, universe, length = _record_header.unpack_from(self._mm, offset)
+            if t - first_time > PLAYBACK_GROUP_WINDOW or universe in batch_universes:
+                break
+            packet = packets.get(universe)
+            if packet is None:
+                packet = ArtDmxPacket(universe)
+                packets[universe] = packet
+            data_start = offset + _record_header.size
+            data_end = data_start + min(length, PAYLOAD_SIZE)
+            packet.set_data(view[data_start:data_end])
+            packet.sequence = sequences.advance(universe, target_ips)[0]
+            packet_bytes = packet.pack()
+            batch.extend((packet_bytes, ip) for ip in target_ips)
+            batch_universes.add(universe)
+            i += 1
+        return batch, i
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _record_offset(i):
+    return _header.size + i * RECORD_SIZE
+
+
+def print_play_stats(stats):
+    print(
+        f"Replayed {stats['records']} universe frame(s) ({stats['show_time']:.2f}s of show) in {stats['elapsed']:.2f}s, "
+        f"{stats['late_batches']} late batch(es)")
+    print(
+        f"{stats['sent']} packet(s) sent, {stats['short']} short, {stats['failed']} failed"
+    )
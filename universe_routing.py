@@ -0,0 +1,192 @@
+from ipaddress import IPv4Address
+
+import helpers
+from artnet_packet_rx import routing_fields
+
+
+class RoutingTable:
+    """Which nodes output which universes, from their ArtPollReplies: universe -> [node IPs].
+
+    A reply lists up to four output ports for one bind index of a node, so a
+    node with more ports answers once per bind index; the table keeps each
+    bind index's universes and subscribes the node to their union. update()
+    only touches the index entries of universes a node gained or lost, so
+    replies can be fed in as they arrive (or on every rescan) without a
+    rebuild. version goes up on every change, letting senders cache what
+    they derive from the table.
+    """
+
+    def __init__(self):
+        self._binds = {}  # ip -> {bind_index: frozenset of universes}
+        self._node_universes = {}  # ip -> frozenset, union over bind indexes
+        self._subscribers = {}  # universe -> [ip], in subscription order
+        self.version = 0
+
+    def __len__(self):
+        return len(self._binds)
+
+    def __contains__(self, ip):
+        return ip in self._binds
+
+    def __repr__(self):
+        return f"RoutingTable({len(self._binds)} node(s), {len(self._subscribers)} universe(s))"
+
+    def update(self, ip, universes, bind_index=None):
+        """Set the universes ip outputs through bind_index, or through the whole node (replacing every bind
+        index) when bind_index is None. Returns 'new', 'changed' or 'unchanged'."""
+        binds = self._binds.get(ip)
+        status = 'new' if binds is None else 'unchanged'
+        if bind_index is None or binds is None:
+            binds = {}
+        else:
+            binds = dict(binds)
+            binds.pop(None, None)
+        binds[bind_index] = frozenset(universes)
+        old = self._node_universes.get(ip, frozenset())
+        new = frozenset().union(*binds.values())
+        self._binds[ip] = binds
+        self._node_universes[ip] = new
+        if new != old:
+            self._resubscribe(ip, old, new)
+            if status == 'unchanged':
+                status = 'changed'
+        return status
+
+    def update_reply(self, raw):
+        """Feed one raw ArtPollReply. Returns update()'s status, or None if raw isn't a full reply."""
+        fields = routing_fields(raw)
+        if fields is None:
+            return None
+        ip_addr, bind_index, universes = fields
+        return self.update(str(IPv4Address(ip_addr)), universes, bind_index)
+
+    def update_nodes(self, nodes, prune=False):
+        """Feed scan results or node cache entries (dicts with 'ip' and 'universes'). With prune, nodes is
+        taken to be everything there is (a full scan's responders) and any other node is removed.
+        Returns {'new', 'changed', 'unchanged', 'removed'} counts."""
+        counts = {'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+        seen = set()
+        for node in nodes:
+            seen.add(node['ip'])
+            counts[self.update(node['ip'], node.get('universes', ()))] += 1
+        if prune:
+            for ip in [ip for ip in self._binds if ip not in seen]:
+                self.remove(ip)
+                counts['removed'] += 1
+        return counts
+
+    def remove(self, ip):
+        """Forget ip (e.g. a node that stopped answering). Returns True if it was in the table."""
+        if ip not in self._binds:
+            return False
+        del self._binds[ip]
+        self._resubscribe(ip, self._node_universes.pop(ip), frozenset())
+        return True
+
+    def _resubscribe(self, ip, old, new):
+        for universe in new - old:
+            self._subscribers.setdefault(universe, []).append(ip)
+        for universe in old - new:
+            subscribers = self._subscribers[universe]
+            subscribers.remove(ip)
+            if not subscribers:
+                del self._subscribers[universe]
+        self.version += 1
+
+    def subscribers(self, universe):
+        """IPs of the nodes outputting universe (don't modify the list)."""
+        return self._subscribers.get(universe, ())
+
+    def universes(self, ip=None):
+        """Sorted universes ip outputs, or every universe with a subscriber when ip is None."""
+        if ip is None:
+            return sorted(self._subscribers)
+        return sorted(self._node_universes.get(ip, ()))
+
+    def routes(self, universes, target_ips):
+        """{universe: [subscribed IPs among target_ips]} for each of universes; universes nobody among
+        target_ips outputs map to an empty list."""
+        targets = list(target_ips)
+        out = {}
+        for universe in universes:
+            subscribed = set(self.subscribers(universe))
+            out[universe] = [ip for ip in targets if ip in subscribed]
+        return out
+
+
+def choose_destinations(target_ips, broadcast_ip, broadcast_threshold):
+    """Where one universe goes: a single packet to broadcast_ip instead of unicasts when at least
+    broadcast_threshold of target_ips (its subscribers) are on the bound subnet, else target_ips.
+    Targets outside the subnet never see the broadcast, so they keep their unicasts."""
+    local = [ip for ip in target_ips if helpers.ip_in_bound_subnet(ip)]
+    if not local or len(local) < broadcast_threshold:
+        return list(target_ips)
+    return [broadcast_ip] + [ip for ip in target_ips if ip not in local]
+
+
+def plan_routes(universes,
+                target_ips,
+                routes=None,
+                broadcast_ip=None,
+                broadcast_threshold=None):
+    """{universe: [destination IPs]}: target_ips, cut down to each universe's subscribers when routes (a
+    RoutingTable) is given, and swapped for a broadcast where broadcast_ip is given and enough of them
+    share the subnet (see choose_destinations)."""
+    if routes is not None:
+        plans = routes.routes(universes, target_ips)
+    else:
+        plans = {universe: list(target_ips) for universe in universes}
+    if broadcast_ip is not None:
+        for universe, ips in plans.items():
+            plans[universe] = choose_destinations(ips, broadcast_ip,
+                                                  broadcast_threshold)
+    return plans
+
+
+def route_summary(routes, target_ips, broadcast_ip=None):
+    """Packets per frame for routes ({universe: [IPs]}) against sending every universe to every target."""
+    routed = sum(len(ips) for ips in routes.values())
+    unsubscribed = sum(1 for ips in routes.values() if not ips)
+    broadcast = sum(1 for ips in routes.values() if broadcast_ip in ips)
+    cross_product = len(routes) * len(target_ips)
+    return {
+        'universes': len(routes),
+        'universes_without_subscribers': unsubscribed,
+        'broadcast_universes': broadcast,
+        'unicast_universes': len(routes) - unsubscribed - broadcast,
+        'packets_per_frame': routed,
+        'cross_product_per_frame': cross_product,
+    }
+
+
+def dmx_messages(packets,
+                 target_ips,
+                 routes=None,
+                 broadcast_ip=None,
+                 broadcast_threshold=None):
+    """(packet bytes, IP) pairs for a BatchSender: every packet to every one of target_ips, or narrowed and
+    broadcast as plan_routes() decides."""
+    if routes is None and broadcast_ip is None:
+        return [(packet.pack(), ip) for packet in packets for ip in target_ips]
+    universes = [packet.universe for packet in packets]
+    plans = plan_routes(universes, target_ips, routes, broadcast_ip,
+                        broadcast_threshold)
+    return [(packet.pack(), ip) for packet in packets
+            for ip in plans[packet.universe]]
+
+
+def print_routes(routes, target_ips, verbose=True, broadcast_ip=None):
+    if verbose:
+        for universe, ips in routes.items():
+            subscribers = ", ".join(ips) or "(no subscribers)"
+            print(f"  universe {universe:<5} -> {subscribers}")
+    summary = route_summary(routes, target_ips, broadcast_ip)
+    if broadcast_ip is not None:
+        print(
+            f"{summary['broadcast_universes']} universe(s) broadcast to {broadcast_ip}, "
+            f"{summary['unicast_universes']} unicast")
+    print(
+        f"{summary['packets_per_frame']} packet(s) per frame routed, "
+        f"{summary['cross_product_per_frame']} sending every universe to every device; "
+        f"{summary['universes_without_subscribers']} universe(s) without a subscriber"
+    )